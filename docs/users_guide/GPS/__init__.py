@@ -6996,6 +6996,9 @@ class MemoryUsageProviderVisitor(object):
             file based split of ressources consumed: obj_file and lib_file
             repectively correspond to the full paths of the object file and, if
             any, of the library file for which this artifact was compiled.
+            Each tuple can have an optional seventh element: a list of
+            (name, origin, size) tuples describing the symbols defined by
+            the module.
         """
         pass  # implemented in Ada
 
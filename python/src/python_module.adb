@@ -358,7 +358,29 @@ package body Python_Module is
      (Kernel : access GPS.Kernel.Kernel_Handle_Record'Class)
    is
       Env_Path : constant File_Array := Get_Custom_Path;
+      Script   : constant Scripting_Language :=
+        Kernel.Scripts.Lookup_Scripting_Language (Python_Name);
+      Errors   : Boolean;
    begin
+      --  Load the plugin that measures the import time of the other
+      --  plugins, and defers the import of some of them. This must be done
+      --  before any other plugin is loaded.
+
+      if Script /= null then
+         Script.Execute_Command
+           (CL          => Create
+              ("import GPS, os, sys;"
+               & " sys.path.insert(0, os.path.join(GPS.get_system_dir(),"
+               & " 'share', 'gps', 'support', 'core'));"
+               & " import plugins_manifest"),
+            Hide_Output => True,
+            Errors      => Errors);
+
+         if Errors then
+            Trace (Me, "Could not load plugins_manifest.py");
+         end if;
+      end if;
+
       Load_Dir (Kernel, Support_Core_Dir (Kernel), Default_Autoload => True,
                 Ignore_User_Config => True);
       Load_Dir (Kernel, Support_UI_Dir (Kernel), Default_Autoload => True,
@@ -382,19 +404,13 @@ package body Python_Module is
          end if;
       end loop;
 
-      declare
-         Errors : Boolean;
-         Script : constant Scripting_Language :=
-           Kernel.Scripts.Lookup_Scripting_Language (Python_Name);
-      begin
-         --  Now we are ready to import libadalang
-         Script.Execute_Command
-           (CL           => Create ("import libadalang"),
-            Hide_Output  => True,
-            Errors       => Errors);
+      --  Now we are ready to import libadalang
+      Script.Execute_Command
+        (CL           => Create ("import libadalang"),
+         Hide_Output  => True,
+         Errors       => Errors);
 
-         pragma Assert (not Errors);
-      end;
+      pragma Assert (not Errors);
    end Load_System_Python_Startup_Files;
 
    ------------------------------------
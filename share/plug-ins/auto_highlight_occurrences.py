@@ -31,8 +31,11 @@ like "TODO", or special comments for instance.
 import GPS
 # from gps_utils import *
 from gps_utils import hook
-from gps_utils.highlighter import Location_Highlighter, OverlayStyle
+from gps_utils.highlighter import (
+    Location_Highlighter, OverlayStyle, references_cache)
 import re
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 
 GPS.Preference(
     "Plugins/auto_highlight_occurrences/highlight_entities").create(
@@ -55,6 +58,121 @@ GPS.Preference(
 MSG_PREFIX = 'dynamic occurrences '
 # Messages created by this plugin have a category that starts with this
 
+WORD_RE = re.compile(r"[^\W\d_]\w*", re.U)
+# The identifiers highlighted when there is no entity: they start with a
+# letter, followed by letters, digits or underscores.
+
+
+class Word_Index(object):
+
+    """
+    An index of the identifiers of a buffer, mapping each of them to the
+    offsets of its occurrences. The buffer is split in blocks of lines that
+    are indexed separately, and kept up to date by monitoring the changes
+    of the underlying Gtk.TextBuffer, so that only the modified blocks need
+    to be indexed again after an edit.
+    """
+
+    block_lines = 256
+    # The number of lines in a block
+
+    def __init__(self, buffer):
+        from pygps import get_gtk_buffer
+
+        self.gtk_buffer = get_gtk_buffer(buffer)
+        self.version = 0  # incremented every time the buffer is modified
+
+        # The blocks, as [number of lines, number of characters, dict of
+        # word to offsets in the block, or None if it needs to be indexed]
+        self.blocks = [[self.gtk_buffer.get_line_count(), 0, None]]
+
+        self.__handlers = [
+            self.gtk_buffer.connect("insert-text", self.__on_insert_text),
+            self.gtk_buffer.connect("delete-range", self.__on_delete_range)]
+
+    def destroy(self):
+        """
+        Stop monitoring the buffer.
+        """
+        for h in self.__handlers:
+            self.gtk_buffer.disconnect(h)
+        self.__handlers = []
+
+    def __find_block(self, line):
+        """
+        Return the index of the block containing line, and its first line.
+        :rtype: (int, int)
+        """
+        first = 0
+        for index, block in enumerate(self.blocks):
+            if line < first + block[0] or index == len(self.blocks) - 1:
+                return index, first
+            first += block[0]
+
+    def __on_insert_text(self, buf, loc, text, length):
+        self.version += 1
+        index, _ = self.__find_block(loc.get_line())
+        self.blocks[index][0] += text.count("\n")
+        self.blocks[index][2] = None
+
+    def __on_delete_range(self, buf, start, end):
+        self.version += 1
+        first_index, _ = self.__find_block(start.get_line())
+        last_index, _ = self.__find_block(end.get_line())
+
+        # Merge all the modified blocks in a single one
+        nb_lines = sum(b[0] for b in self.blocks[first_index:last_index + 1])
+        self.blocks[first_index:last_index + 1] = [
+            [nb_lines - (end.get_line() - start.get_line()), 0, None]]
+
+    def __index_block(self, index, first_line):
+        """
+        Index the words of a block, splitting it if it has become too large.
+        """
+        nb_lines = self.blocks[index][0]
+        blocks = []
+
+        for line in range(first_line, first_line + max(1, nb_lines),
+                          self.block_lines):
+            count = min(self.block_lines, first_line + nb_lines - line)
+            text = self.gtk_buffer.get_text(
+                self.gtk_buffer.get_iter_at_line(line),
+                self.gtk_buffer.get_iter_at_line(line + count)
+                if line + count < self.gtk_buffer.get_line_count()
+                else self.gtk_buffer.get_end_iter(),
+                True).decode("utf-8")
+
+            words = {}
+            for m in WORD_RE.finditer(text):
+                words.setdefault(m.group(), []).append(m.start())
+            blocks.append([count, len(text), words])
+
+        self.blocks[index:index + 1] = blocks
+
+    def occurrences(self, word):
+        """
+        Return the sorted offsets of all the occurrences of word.
+
+        :param unicode word: the identifier to look for.
+        :rtype: list[int]
+        """
+        result = []
+        offset = 0
+        line = 0
+        index = 0
+
+        while index < len(self.blocks):
+            if self.blocks[index][2] is None:
+                self.__index_block(index, line)
+
+            nb_lines, nb_chars, words = self.blocks[index]
+            result.extend(offset + o for o in words.get(word, ()))
+            offset += nb_chars
+            line += nb_lines
+            index += 1
+
+        return result
+
 
 class Current_Entity_Highlighter(Location_Highlighter):
 
@@ -89,6 +207,13 @@ class Current_Entity_Highlighter(Location_Highlighter):
 
         self.current_buffer = None
 
+        self.word_indexes = {}
+        # The Word_Index of each buffer, indexed by file path
+
+        self.word_offsets = OrderedDict()
+        # The offsets of the last words that were highlighted, as
+        # (index version, offsets), indexed by (file path, word)
+
         # Words that should not be highlighted.
         # ??? This should be based on the language
 
@@ -96,11 +221,50 @@ class Current_Entity_Highlighter(Location_Highlighter):
         GPS.Hook("location_changed").add_debounce(self.highlight)
         GPS.Hook("file_closed").add(self.__on_file_closed)
 
+    # Number of words whose offsets are kept in word_offsets
+    cached_words = 8
+
     def __on_file_closed(self, hook, file):
         if self.current_buffer:
             if self.current_buffer.file() == file:
                 self.current_buffer = None
 
+        index = self.word_indexes.pop(file.path, None)
+        if index:
+            index.destroy()
+
+    def get_word_offsets(self, buffer, word):
+        """
+        Return the sorted offsets of the occurrences of word in buffer.
+
+        :param GPS.EditorBuffer buffer: the buffer to search.
+        :param unicode word: the identifier to look for.
+        :rtype: list[int]
+        """
+        path = buffer.file().path
+        index = self.word_indexes.get(path)
+
+        if index is None:
+            try:
+                index = Word_Index(buffer)
+            except Exception:
+                # No access to the Gtk buffer: search the whole text
+                text = buffer.get_chars().decode("utf8")
+                return [m.start() for m in WORD_RE.finditer(text)
+                        if m.group() == word]
+            self.word_indexes[path] = index
+
+        key = (path, word)
+        cached = self.word_offsets.pop(key, None)
+        if cached is None or cached[0] != index.version:
+            cached = (index.version, index.occurrences(word))
+
+        self.word_offsets[key] = cached
+        while len(self.word_offsets) > self.cached_words:
+            self.word_offsets.popitem(last=False)
+
+        return cached[1]
+
     def _on_preferences_changed(self, hook_name):
         """
         Called whenever one of the preferences has changed.
@@ -132,16 +296,18 @@ class Current_Entity_Highlighter(Location_Highlighter):
 
     def recompute_refs(self, buffer):
         if self.entity:
-            # Compute all refs to the entity immediately, so that we do not
-            # have to do any xref query later on when doing the highlighting
-            # This query is fast since it only involves a single source file.
+            # The references are queried in the background the first time,
+            # and the buffer is highlighted again once they are available.
+
+            entity = self.entity
 
-            n = self.entity.name()
+            def on_ready(refs):
+                if self.entity == entity and buffer == self.current_buffer:
+                    self.stop_highlight(buffer=buffer)
+                    self.start_highlight(buffer)
 
-            return [(n, r) for r in self.entity.references(
-                include_implicit=False,
-                synchronous=True,
-                in_file=buffer.file())]
+            return references_cache.get(
+                entity, buffer.file(), on_ready=on_ready) or []
 
         else:
             return []   # irrelevant
@@ -153,50 +319,14 @@ class Current_Entity_Highlighter(Location_Highlighter):
             Location_Highlighter.process(self, start, end)
         else:
             buffer = start.buffer()
-            while start < end:
-
-                # Get the string on the line
-                end_loc = start.end_of_line()
-                s = buffer.get_chars(start, end_loc)  # byte-sequence
-                s = s.decode("utf8")  # make unicode-string
-                s_len = len(s)
-
-                # Find the tokens on the current line
-                index = 0
-                visible_column = 0
-
-                while index < s_len:
-                    if s[index].isalpha():
-                        end_index = index + 1
-
-                        while end_index < s_len and (
-                                s[end_index].isalnum() or s[end_index] == '_'):
-                            end_index += 1
-                        if s[index:end_index] == self.word:
-                            self.style.apply(
-                                start=GPS.EditorLocation(
-                                    buffer,
-                                    start.line(),
-                                    start.column() + visible_column),
-                                end=GPS.EditorLocation(
-                                    buffer,
-                                    start.line(),
-                                    start.column() +
-                                    visible_column + len(self.word) - 1))
-
-                        visible_column += end_index - index
-                        index = end_index
-
-                    else:
-                        visible_column += 1
-
-                        if s[index] == '\t':
-                            visible_column = (visible_column +
-                                              8 - (visible_column % 8))
-
-                        index += 1
-
-                start = end_loc + 1
+            offsets = self.get_word_offsets(buffer, self.word)
+            first = bisect_left(offsets, start.offset())
+            last = bisect_right(offsets, end.offset())
+
+            length = len(self.word)
+            self.style.apply_offsets(
+                start, end,
+                [(offset, offset + length) for offset in offsets[first:last]])
 
     def highlight(self, *args, **kwargs):
         """
@@ -1,9 +1,10 @@
 import GPS
+import bisect
 import os.path
 import re
 from . import core
 from os_utils import locate_exec_on_path
-from workflows import run_as_workflow
+from workflows.promises import run_in_worker
 
 MAP_FILE_BASE_NAME = "map.txt"
 
@@ -14,6 +15,276 @@ GPS.current_context())" />
 """
 
 
+class _Region_Index(object):
+    """
+    Finds the memory region that contains an address, by bisecting the
+    regions sorted by origin.
+    """
+
+    def __init__(self, regions):
+        """
+        :param list regions: the (name, origin, length) of the regions, as
+           returned by `_parse_map_file`.
+        """
+        self.regions = regions
+        self.__sorted = sorted(
+            (int(origin, 16), length, name)
+            for name, origin, length in regions)
+        self.__starts = [r[0] for r in self.__sorted]
+
+    def region_name(self, addr):
+        """
+        Return the name of the region associated with the given address or
+        an empty string if not found.
+        """
+        index = bisect.bisect_right(self.__starts, addr) - 1
+        if index >= 0:
+            origin, length, name = self.__sorted[index]
+            if addr < origin + length:
+                return name
+
+        # Not found by bisecting, which can happen when regions overlap
+        for name, origin, length in self.regions:
+            origin = int(origin, 16)
+            if origin <= addr < origin + length:
+                return name
+
+        return ""
+
+
+def _parse_map_file(map_file_name, map_dir):
+    """
+    Parse the memory map file generated by ld. This does not use the GPS
+    module, so that it can run in a worker thread. The file is read one
+    line at a time.
+
+    :param str map_file_name: the map file.
+    :param str map_dir: the directory of the map file, used for the object
+       files that have no directory.
+    :return: a tuple (regions, sections, modules), as expected by
+       `on_memory_usage_data_fetched`. Each module ends with the list of
+       the (name, origin, size) of its symbols.
+    """
+    regions = []
+    sections = []
+    modules_dict = {}
+    modules = []
+    region_index = _Region_Index(regions)
+
+    # The regexps used to match the information we want to fetch
+    region_r = re.compile('^(?P<name>\w+)\s+(?P<origin>0x[0-9a-f]+)' +
+                          '\s+(?P<length>0x[0-9a-f]+)\s+x?r?w?')
+    section_r = re.compile('^(?P<name>[\w.]+)\s+(?P<origin>0x[0-9a-f]+)' +
+                           '\s+(?P<length>0x[0-9a-f]+)')
+    # Same as '^\s+[\w.]*\s+...', without the backtracking on the leading
+    # spaces of the many symbol lines
+    module_r = re.compile('^\s(?:\s*[\w.]+\s|\s)\s*(?P<origin>0x[0-9a-f]+)' +
+                          '\s+(?P<size>0x[0-9a-f]+) (?P<files>.+\.o\)?)')
+    symbol_r = re.compile('^\s+(?P<origin>0x[0-9a-f]+)\s+' +
+                          '(?P<name>[^\s=]+)$')
+
+    # The regions are listed before this line, the sections after
+    memory_map_header = "Linker script and memory map"
+
+    not_alloc_sections_prefixes = ('.debug', '.comment')
+
+    def is_section_allocated(section):
+        """
+        Return True if the given section tuple is going to be allocated in
+        memory, False otherwise.
+
+        An allocated section is a memory section that will actually be
+        loaded by the target. Sections related with debug information,
+        code comments or that have null size are typically not allocated
+        and should be ignored.
+        """
+        return (section[2] != 0 and
+                not section[0].startswith(not_alloc_sections_prefixes))
+
+    # The input section whose symbols are being read, as [module, end
+    # address, name of the last symbol, its address, its origin as written
+    # in the map file]
+    current = [None, 0, None, 0, ""]
+
+    def flush_symbol(end):
+        """
+        Add the last symbol found to its module, now that its end is known.
+        """
+        module, _, name, addr, origin = current
+        if name is not None:
+            module[6].append((name, origin, end - addr))
+            current[2] = None
+
+    def end_input_section():
+        if current[0] is not None:
+            flush_symbol(current[1])
+            current[0] = None
+
+    def match_module(line):
+        """
+        Try to match a module description in the given line.
+
+        A module description gives information about the size taken by
+        an object file in a given section.
+        """
+        m = module_r.match(line)
+        if not m:
+            return False
+
+        end_input_section()
+
+        # Don't try to match a module if sections have not been parsed yet
+        if not sections:
+            return True
+
+        files_info = m.group('files')
+        files = re.split("\(|\)", files_info)
+
+        # Get the object file name and, if any, information about
+        # the library for which this file has been compiled.
+
+        obj_file = files[0] if len(files) == 1 else files[1]
+        lib_file = files[0] if len(files) > 1 else ""
+        module_size = int(m.group('size'), 16)
+        section = sections[-1]
+
+        # Do nothing if the module belongs to a section that will not
+        # be allocated or if it's size is null.
+
+        if module_size == 0 or not is_section_allocated(section):
+            return True
+
+        section_name = section[0]
+        module = modules_dict.get((files_info, section_name), None)
+
+        # If the object file name does not contain any directory
+        # information assume that this file is located in the same
+        # directory as the map file.
+
+        if not os.path.dirname(obj_file) and not lib_file:
+            obj_file = os.path.join(map_dir, obj_file)
+
+        # If a previous module decription has been found for the same
+        # key, just add the size of this one to the previously found
+        # one.
+
+        if module:
+            module[3] += module_size
+        else:
+            region_name = section[3]
+            module = [obj_file, lib_file, m.group('origin'), module_size,
+                      region_name, section_name, []]
+            modules_dict[(files_info, section_name)] = module
+
+        # The symbols that follow are part of this input section
+        origin = int(m.group('origin'), 16)
+        current[0] = module
+        current[1] = origin + module_size
+        return True
+
+    def match_symbol(line):
+        """
+        Try to match a symbol defined in the current input section. Its
+        size is the distance to the next symbol, or to the end of the
+        input section.
+        """
+        if current[0] is None:
+            return
+        m = symbol_r.match(line)
+        if m:
+            addr = int(m.group('origin'), 16)
+            flush_symbol(addr)
+            current[2] = m.group('name')
+            current[3] = addr
+            current[4] = m.group('origin')
+
+    # Parse the memory map file to retrieve the memory regions and
+    # the path of the linked executable.
+
+    in_memory_map = False
+    with open(map_file_name, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            if line[0] in ' \t':
+                # Modules and symbols are indented
+                if in_memory_map and not match_module(line):
+                    match_symbol(line)
+                continue
+
+            end_input_section()
+
+            if not in_memory_map:
+                if line.startswith(memory_map_header):
+                    in_memory_map = True
+                    region_index = _Region_Index(regions)
+                else:
+                    m = region_r.match(line)
+                    if m:
+                        regions.append((m.group('name'), m.group('origin'),
+                                        int(m.group('length'), 16)))
+                continue
+
+            m = section_r.match(line)
+            if m:
+                section_addr = m.group('origin')
+                sections.append(
+                    (m.group('name'), section_addr,
+                     int(m.group('length'), 16),
+                     region_index.region_name(int(section_addr, 16))))
+
+    end_input_section()
+
+    for module in modules_dict.itervalues():
+        modules.append(tuple(module))
+
+    # Keep only the sections that will be allocated in memory
+
+    sections = [s for s in sections if is_section_allocated(s)]
+
+    return regions, sections, modules
+
+
+def _file_key(filename):
+    """
+    Return the (mtime, size) of filename, or None if it doesn't exist.
+    """
+    try:
+        s = os.stat(filename)
+        return (s.st_mtime, s.st_size)
+    except OSError:
+        return None
+
+
+_map_files_cache = {}
+# map file name -> ((mtime, size), result of _parse_map_file)
+
+
+def _cached_map_file(map_file_name):
+    """
+    Return the result of `_parse_map_file` for map_file_name if it has not
+    been modified since it was parsed, None otherwise.
+    """
+    cached = _map_files_cache.get(map_file_name)
+    if cached is not None and cached[0] == _file_key(map_file_name):
+        return cached[1]
+    return None
+
+
+def _read_map_file(map_file_name, map_dir):
+    """
+    Same as `_parse_map_file`, but the result is cached until the map file
+    is modified.
+    """
+    result = _cached_map_file(map_file_name)
+    if result is None:
+        key = _file_key(map_file_name)
+        result = _parse_map_file(map_file_name, map_dir)
+        _map_files_cache[map_file_name] = (key, result)
+    return result
+
+
 @core.register_memory_usage_provider("LD")
 class LD(core.MemoryUsageProvider):
 
@@ -55,7 +326,6 @@ class LD(core.MemoryUsageProvider):
     def is_enabled(self):
         return LD.map_file_is_supported(None)
 
-    @run_as_workflow
     def async_fetch_memory_usage_data(self, visitor):
         # Retrieve the memory map file generated by ld
         project = GPS.Project.root()
@@ -72,170 +342,19 @@ class LD(core.MemoryUsageProvider):
             visitor.on_memory_usage_data_fetched([], [], [])
             return
 
-        # The information we want to fetch: memory regions and memory sections
-        # ??? Find a way to have a finer grain view (symbols? compilation
-        # units?)
-        regions = []
-        sections = []
-        modules_dict = {}
-        modules = []
-
-        # The regexps used to match the information we want to fetch
-        region_r = re.compile('^(?P<name>\w+)\s+(?P<origin>0x[0-9a-f]+)' +
-                              '\s+(?P<length>0x[0-9a-f]+)\s+x?r?w?')
-        section_r = re.compile('^(?P<name>[\w.]+)\s+(?P<origin>0x[0-9a-f]+)' +
-                               '\s+(?P<length>0x[0-9a-f]+)')
-        module_r = re.compile('^\s+[\w.]*\s+(?P<origin>0x[0-9a-f]+)\s+' +
-                              '(?P<size>0x[0-9a-f]+) (?P<files>.+\.o\)?)')
-
-        def region_name_from_address(addr):
-            """
-            Return the name of the region associated with the given address or
-            an empty string if not found.
-            """
-
-            for region in regions:
-                region_addr = int(region[1], 16)
-                region_size = region[2]
-
-                if addr >= region_addr and addr < (region_addr + region_size):
-                    return region[0]
-
-            return ""
-
-        def is_section_allocated(section):
-            """
-            Return True if the given section tuple is going to be allocated in
-            memory, False otherwise.
-
-            An allocated section is a memory section that will actually be
-            loaded by the target. Sections related with debug information,
-            code comments or that have null size are typically not allocated
-            and should be ignored.
-            """
-
-            not_alloc_sections_prefixes = ['.debug', '.comment']
-
-            for prefix in not_alloc_sections_prefixes:
-                if section[0].startswith(prefix):
-                    return False
-
-            if section[2] == 0:
-                return False
-
-            return True
-
-        def try_match_region(line):
-            """
-            Try to match a region description in the given line.
-
-            Return a tuple (name, origin, length) if a region was matched
-            and None otherwise.
-            """
-
-            m = region_r.search(line)
-            if m:
-                return (m.group('name'), m.group('origin'),
-                        int(m.group('length'), 16))
-            else:
-                return None
-
-        def try_match_section(line):
-            """
-            Try to match an allocated section description in the given live.
-
-            Return a tuple (name, origin, length, region_name) if a section was
-            matched and None otherwise.
-            """
-
-            m = section_r.search(line)
-
-            if m:
-                section_addr = m.group('origin')
-                region_name = region_name_from_address(int(section_addr, 16))
-                section = (m.group('name'), section_addr,
-                           int(m.group('length'), 16), region_name)
-
-                return section
-            else:
-                return None
-
-        def try_match_module(line):
-            """
-            Try to match a module description in the given line.
-
-            A module description gives information about the size taken by
-            an object file in a given section.
-            """
-
-            # Don't try to match a module if sections have not been parsed yet
-            if not sections:
-                return
-
-            m = module_r.search(line)
-            if m:
-                files_info = m.group('files')
-                files = re.split("\(|\)", files_info)
-
-                # Get the object file name and, if any, information about
-                # the library for which this file has been compiled.
-
-                obj_file = files[0] if len(files) == 1 else files[1]
-                lib_file = files[0] if len(files) > 1 else ""
-                module_size = int(m.group('size'), 16)
-                section = sections[-1]
-
-                # Do nothing if the module belongs to a section that will not
-                # be allocated or if it's size is null.
-
-                if module_size == 0 or not is_section_allocated(section):
-                    return
+        def on_parsed(result):
+            regions, sections, modules = result
+            visitor.on_memory_usage_data_fetched(regions, sections, modules)
 
-                section_name = section[0]
-                module = modules_dict.get((files_info, section_name), None)
-
-                # If the object file name does not contain any directory
-                # information assume that this file is located in the same
-                # directory as the map file.
-
-                if not os.path.dirname(obj_file) and not lib_file:
-                    obj_file = os.path.join(map_dir, obj_file)
-
-                # If a previous module decription has been found for the same
-                # key, just add the size of this one to the previously found
-                # one.
-
-                if module:
-                    module[3] += int(m.group('size'), 16)
-                else:
-                    region_name = section[3]
-                    module = [obj_file, lib_file, m.group('origin'),
-                              int(m.group('size'), 16),
-                              region_name, section_name]
-                    modules_dict[(files_info, section_name)] = module
-
-        # Parse the memory map file to retrieve the memory regions and
-        # the path of the linked executable.
-
-        with open(map_file_name, 'r') as f:
-            for line in f:
-                region = try_match_region(line)
-                if not region:
-                    section = try_match_section(line)
-                    if section:
-                        sections.append(section)
-                    else:
-                        try_match_module(line)
-                else:
-                    regions.append(region)
-
-        for module in modules_dict.itervalues():
-            modules.append(tuple(module))
-
-        # Keep only the sections that will be allocated in memory
-
-        sections = [s for s in sections if is_section_allocated(s)]
+        def on_failed(reason):
+            visitor.on_memory_usage_data_fetched([], [], [])
 
-        visitor.on_memory_usage_data_fetched(regions, sections, modules)
+        result = _cached_map_file(map_file_name)
+        if result is not None:
+            on_parsed(result)
+        else:
+            # Large map files take a while to parse
+            run_in_worker(_read_map_file, map_file_name, map_dir).then(
+                on_parsed, on_failed)
 
 GPS.parse_xml(xml)
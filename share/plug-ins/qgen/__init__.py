@@ -680,9 +680,8 @@ class QGEN_Diagram_Viewer(GPS.Browsers.View):
         v, newly_created = QGEN_Diagram_Viewer.get_or_create_view(file)
 
         if newly_created:
-            def __on_json(jsonfile):
-                v.diags = GPS.Browsers.Diagram.load_json(
-                    jsonfile, diagramFactory=QGEN_Diagram)
+            def __on_diags(diags):
+                v.diags = diags
                 if v.diags:
                     root_diag = v.diags.get()
                     v.set_diagram(root_diag)
@@ -690,6 +689,10 @@ class QGEN_Diagram_Viewer(GPS.Browsers.View):
                 if on_loaded:
                     on_loaded(v)
 
+            def __on_json(jsonfile):
+                GPS.Browsers.Diagram.load_json_in_worker(
+                    jsonfile, diagramFactory=QGEN_Diagram).then(__on_diags)
+
             def __on_fail(reason):
                 pass
 
@@ -982,7 +985,13 @@ else:
                 # and if there's cmd to run, send it
                 if self._symbol is not None:
 
-                    if self._symbol is not "":
+                    if isinstance(self._symbol, list):
+                        self._output = self._values_of(self._symbol)
+                        self._symbol = None
+                        self._remove_timers()
+                        self._this_promise.resolve(self._output)
+
+                    elif self._symbol is not "":
                         self._output = self._debugger.value_of(self._symbol)
                         self._symbol = None
                         self._remove_timers()
@@ -1046,6 +1055,44 @@ else:
                     self._deadline = GPS.Timeout(timeout, self._on_cmd_timeout)
             return self._this_promise
 
+        def async_print_values(self, symbols, timeout=0):
+            """
+            Same as async_print_value, but evaluates several symbols with a
+            single debugger command.
+            Promise returned here will be answered with: a dict
+            symbol => value, or None if the deadline was reached.
+
+            :param list[str] symbols: the symbols to evaluate.
+            """
+            return self.async_print_value(list(symbols), timeout=timeout)
+
+        def _values_of(self, symbols):
+            """
+            Evaluate symbols with the qgen_print_values command defined in
+            gdb_scripts.py. The symbols missing from its output (for
+            instance if the script is not loaded) are evaluated one by one.
+
+            :param list[str] symbols: the symbols to evaluate.
+            :return: a dict symbol => value, where value is "" when the
+               symbol could not be evaluated in the current context.
+            """
+            output = self._debugger.send(
+                "qgen_print_values %s" % " ".join(
+                    '"%s"' % s for s in symbols),
+                output=False)
+
+            values = {}
+            expected = set(symbols)
+            for line in output.splitlines():
+                symbol, sep, value = line.partition(" = ")
+                if sep and symbol in expected:
+                    values[symbol] = value.strip()
+
+            for s in symbols:
+                if s not in values:
+                    values[s] = self._debugger.value_of(s)
+            return values
+
     class QGEN_Module(modules.Module):
 
         display_tasks = []
@@ -1054,6 +1101,13 @@ else:
         # id => Signal object
         signal_attributes = {}
 
+        # symbol => value, for the symbols evaluated since the debugger
+        # last stopped. Replaced by a new dict when the process moves.
+        signal_values = {}
+
+        values_batch_size = 64
+        # The number of symbols evaluated by each debugger command
+
         previous_breakpoints = []
         debugger = None
 
@@ -1078,7 +1132,7 @@ else:
             QGEN_Module.modeling_map = mapping.Mapping_File()
             for f in GPS.Project.root().sources(recursive=True):
                 if CLI.is_model_file(f):
-                    QGEN_Module.modeling_map.load(f)
+                    QGEN_Module.modeling_map.load_in_worker(f)
 
         @staticmethod
         def __clear(debugger):
@@ -1087,6 +1141,7 @@ else:
             """
             # Starting the debugger kills running workflows
             QGEN_Module.cancel_workflows()
+            QGEN_Module.clear_signal_values()
             for id, sig in QGEN_Module.signal_attributes.iteritems():
                 sig.reset()
 
@@ -1099,20 +1154,55 @@ else:
             QGEN_Module.signal_attributes.clear()
             del QGEN_Module.previous_breakpoints[:]
 
+        @staticmethod
+        def clear_signal_values():
+            """
+            Forget the values of the symbols, they need to be evaluated
+            again by the debugger.
+            """
+            QGEN_Module.signal_values = {}
+
         @staticmethod
         def compute_all_item_values(task, debugger, diagram, viewer):
             # Compute the value for all items with an "auto" property
             auto_items_list = list(Diagram_Utils.forall_auto_items(
                 [diagram]))
-            auto_items_len = len(auto_items_list)
-            idx = 0
-            for diag, toplevel, it in \
-                    Diagram_Utils.forall_auto_items([diagram]):
-                yield QGEN_Module.compute_item_values(
-                    debugger, diag, toplevel=toplevel, item=it)
-                diagram.changed()
-                idx = idx + 1
-                task.set_progress(idx, auto_items_len)
+            values = None
+
+            if debugger is not None:
+                # Only evaluate the symbols whose value is not known since
+                # the debugger last stopped, a batch at a time
+                cache = QGEN_Module.signal_values
+                values = {}
+                symbols = []
+                for diag, toplevel, it in auto_items_list:
+                    ss = QGEN_Module.get_var_from_item(
+                        it.get_parent_with_id() or toplevel)
+                    if ss is None or ss in values:
+                        continue
+                    if ss in cache:
+                        values[ss] = cache[ss]
+                    else:
+                        values[ss] = None
+                        symbols.append(ss)
+
+                size = QGEN_Module.values_batch_size
+                for idx in range(0, len(symbols), size):
+                    batch = symbols[idx:idx + size]
+                    batch_values = yield AsyncDebugger(
+                        debugger).async_print_values(batch)
+                    if batch_values:
+                        values.update(batch_values)
+                        # Keep them for the next refresh, unless the
+                        # process moved in the meantime
+                        if cache is QGEN_Module.signal_values:
+                            cache.update(batch_values)
+                    task.set_progress(idx + len(batch), len(symbols))
+
+            for diag, toplevel, it in auto_items_list:
+                QGEN_Module.compute_item_values(
+                    values, toplevel=toplevel, item=it)
+            diagram.changed()
 
         @staticmethod
         def get_var_from_item(item):
@@ -1149,13 +1239,11 @@ else:
                 debugger.send("tree display %s\n" % ss, output=False)
 
         @staticmethod
-        @workflows.run_as_workflow
-        def compute_item_values(debugger, promise, toplevel, item):
+        def compute_item_values(values, toplevel, item):
             """
-            Recompute the value for all symbols related to item, and update
-            the display of item to show their values.
-            :param GPS.Debugger debugger: the debugger to query.
-               It can be None when no debugger is running.
+            Update the display of item to show the value of its symbol.
+            :param dict values: symbol => value, as evaluated by the
+               debugger. It can be None when no debugger is running.
             :param (GPS.Browsers.Item|GPS.Browsers.Link) toplevel: the
                toplevel item (generally a link)
             :param GPS.Browsers.Item item: the item that has an "auto"
@@ -1174,7 +1262,7 @@ else:
                 item_parent = p
                 p = item_parent.parent
 
-            if debugger is None:
+            if values is None:
                 item_parent.hide()
                 return
 
@@ -1203,9 +1291,7 @@ else:
 
             ss = QGEN_Module.get_var_from_item(parent)
             if ss is not None:
-                async_debugger = AsyncDebugger(debugger)
-                yield async_debugger.async_print_value(ss).then(
-                    update_item_value)
+                update_item_value(values.get(ss))
             else:
                 item_parent.hide()
 
@@ -1274,9 +1360,16 @@ else:
             Diagram_Utils.update_priority_style(viewer, [diag], bp_blocks)
             diag.changed()
 
+        @staticmethod
+        @gps_utils.hook('debugger_process_stopped')
+        def __on_debugger_process_stopped(debugger):
+            QGEN_Module.clear_signal_values()
+
         @staticmethod
         @gps_utils.hook('debugger_location_changed')
         def __on_debugger_location_changed(debugger):
+            # The current frame might have changed
+            QGEN_Module.clear_signal_values()
             QGEN_Module.__show_diagram_and_signal_values(debugger)
 
         @staticmethod
@@ -1663,6 +1756,7 @@ else:
                         debug.set_variable(ss, v[0])
 
             if added:
+                QGEN_Module.clear_signal_values()
                 QGEN_Module.__show_diagram_and_signal_values(debug, force=True)
 
         def __contextual_log_signal_value(self):
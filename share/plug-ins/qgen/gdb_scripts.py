@@ -241,6 +241,31 @@ class Qgen_Set_Logpoint(gdb.Command):
 Qgen_Set_Logpoint()
 
 
+class Qgen_Print_Values(gdb.Command):
+    """
+    Print the value of several symbols in a single command, one
+    "symbol = value" per line. The value is empty when the symbol cannot
+    be evaluated in the current frame.
+    """
+
+    def __init__(self):
+        super(Qgen_Print_Values, self).__init__(
+            "qgen_print_values", gdb.COMMAND_DATA
+        )
+
+    def invoke(self, args, from_tty):
+        for symbol in gdb.string_to_argv(args):
+            try:
+                # Unlike "print", "output" does not add to the value history
+                value = gdb.execute(
+                    "output %s" % symbol, to_string=True).strip()
+            except gdb.error:
+                value = ""
+            gdb.write("%s = %s\n" % (symbol, value.replace("\n", " ")))
+
+Qgen_Print_Values()
+
+
 class Watchpoint_Watchdog (gdb.Breakpoint):
 
     def __init__(self, spec, ty):
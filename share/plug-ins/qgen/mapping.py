@@ -1,8 +1,168 @@
 import GPS
+import bisect
+import heapq
 import json
 import os
 from project_support import Project_Support
 from diagram_utils import Diagram_Utils
+from workflows.promises import Promise, run_in_worker
+
+
+class _Line_Index(object):
+    """
+    Maps the lines of a source file to the block that generated them, by
+    bisecting sorted line ranges. This doesn't use the GPS module, so that
+    it can be created in a worker thread.
+    """
+
+    def __init__(self, ranges):
+        """
+        :param list ranges: a list of (start, end, blockid), which is
+           sorted in place. When the ranges of several blocks overlap, the
+           lines are associated with the block that has the smallest range.
+        """
+        ranges.sort()
+
+        # The usual case: the ranges do not overlap
+        if all(ranges[i][1] < ranges[i + 1][0]
+               for i in xrange(len(ranges) - 1)):
+            self.__starts = [r[0] for r in ranges]
+            self.__ends = [r[1] for r in ranges]
+            self.__blocks = [r[2] for r in ranges]
+            return
+
+        self.__starts = []
+        self.__ends = []
+        self.__blocks = []
+
+        # Split the ranges into non-overlapping ones: walk the boundaries
+        # of the ranges in order, keeping the ranges that contain the
+        # current line in a heap, smallest first.
+        bounds = sorted(set([r[0] for r in ranges] +
+                            [r[1] + 1 for r in ranges]))
+        active = []
+        next_range = 0
+
+        for index, line in enumerate(bounds[:-1]):
+            while next_range < len(ranges) and \
+                    ranges[next_range][0] == line:
+                start, end, blockid = ranges[next_range]
+                heapq.heappush(active, (end - start, blockid, end))
+                next_range += 1
+
+            while active and active[0][2] < line:
+                heapq.heappop(active)
+
+            if active:
+                blockid = active[0][1]
+                end = bounds[index + 1] - 1
+                if self.__blocks and self.__blocks[-1] == blockid \
+                        and self.__ends[-1] == line - 1:
+                    self.__ends[-1] = end
+                else:
+                    self.__starts.append(line)
+                    self.__ends.append(end)
+                    self.__blocks.append(blockid)
+
+    def get(self, line):
+        """
+        The block that generated the given line, or None
+        :param int line: the line
+        """
+        index = bisect.bisect_right(self.__starts, line) - 1
+        if index >= 0 and line <= self.__ends[index]:
+            return self.__blocks[index]
+        return None
+
+
+def _file_key(filename):
+    """
+    Return the (mtime, size) of filename, or None if it doesn't exist.
+    """
+    try:
+        s = os.stat(filename)
+        return (s.st_mtime, s.st_size)
+    except OSError:
+        return None
+
+
+_mapping_files_cache = {}
+# filename => ((mtime, size), result of _read_mapping_file)
+
+
+def _cached_mapping_file(filename):
+    """
+    Return the result of `_read_mapping_file` for filename if the file has
+    not been modified since it was read, None otherwise.
+    """
+    cached = _mapping_files_cache.get(filename)
+    if cached is not None and cached[0] == _file_key(filename):
+        return cached[1]
+    return None
+
+
+def _read_mapping_file(filename):
+    """
+    Read a mapping file generated by qgen. This doesn't use the GPS module,
+    so that it can run in a worker thread. The result is cached until the
+    file is modified.
+    :param str filename: the mapping file
+    :return: None if the file cannot be read (the normal case when no code
+       has been generated yet), or a dict
+          filename => (funcs, ranges, symbols, lines)
+       where `funcs` is a list of (funcname, ["start", "end"], (start, end)),
+       `ranges` and `symbols` map each block_id to its list of lineranges
+       and symbols, and `lines` is a `_Line_Index`.
+       Raises ValueError if the file is not valid JSON.
+    """
+    result = _cached_mapping_file(filename)
+    if result is not None:
+        return result
+
+    key = _file_key(filename)
+    try:
+        f = open(filename)
+    except IOError:
+        return None
+
+    with f:
+        js = json.load(f)
+
+    result = {}
+    for filename_in_map, blocks in js.iteritems():
+        funcs = []
+        ranges = {}
+        symbols = {}
+        lines = []   # (start, end, blockid)
+
+        for blockid, blockinfo in blocks.iteritems():
+            if blockid == '@qgen_functions':
+                for func_id, funcline in blockinfo.iteritems():
+                    funclines = funcline.split('-')
+                    funcs.append((func_id, funclines,
+                                  (int(funclines[0]), int(funclines[1]))))
+                continue
+
+            a = ranges.setdefault(blockid, [])
+            for linerange in blockinfo.get('lines', []):
+                if isinstance(linerange, int):
+                    rg = (linerange, linerange)
+                elif '-' in linerange:
+                    s = linerange.split('-')
+                    rg = (int(s[0]), int(s[1]))
+                else:
+                    rg = (int(linerange), int(linerange))
+
+                a.append(rg)
+                lines.append((rg[0], rg[1], blockid))
+
+            symbols.setdefault(blockid, []).extend(
+                blockinfo.get('symbols', []))
+
+        result[filename_in_map] = (funcs, ranges, symbols, _Line_Index(lines))
+
+    _mapping_files_cache[filename] = (key, result)
+    return result
 
 
 class Mapping_File(object):
@@ -24,7 +184,7 @@ class Mapping_File(object):
         #   - `filename`: a string
 
         self._blocks = {}    # block_id => set of (file,linerange)
-        self._files = {}     # filename => {line => blockid}
+        self._files = {}     # filename => [_Line_Index], most recent last
         self._mdl = {}       # sourcefile => mdlfile
         self._symbols = {}   # block_id => set(symbols)
         self._funcinfo = {}  # funcname => (filename, endline)
@@ -36,60 +196,75 @@ class Mapping_File(object):
         information already loaded.
         :param GPS.File mdlfile: the MDL file we start from
         """
-        filename = os.path.join(
-            Project_Support.get_output_dir(mdlfile),
-            '%s.json' % os.path.basename(mdlfile.path))
-
-        try:
-            f = open(filename)
-        except IOError:
-            # Do not print an error: this is the normal case when no code
-            # has been generated yet
-            return
-
+        filename = self.__mapping_file(mdlfile)
         try:
-            js = json.load(f)
+            data = _read_mapping_file(filename)
         except:
             GPS.Console().write('Invalid json in %s\n' % filename)
             return
 
-        for filename, blocks in js.iteritems():
+        if data:
+            self.__add(mdlfile, data)
+
+    def load_in_worker(self, mdlfile):
+        """
+        Same as `load`, but the mapping file is read through
+        `run_in_worker`, asynchronously.
+        :param GPS.File mdlfile: the MDL file we start from
+        :return: a promise resolved when the mapping file has been loaded
+        """
+        filename = self.__mapping_file(mdlfile)
+
+        def on_read(data):
+            if data:
+                self.__add(mdlfile, data)
+
+        def on_failed(reason):
+            if reason is not None:   # not cancelled
+                GPS.Console().write('Invalid json in %s\n' % filename)
+
+        # No need for a worker thread if the file has not changed
+        data = _cached_mapping_file(filename)
+        if data is not None:
+            on_read(data)
+            p = Promise()
+            p.resolve()
+            return p
+
+        return run_in_worker(_read_mapping_file, filename).then(
+            on_read, on_failed)
+
+    def __mapping_file(self, mdlfile):
+        """
+        The name of the mapping file for the given MDL file
+        :param GPS.File mdlfile: the MDL file
+        :return: a string
+        """
+        return os.path.join(
+            Project_Support.get_output_dir(mdlfile),
+            '%s.json' % os.path.basename(mdlfile.path))
+
+    def __add(self, mdlfile, data):
+        """
+        Add the information read by `_read_mapping_file`
+        :param GPS.File mdlfile: the MDL file we start from
+        """
+        for filename, (funcs, ranges, symbols, lines) in data.iteritems():
             f = GPS.File(filename)
             self._mdl[f.path] = mdlfile
+            self._files.setdefault(f.path, []).append(lines)
+
+            for func_id, funclines, bounds in funcs:
+                self._fileinfo.setdefault(filename, []).append(
+                    (func_id, bounds))
+                self._funcinfo[func_id] = (filename, funclines)
 
-            b = self._files.setdefault(f.path, {})
-
-            for blockid, blockinfo in blocks.iteritems():
-                if blockid == '@qgen_functions':
-                    for func_id, funcline in blockinfo.iteritems():
-                        lines = funcline.split('-')
-                        if filename not in self._fileinfo:
-                            self._fileinfo[filename] = [
-                                (func_id, (int(lines[0]), int(lines[1])))]
-                        else:
-                            self._fileinfo[filename].append((func_id, (
-                                int(lines[0]), int(lines[1]))))
-                        self._funcinfo[func_id] = (filename, lines)
-                    continue
-
-                a = self._blocks.setdefault(blockid, set())
-                for linerange in blockinfo.get('lines', []):
-                    if isinstance(linerange, int):
-                        rg = (linerange, linerange)
-                    elif '-' in linerange:
-                        s = linerange.split('-')
-                        rg = (int(s[0]), int(s[1]))
-                    else:
-                        rg = (int(linerange), int(linerange))
-
-                    a.add((f, rg))
-
-                    for line in range(rg[0], rg[1] + 1):
-                        b[line] = blockid
-
-                a = self._symbols.setdefault(blockid, set())
-                for symbol in blockinfo.get('symbols', []):
-                    a.add(symbol)
+            for blockid, rgs in ranges.iteritems():
+                self._blocks.setdefault(blockid, set()).update(
+                    (f, rg) for rg in rgs)
+
+            for blockid, syms in symbols.iteritems():
+                self._symbols.setdefault(blockid, set()).update(syms)
 
     def get_file_funcinfos(self, filename):
         """
@@ -123,8 +298,12 @@ class Mapping_File(object):
         The block name corresponding to a given source line
         :param GPS.File filename:
         """
-        a = self._files.get(file.path, {})
-        return a.get(line, None)
+        # The files loaded last take precedence
+        for lines in reversed(self._files.get(file.path, [])):
+            blockid = lines.get(line)
+            if blockid is not None:
+                return blockid
+        return None
 
     def get_diagram_for_item(self, diags, block):
         """
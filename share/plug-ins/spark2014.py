@@ -15,6 +15,7 @@ import os.path
 import tool_output
 import json
 import re
+from workflows.promises import run_in_worker
 
 # We create the actions and menus in XML instead of python to share the same
 # source for GPS and GNATbench (which only understands the XML input for now).
@@ -1784,9 +1785,10 @@ class GNATprove_Parser(tool_output.OutputParser):
        unique for this unit and this message.
        The GNATprove parser strips the extra symbol from the message so that
        it's not visible in GPS, and builds up a mapping
-         msg -> id
-       Once GNATprove is terminated, for each msg which has an entry in this
-       mapping, the parser opens the JSON file "unit.spark".
+         (file, line, column, text) -> id
+       Once GNATprove is terminated, for each message in the GPS categories
+       used by GNATprove which has an entry in this mapping, the parser
+       opens the JSON file "unit.spark".
        See the :func:`parsejson()` function for the format of this file.
        Once this file is parsed, the GNATprove parser now knows the extra
        information associated to a message, if any. See
@@ -1794,31 +1796,26 @@ class GNATprove_Parser(tool_output.OutputParser):
        information.
     """
 
+    # The categories of the messages created from the output of GNATprove
+    categories = ("Builder results", )
+
     def __init__(self, child):
         tool_output.OutputParser.__init__(self, child)
         # holds the unit names for which extra info is retrieved
         self.units_with_extra_info = []
-        # holds the mapping "msg" -> msg_id
+        # holds the mapping (file, line, col, msg) -> msg_id, see msg_key
         self.msg_id = {}
         self.regex = re.compile(r"(.*)\[#([0-9]+)\]$")
+        self.location_regex = re.compile(r"(.*?):([0-9]+):([0-9]+): (.*)$")
         # holds the mapping "unit,msg_id" -> extra_info
         self.extra_info = {}
 
-    def build_msg_full_text(self, file, line, col, text):
-        """Given a msg text and location, return the string
-           "file:line:col:msg"
-           Note that the returned text must be identical to the text that is
-           produced by GNATprove - this  text is used to match the message
-           produced by GNATprove and extra information about this message
-           stored in *.spark file. See on_stdout and on_exit.
+    def msg_key(self, file, line, col, text):
+        """Given a msg text and location, return the key used to find its
+           msg_id. file is the base name of the file of the message.
+           See on_stdout and on_exit.
         """
-        str_col = str(col)
-
-        # In the message produced by GNATprove, '0' is always prepended
-        # to column number that is less than 10. Do it also here.
-        if col < 10:
-            str_col = '0' + str_col
-        return "%s:%s:%s: %s" % (file, line, str_col, text)
+        return (os.path.basename(file), line, col, text)
 
     def pass_output(self, text, command):
         """pass the text on to the next output parser"""
@@ -1842,7 +1839,7 @@ class GNATprove_Parser(tool_output.OutputParser):
                                              1))
         return lines
 
-    def handle_entry(self, unit, list):
+    def handle_entry(self, unit, list, extra_info):
         """code do handle one entry of the JSON file. See :func:`parsejson()`
            for the details of the format.
         """
@@ -1850,9 +1847,9 @@ class GNATprove_Parser(tool_output.OutputParser):
         for entry in list:
             if 'msg_id' in entry:
                 full_id = unit, entry['msg_id']
-                self.extra_info[full_id] = entry
+                extra_info[full_id] = entry
 
-    def parsejson(self, unit, file):
+    def parsejson(self, unit, file, extra_info):
         """parse the json file "file", which belongs to unit "unit" and fill
            the "extra_info" mapping for any entry.
            The json file, if it exists and is a valid JSON value, is a dict
@@ -1870,12 +1867,22 @@ class GNATprove_Parser(tool_output.OutputParser):
                 try:
                     dict = json.load(f)
                     if 'flow' in dict:
-                        self.handle_entry(unit, dict['flow'])
+                        self.handle_entry(unit, dict['flow'], extra_info)
                     if 'proof' in dict:
-                        self.handle_entry(unit, dict['proof'])
+                        self.handle_entry(unit, dict['proof'], extra_info)
                 except ValueError:
                     pass
 
+    def parse_spark_files(self, files):
+        """parse the json files, given as a list of (unit, file), and return
+           the "extra_info" mapping for their entries. This doesn't use the
+           GPS module, so that it can run in a worker thread.
+        """
+        extra_info = {}
+        for unit, file in files:
+            self.parsejson(unit, file, extra_info)
+        return extra_info
+
     def act_on_extra_info(self, m, extra, objdir, command):
         """act on extra info for the message m. More precisely, if the message
            has a tracefile or counterexample, add an action to the message
@@ -1965,26 +1972,38 @@ class GNATprove_Parser(tool_output.OutputParser):
             GPS.Project.root().object_dirs()[0],
             obj_subdir_name)
 
-        imported_units = set()
-        for m in GPS.Message.list():
-            file = os.path.basename(m.get_file().path)
-            text = self.build_msg_full_text(
-                file,
-                m.get_line(),
-                m.get_column(),
-                m.get_text())
-            if text in self.msg_id:
-                id = self.msg_id[text]
-                unit = get_compunit_for_message(m)
-                full_id = unit, id
-                if unit not in imported_units:
-                    self.parsejson(unit, os.path.join(objdir, unit + ".spark"))
-                    imported_units.add(unit)
-                extra = {}
+        # unit -> [(message, (unit, msg_id))] for the messages with extra
+        # info
+        messages = {}
+        if self.msg_id:
+            for category in self.categories:
+                for m in GPS.Message.list(category=category):
+                    id = self.msg_id.get(self.msg_key(
+                        m.get_file().path,
+                        m.get_line(),
+                        m.get_column(),
+                        m.get_text()))
+                    if id is not None:
+                        unit = get_compunit_for_message(m)
+                        messages.setdefault(unit, []).append((m, (unit, id)))
+
+        def on_parsed(unit_messages, extra_info):
+            self.extra_info.update(extra_info)
+            for m, full_id in unit_messages:
                 if full_id in self.extra_info:
                     extra = self.extra_info[full_id]
                     self.act_on_extra_info(m, extra, objdir, command)
 
+        # The .spark files can be large, so they are parsed in worker
+        # threads, one unit at a time, and the messages of a unit are
+        # updated as soon as its file has been parsed.
+        for unit, unit_messages in messages.iteritems():
+            run_in_worker(
+                self.parse_spark_files,
+                [(unit, os.path.join(objdir, unit + ".spark"))]).then(
+                    lambda extra_info, unit_messages=unit_messages:
+                        on_parsed(unit_messages, extra_info))
+
         if self.child is not None:
             self.child.on_exit(status, command)
 
@@ -1992,7 +2011,7 @@ class GNATprove_Parser(tool_output.OutputParser):
         """for each GNATprove message, check for a msg_id tag of the form
            [#id] where id is a number. If no such tag is found, just pass the
            text on to the next parser. Otherwise, add a mapping
-              msg text -> msg id
+              (file, line, col, msg) -> msg id
            which will be used later (in on_exit) to associate more info to the
            message
         """
@@ -2002,7 +2021,13 @@ class GNATprove_Parser(tool_output.OutputParser):
             if m:
                 text = m.group(1)
                 self.pass_output(text, command)
-                self.msg_id[text] = int(m.group(2))
+                loc = self.location_regex.match(text)
+                if loc:
+                    self.msg_id[self.msg_key(
+                        loc.group(1),
+                        int(loc.group(2)),
+                        int(loc.group(3)),
+                        loc.group(4))] = int(m.group(2))
             else:
                 # the line doesn't have any extra info, go on
                 self.pass_output(line, command)
@@ -49,6 +49,9 @@ class ExampleAction(GPS.Action):
 
 class GNATExamples(Module):
 
+    setup_mode = "idle"
+    # Scanning the examples directories is not needed to start GPS
+
     def _process_examples_dir(self, submenu_name, example_directory):
         """ Process a directory and place any valid examples found there.
 
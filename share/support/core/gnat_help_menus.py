@@ -78,6 +78,9 @@ class HTMLAction(GPS.Action):
 
 class GNATMenus(Module):
 
+    setup_mode = "idle"
+    # Populating the help menus is not needed to start GPS
+
     def _populate_menu(self):
         """ Populate the Help menu for the AdaCore tools """
 
@@ -4,8 +4,11 @@ files.
 """
 
 import GPS
+import re
 import time
 import traceback
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
 
 try:
     from gi.repository import GLib
@@ -119,24 +122,85 @@ class OverlayStyle(object):
         over = self.__create_style(buffer)
 
         if self.use_messages():
-            msg = GPS.Message(
-                category=self.name,
-                file=buffer.file(),
-                line=start.line(),
-                column=start.column(),  # index in python starts at 0
-                text="",
-                show_on_editor_side=True,
-                show_in_locations=False)
-
-            if self.whole_line:
-                msg.set_style(over)
-            else:
-                msg.set_style(over, end.column() - start.column() + 1)
-            self._messages.append(msg)
-
+            self.__add_message(
+                buffer, over, start.line(), start.column(),
+                end.column() - start.column() + 1)
         else:
             buffer.apply_overlay(over, start, end)
 
+    def apply_offsets(self, start, end, ranges):
+        """
+        Apply the highlighting to several parts of a region of the buffer.
+        This is faster than calling apply for each part, since no
+        `GPS.EditorLocation` is created for them unless messages are used.
+
+        :param GPS.EditorLocation start: start of the region.
+        :param GPS.EditorLocation end: end of the region.
+        :param ranges: the offsets of the start and end (excluded) of each
+           part, sorted, and all within the region.
+        :type ranges: list[(int, int)]
+        """
+        buffer = start.buffer()
+        over = self.__create_style(buffer)
+
+        if self.use_messages():
+            # Messages are placed at visible columns, which depend on the
+            # tabs: let the locations compute them
+            beginning = buffer.beginning_of_buffer()
+            for s, e in ranges:
+                first = beginning + s
+                last = beginning + (e - 1)
+                self.__add_message(
+                    buffer, over, first.line(), first.column(),
+                    last.column() - first.column() + 1)
+            return
+
+        tag = None
+        if gobject_available:
+            # The overlay is the Gtk tag with the same name: apply it
+            # directly, reusing the same iterators
+            try:
+                from pygps import get_gtk_buffer
+                gtk_buffer = get_gtk_buffer(buffer)
+                tag = gtk_buffer.get_tag_table().lookup(self.name)
+            except Exception:
+                tag = None
+
+        if tag is None:
+            beginning = buffer.beginning_of_buffer()
+            for s, e in ranges:
+                buffer.apply_overlay(over, beginning + s, beginning + (e - 1))
+        else:
+            start_iter = gtk_buffer.get_start_iter()
+            end_iter = gtk_buffer.get_start_iter()
+            for s, e in ranges:
+                start_iter.set_offset(s)
+                end_iter.set_offset(e)
+                gtk_buffer.apply_tag(tag, start_iter, end_iter)
+
+    def __add_message(self, buffer, over, line, column, length):
+        """
+        Highlight part of a line with a message.
+
+        :param GPS.EditorBuffer buffer: the buffer to highlight.
+        :param GPS.Style over: the style of the message.
+        :param int length: the number of characters to highlight.
+        """
+        msg = GPS.Message(
+            category=self.name,
+            file=buffer.file(),
+            line=line,
+            column=column,  # index in python starts at 0
+            text="",
+            show_on_editor_side=True,
+            show_in_locations=False)
+
+        if self.whole_line:
+            msg.set_style(over)
+        else:
+            msg.set_style(over, length)
+        self._messages.append(msg)
+
     def remove(self, start, end=None):
         """
         Remove the highlighting in whole or part of the buffer.
@@ -172,6 +236,179 @@ class OverlayStyle(object):
             buffer.remove_overlay(over, start, end)
 
 
+class Buffer_Edits(object):
+
+    """
+    Records the last edits of the text of a Gtk buffer, so that offsets
+    computed for an earlier version of the text can be updated. There is
+    one instance per buffer, see :func:`buffer_edits`.
+    """
+
+    # Number of edits that are remembered
+    max_edits = 200
+
+    def __init__(self, gtk_buffer):
+        self.version = 0  # incremented for each edit
+        self.edits = deque(maxlen=self.max_edits)
+        # The last edits, as (offset, removed, inserted) where removed and
+        # inserted are numbers of characters. The last one created
+        # self.version.
+
+        gtk_buffer.connect("insert-text", self.__on_insert_text)
+        gtk_buffer.connect("delete-range", self.__on_delete_range)
+
+    def __on_insert_text(self, gtk_buffer, location, text, length):
+        if not isinstance(text, unicode):
+            text = text.decode("utf-8")
+        self.__add(location.get_offset(), 0, len(text))
+
+    def __on_delete_range(self, gtk_buffer, start, end):
+        self.__add(start.get_offset(), end.get_offset() - start.get_offset(),
+                   0)
+
+    def __add(self, offset, removed, inserted):
+        self.version += 1
+        self.edits.append((offset, removed, inserted))
+
+    def since(self, version):
+        """
+        Return the edits made after version, oldest first, or None if they
+        are not all remembered.
+
+        :rtype: list[(int, int, int)]|None
+        """
+        count = self.version - version
+        if count > len(self.edits):
+            return None
+        return list(self.edits)[len(self.edits) - count:]
+
+
+def buffer_edits(buffer):
+    """
+    Return the edits of the buffer, or None if they cannot be monitored.
+
+    :param GPS.EditorBuffer buffer: the buffer to inspect.
+    :rtype: Buffer_Edits|None
+    """
+    if not gobject_available:
+        return None
+
+    try:
+        from pygps import get_gtk_buffer
+        gtk_buffer = get_gtk_buffer(buffer)
+    except Exception:
+        return None
+
+    if not hasattr(gtk_buffer, "gps_edits"):
+        gtk_buffer.gps_edits = Buffer_Edits(gtk_buffer)
+
+    return gtk_buffer.gps_edits
+
+
+class Highlighter_Scheduler(object):
+
+    """
+    Runs the background work of all the instances of Background_Highlighter
+    from a single idle callback, so that they do not each compete with
+    their own idle source. Each callback runs for at most budget_ms
+    milliseconds, shared between the highlighters that have work to do in
+    visible editors. When all the remaining work is in hidden editors, the
+    scheduler pauses until the current context changes.
+    """
+
+    # Time budget of one idle callback, in milliseconds
+    budget_ms = 4
+
+    # Interval in milliseconds between two callbacks.
+    # This is only used when gobject is not available
+    timeout_ms = 40
+
+    def __init__(self):
+        self.__source_id = None  # The gtk source_id used for background
+        # or the GPS.Timeout instance
+        self.__highlighters = []  # The highlighters with pending work
+        self.__hook_connected = False
+
+    def schedule(self, highlighter):
+        """
+        Start running the background work of highlighter.
+
+        :param Background_Highlighter highlighter: the highlighter.
+        """
+        if highlighter not in self.__highlighters:
+            self.__highlighters.append(highlighter)
+
+        if not self.__hook_connected:
+            self.__hook_connected = True
+            GPS.Hook("context_changed").add(self.__on_context_changed)
+
+        if self.__source_id is None:
+            if gobject_available:
+                self.__source_id = GLib.idle_add(self.__on_idle)
+            else:
+                self.__source_id = GPS.Timeout(
+                    self.timeout_ms, self.__on_idle)
+
+    def unschedule(self, highlighter):
+        """
+        Stop running the background work of highlighter.
+
+        :param Background_Highlighter highlighter: the highlighter.
+        """
+        if highlighter in self.__highlighters:
+            self.__highlighters.remove(highlighter)
+
+        if not self.__highlighters:
+            self.__stop()
+
+    def __stop(self):
+        if self.__source_id:
+            if gobject_available:
+                GLib.source_remove(self.__source_id)
+            else:
+                self.__source_id.remove()
+            self.__source_id = None
+
+    def __on_context_changed(self, hook, context):
+        """
+        Resume the work that was paused because its editors were hidden.
+        """
+        if self.__highlighters and self.__source_id is None:
+            self.schedule(self.__highlighters[0])
+
+    def __on_idle(self, *args, **kwargs):
+        """
+        The function called at regular intervals, and that shares the time
+        budget between the highlighters.
+        """
+        active = [h for h in self.__highlighters if h.has_pending_work()]
+        self.__highlighters = active
+
+        # Rotate the highlighters, so that they each get a chance to start
+        # first.
+        if active:
+            self.__highlighters = active[1:] + active[:1]
+
+        start = time.time()
+        share = self.budget_ms / 1000.0 / max(1, len(active))
+        busy = False
+
+        for index, h in enumerate(active):
+            if h.highlight_step(deadline=start + share * (index + 1)):
+                busy = True
+
+        if not busy:
+            # Either we are done, or everything left is in hidden editors
+            self.__stop()
+            return False
+
+        return True
+
+
+scheduler = Highlighter_Scheduler()
+# The scheduler shared by all the background highlighters
+
+
 class Background_Highlighter(object):
 
     """
@@ -189,23 +426,32 @@ class Background_Highlighter(object):
         e.start_highlight(buffer1)   # start highlighting a first buffer
         e.start_highlight(buffer2)   # start highlighting a second buffer
 
+    The work of all highlighters is run by the shared
+    :class:`Highlighter_Scheduler`. The visible lines of an editor are
+    processed first, then the lines closest to them. Editors that are not
+    visible are not processed until they are displayed.
+
     :param OverlayStyle style: style to use for highlighting.
     """
-    # Interval in milliseconds between two batches.
-    # This is only used when gobject is not available
-    timeout_ms = 40
 
-    # Number of lines to process at each iteration
+    # Number of lines to process at each iteration. This is only the initial
+    # value, it is adapted so that each batch fits in the time budget of
+    # the scheduler.
     batch_size = 20
 
+    # Maximum number of lines to process at each iteration
+    max_batch_size = 2000
+
     # If True, highlighting is always done in the
     # foreground. This is for testsuite purposes
     synchronous = False
 
     def __init__(self, style):
-        self.__source_id = None  # The gtk source_id used for background
-        # or the GPS.Timeout instance
-        self.__buffers = []      # The list of buffers to highlight
+        # The list of buffers to highlight, each with the sorted list of
+        # ranges of lines (first and last line) that remain to process.
+        self.__buffers = []
+        self.__current_buffer = None  # The buffer being processed
+        self.__batch_size = self.batch_size
         self.terminated = False
 
         self.style = style
@@ -217,7 +463,6 @@ class Background_Highlighter(object):
             self.__on_lines_folded_or_unfolded)
 
     def __del__(self):
-        self.__source_id = None  # Don't try to kill the idle, GPS is quitting
         self.stop_highlight()
         GPS.Hook("before_exit_action_hook").remove(self.__before_exit)
         GPS.Hook("file_closed").remove(self.__on_file_closed)
@@ -231,7 +476,6 @@ class Background_Highlighter(object):
         Called when GPS is about to exit
         """
         self.terminated = True
-        self.__source_id = None  # Don't try to kill the idle, GPS is quitting
         self.stop_highlight()
         return True
 
@@ -254,10 +498,8 @@ class Background_Highlighter(object):
            when other buffers are finished.
 
         :param integer line:
-           The line the highlighting should start from. By default, this
-           is the current line in the editor, so that the user sees
-           changes immediately. But you could chose to start from the
-           top of the file instead.
+           The line the highlighting should start from when the buffer is
+           not visible. By default, this is the current line in the editor.
 
         :param integer context:
            Number of lines before and after 'line' that should be
@@ -284,34 +526,26 @@ class Background_Highlighter(object):
 
             end_line = buffer.lines_count()
             if context is not None:
-                start_line = max(0, line - context)
+                start_line = max(1, line - context)
                 end_line = min(end_line, line + context)
             else:
-                start_line = 0
+                start_line = 1
 
             # push at the back, so that we do not change the current buffer,
             # in case the user has computed data for it (see
             # Location_Highlighter)
             self.__buffers.append(
-                (buffer, line, line + 1, start_line, end_line))
+                (buffer, line,
+                 [[start_line, end_line]] if start_line <= end_line else []))
 
             if self.style and self.style.use_messages():
                 self.style.remove(buffer)
 
             if self.synchronous:
-                self.on_start_buffer(buffer)
-                while self.__do_highlight():
+                while self.highlight_step():
                     pass
-
-            elif self.__source_id is None:
-                if gobject_available:
-                    self.__source_id = GLib.idle_add(
-                        self.__do_highlight)  # , priority=GLib.PRIORITY_LOW)
-                else:
-                    self.__source_id = GPS.Timeout(
-                        self.timeout_ms, self.__do_highlight)
-
-                self.on_start_buffer(buffer)
+            else:
+                scheduler.schedule(self)
 
     def __on_file_closed(self, hook, file):
         for b in self.__buffers:
@@ -349,16 +583,14 @@ class Background_Highlighter(object):
             for b in self.__buffers:
                 if b[0] == buffer:
                     self.__buffers.remove(b)
+                    if self.__current_buffer == buffer:
+                        self.__current_buffer = None
                     return
 
-        elif self.__source_id:
-            if gobject_available:
-                GLib.source_remove(self.__source_id)
-            else:
-                self.__source_id.remove()
-            self.__source_id = None
-
+        else:
             self.__buffers = []
+            self.__current_buffer = None
+            scheduler.unschedule(self)
 
     def remove_highlight(self, buffer=None):
         """
@@ -382,68 +614,131 @@ class Background_Highlighter(object):
         """
         pass
 
-    def __do_highlight(self, *args, **kwargs):
+    def has_pending_work(self):
         """
-        The function called at regular intervals, and that computes
-        the range of lines to highlight.
+        :return: whether some buffers remain to be highlighted.
+        :rtype: boolean
         """
-        if self.terminated:
-            return False
+        return not self.terminated and bool(self.__buffers)
 
-        if not self.__buffers:
-            self.stop_highlight()
-            return False
+    def __next_lines(self, ranges, visible, line):
+        """
+        Return the next lines to process among the remaining ranges: first
+        the visible ones, then the ones closest to the visible area (or to
+        line when it is not known).
+
+        :param list ranges: the remaining ranges of lines.
+        :param visible: the visible lines, or None.
+        :param int line: the line to start from if nothing is visible.
+        :rtype: (int, int)
+        """
+        size = self.__batch_size
+        first, last = visible if visible else (line, line)
+
+        for start, end in ranges:
+            if start <= last and end >= first:
+                from_line = max(start, first)
+                return from_line, min(end, from_line + size - 1)
+
+        # No remaining line is visible: process the range closest to the
+        # visible area, starting from the side facing it.
+        best = None
+        for start, end in ranges:
+            if end < first:
+                candidate = (first - end, max(start, end - size + 1), end)
+            else:
+                candidate = (start - last, start, min(end, start + size - 1))
+            if best is None or candidate[0] < best[0]:
+                best = candidate
+        return best[1], best[2]
 
-        try:
-            (buffer, min_line, max_line,
-             start_line, end_line) = self.__buffers[0]
+    def __visible_lines(self, buffer):
+        """
+        Return the first and last visible lines of the buffer, or None if
+        it is not displayed. All lines are considered visible when the
+        view cannot be inspected.
 
-            changed = False
+        :rtype: (int, int)|None
+        """
+        if gobject_available:
+            try:
+                from pygps import get_visible_lines
+                lines = get_visible_lines(buffer)
+            except Exception:
+                return (1, buffer.lines_count())
 
-            if min_line >= start_line:
-                from_line = max(start_line, min_line - self.batch_size)
+            # Gtk counts lines from 0
+            return lines and (lines[0] + 1, lines[1] + 1)
 
-                f = buffer.at(from_line, 1)
+        return (1, buffer.lines_count())
 
-                # Do not process if the line is folded
-                if not (from_line > 1 and f.offset() == 0):
-                    e = buffer.at(min_line, 1).end_of_line()
-                    if self.style:
-                        self.style.remove(f, e)
+    def highlight_step(self, deadline=None):
+        """
+        Process batches of lines of the first buffer that is visible, until
+        the deadline is reached. This is called by the scheduler.
 
-                    self.process(f, e)
+        :param float deadline: the time (as returned by time.time) at which
+           to stop, or None to process the whole buffer, even if hidden.
+        :return: whether some lines were processed.
+        :rtype: boolean
+        """
+        if self.terminated:
+            return False
 
-                min_line = from_line - 1
-                changed = True
+        try:
+            for index, (buffer, line, ranges) in enumerate(self.__buffers):
+                visible = self.__visible_lines(buffer)
+                if visible is not None or deadline is None:
+                    break
+            else:
+                # Only hidden buffers remain
+                return False
+
+            if self.__current_buffer != buffer:
+                self.__current_buffer = buffer
+                self.on_start_buffer(buffer)
 
-            elif max_line < end_line:
-                to_line = min(end_line - 1, max_line + self.batch_size)
+            while ranges:
+                from_line, to_line = self.__next_lines(ranges, visible, line)
+                start_time = time.time()
 
                 # It is possible that the buffer has been changed so that one
                 # of the locations is now invalid, so we just protect.
                 try:
-                    f = buffer.at(max_line, 1)
+                    f = buffer.at(from_line, 1)
 
                     # Do not process if the line is folded
-                    if not (max_line > 1 and f.offset() == 0):
+                    if not (from_line > 1 and f.offset() == 0):
                         e = buffer.at(to_line, 1).end_of_line()
-
                         if self.style:
                             self.style.remove(f, e)
                         self.process(f, e)
-
-                    max_line = to_line + 1
-                    changed = True
                 except:
                     pass
 
-            if changed:
-                self.__buffers[0] = (
-                    buffer, min_line, max_line, start_line, end_line)
-            else:
-                self.__buffers.pop(0)
-                if self.__buffers:
-                    self.on_start_buffer(self.__buffers[0][0])
+                # Remove the lines from the remaining ranges
+                for r_index, (start, end) in enumerate(ranges):
+                    if start <= from_line <= end:
+                        remaining = [[start, from_line - 1],
+                                     [to_line + 1, end]]
+                        ranges[r_index:r_index + 1] = [
+                            r for r in remaining if r[0] <= r[1]]
+                        break
+
+                # Adapt the size of batches to the time budget
+                elapsed = time.time() - start_time
+                if deadline is not None:
+                    if elapsed * 4 < deadline - start_time:
+                        self.__batch_size = min(
+                            self.max_batch_size, self.__batch_size * 2)
+                    elif elapsed > deadline - start_time:
+                        self.__batch_size = max(1, self.__batch_size // 2)
+
+                    if time.time() >= deadline:
+                        break
+
+            if not ranges:
+                self.__buffers.pop(index)
 
             return True
 
@@ -538,6 +833,119 @@ class On_The_Fly_Highlighter(Background_Highlighter):
             self.start_highlight(buffer, context=self.context_lines)
 
 
+class References_Cache(object):
+
+    """
+    A cache of the references of entities within files, shared by all the
+    instances of Location_Highlighter. It keeps the lists for the last
+    max_entries (entity, file) pairs, and is cleared whenever the
+    cross-reference database is updated. Entries for a file are dropped
+    when its buffer is modified.
+
+    Queries can also be run in the background, in which case the result is
+    sent to a callback once the cross-reference engine has computed it.
+    """
+
+    # The number of (entity, file) pairs whose references are kept
+    max_entries = 16
+
+    # Interval in milliseconds between two checks of a background query
+    poll_ms = 50
+
+    def __init__(self):
+        self.__entries = OrderedDict()  # (entity, file path) -> refs
+        self.__pending = {}  # (entity, file path) -> list of callbacks
+        self.__generation = 0  # incremented when the xref database changes
+        self.__hooks_connected = False
+
+    def __connect_hooks(self):
+        if not self.__hooks_connected:
+            self.__hooks_connected = True
+            GPS.Hook("xref_updated").add(self.__on_xref_updated)
+            GPS.Hook("buffer_edited").add(self.__on_buffer_edited)
+            GPS.Hook("file_closed").add(self.__on_buffer_edited)
+
+    def __on_xref_updated(self, hook, *args):
+        self.__generation += 1
+        self.__entries.clear()
+
+    def __on_buffer_edited(self, hook, file):
+        for key in list(self.__entries):
+            if key[1] == file.path:
+                del self.__entries[key]
+
+    def __key(self, entity, file):
+        return (entity.name(), str(entity.declaration())), file.path
+
+    def __store(self, key, refs):
+        self.__entries[key] = refs
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+
+    def get(self, entity, file, on_ready=None):
+        """
+        Return the references of entity in file, as a list of
+        (entity name, GPS.FileLocation), suitable for
+        Location_Highlighter.recompute_refs.
+
+        :param GPS.Entity entity: the entity.
+        :param GPS.File file: the file in which to look for references.
+        :param on_ready: if specified and the references are not in the
+           cache, they are queried in the background, this function returns
+           None, and on_ready is later called with the list of references.
+        :rtype: list[(str, GPS.FileLocation)]|None
+        """
+        self.__connect_hooks()
+        key = self.__key(entity, file)
+
+        refs = self.__entries.pop(key, None)
+        if refs is not None:
+            self.__entries[key] = refs  # most recently used
+
+        elif on_ready is None:
+            name = entity.name()
+            refs = [(name, r) for r in entity.references(
+                include_implicit=False, synchronous=True, in_file=file)]
+            self.__store(key, refs)
+
+        elif key in self.__pending:
+            self.__pending[key].append(on_ready)
+            return None
+
+        else:
+            self.__pending[key] = [on_ready]
+            name = entity.name()
+            generation = self.__generation
+            command = entity.references(
+                include_implicit=False, synchronous=False, in_file=file)
+
+            def poll(timeout):
+                current, total = command.progress()
+                if current < total:
+                    return True
+
+                timeout.remove()
+                refs = [(name, r) for r in command.get_result() or []]
+                if generation == self.__generation:
+                    self.__store(key, refs)
+                for callback in self.__pending.pop(key, []):
+                    try:
+                        callback(refs)
+                    except Exception:
+                        GPS.Logger("HIGHLIGHTER").log(
+                            "Unexpected exception: %s" %
+                            traceback.format_exc())
+                return False
+
+            GPS.Timeout(self.poll_ms, poll)
+            return None
+
+        return refs
+
+
+references_cache = References_Cache()
+
+
 class Location_Highlighter(Background_Highlighter):
     """
     An abstract class that can be used to implement highlighter related to
@@ -564,7 +972,9 @@ class Location_Highlighter(Background_Highlighter):
 
     def recompute_refs(self, buffer):
         """
-        Called before we start processing a new buffer.
+        Called before we start processing a new buffer. The references of
+        an entity are best retrieved through references_cache.get, so that
+        they are only queried once.
 
         :return: a list of tuples, each of which contains
             an (name, GPS.FileLocation).
@@ -626,7 +1036,174 @@ class Location_Highlighter(Background_Highlighter):
                             continue
 
 
-class Regexp_Highlighter(On_The_Fly_Highlighter):
+class Search_Highlighter(On_The_Fly_Highlighter):
+
+    """
+    An abstract class for highlighters that search for a pattern in the
+    editors, and highlight all its matches.
+
+    By default, each range of lines is searched through
+    :func:`GPS.EditorLocation.search`, with one call per match. In
+    whole-buffer mode, the text of the buffer is instead fetched once and
+    searched with the Python regular expression returned by
+    python_regexp(). The offsets of the matches are cached for each
+    buffer, so that processing lines again does not search the buffer
+    again. After an edit, the cached matches are moved accordingly, and
+    only the modified lines are searched again.
+
+    :param OverlayStyle style: the style to apply.
+    :param integer context_lines: see :class:`On_The_Fly_Highlighter`.
+    :param boolean whole_buffer: whether to use the whole-buffer mode.
+    """
+
+    def __init__(self, style, context_lines=0, whole_buffer=False):
+        self.whole_buffer = whole_buffer
+        self.__matches = {}  # file path -> (version, starts, ends)
+        self.__regexp = None
+        On_The_Fly_Highlighter.__init__(
+            self, context_lines=context_lines, style=style)
+        GPS.Hook("file_closed").add(self.__on_file_closed)
+
+    def search(self, start):
+        """
+        Search for the next match after start, when not in whole-buffer mode.
+
+        :param GPS.EditorLocation start: where to start searching.
+        :return: the start and end of the match, as returned by
+           :func:`GPS.EditorLocation.search`, or None.
+        """
+        return None
+
+    def python_regexp(self):
+        """
+        :return: the regular expression to search in whole-buffer mode.
+        :rtype: re.RegexObject
+        """
+        return None
+
+    def __on_file_closed(self, hook, file):
+        self.__matches.pop(file.path, None)
+
+    def __scan(self, text, offset):
+        """
+        Return the offsets of the start and end of all the non-empty matches
+        in text, which starts at offset in the buffer.
+
+        :rtype: (list[int], list[int])
+        """
+        if self.__regexp is None:
+            self.__regexp = self.python_regexp()
+
+        starts = []
+        ends = []
+        for m in self.__regexp.finditer(text):
+            if m.end() > m.start():
+                starts.append(offset + m.start())
+                ends.append(offset + m.end())
+        return starts, ends
+
+    def __update_matches(self, buffer, starts, ends, edits):
+        """
+        Update the matches found in an earlier version of the buffer: they
+        are moved by the edits, and the modified lines are searched again.
+
+        :param list[int] starts: the start offsets of the matches.
+        :param list[int] ends: the end offsets of the matches.
+        :param list edits: as returned by :func:`Buffer_Edits.since`.
+        :return: the new starts and ends.
+        :rtype: (list[int], list[int])
+        """
+        dirty = []  # the modified regions, as [start, end] offsets
+
+        for offset, removed, inserted in edits:
+            stop = offset + removed
+            delta = inserted - removed
+
+            # Forget the matches that touch the edit, move the next ones
+            first = bisect_left(ends, offset)
+            last = bisect_right(starts, stop)
+            starts = starts[:first] + [s + delta for s in starts[last:]]
+            ends = ends[:first] + [e + delta for e in ends[last:]]
+
+            region = [offset, offset + inserted]
+            regions = []
+            for d in dirty:
+                if d[1] < offset:
+                    regions.append(d)
+                elif d[0] > stop:
+                    regions.append([d[0] + delta, d[1] + delta])
+                else:
+                    region[0] = min(region[0], d[0])
+                    if d[1] > stop:
+                        region[1] = max(region[1], d[1] + delta)
+            regions.append(region)
+            dirty = sorted(regions)
+
+        beginning = buffer.beginning_of_buffer()
+        size = buffer.end_of_buffer().offset()
+
+        for region_start, region_end in dirty:
+            s = (beginning + min(region_start, size)).beginning_of_line()
+            e = (beginning + min(region_end, size)).end_of_line()
+
+            # Also search again the matches that overlap these lines
+            first = bisect_right(ends, s.offset())
+            last = bisect_right(starts, e.offset())
+            if first < last:
+                if starts[first] < s.offset():
+                    s = beginning + starts[first]
+                if ends[last - 1] - 1 > e.offset():
+                    e = beginning + (ends[last - 1] - 1)
+
+            found_starts, found_ends = self.__scan(
+                buffer.get_chars(s, e).decode("utf-8"), s.offset())
+            starts[first:last] = found_starts
+            ends[first:last] = found_ends
+
+        return starts, ends
+
+    def process(self, start, end):
+        if not self.whole_buffer:
+            while True:
+                start = self.search(start)
+                if not start or start[0] > end:
+                    return
+                self.style.apply(start[0], start[1] - 1)
+                start = start[1] + 1
+
+        buffer = start.buffer()
+        tracker = buffer_edits(buffer)
+
+        if tracker is None:
+            # The edits cannot be monitored: only search the requested lines
+            starts, ends = self.__scan(
+                buffer.get_chars(start, end).decode("utf-8"), start.offset())
+
+        else:
+            path = buffer.file().path
+            cached = self.__matches.get(path)
+            edits = None
+            if cached is not None:
+                edits = tracker.since(cached[0])
+
+            if edits is None:
+                starts, ends = self.__scan(
+                    buffer.get_chars().decode("utf-8"), 0)
+            elif edits:
+                starts, ends = self.__update_matches(
+                    buffer, cached[1], cached[2], edits)
+            else:
+                _, starts, ends = cached
+
+            self.__matches[path] = (tracker.version, starts, ends)
+
+        first = bisect_left(starts, start.offset())
+        last = bisect_right(starts, end.offset())
+        self.style.apply_offsets(
+            start, end, zip(starts[first:last], ends[first:last]))
+
+
+class Regexp_Highlighter(Search_Highlighter):
 
     """
     The Regexp_Highlighter is a concrete implementation to highlight
@@ -669,24 +1246,26 @@ class Regexp_Highlighter(On_The_Fly_Highlighter):
        not detect cases where the regular expression would match across
        sections.
     :param OverlayStyle style: the style to apply.
+    :param boolean whole_buffer: see :class:`Search_Highlighter`. The
+       regular expression must then also be a valid Python regular
+       expression.
     """
 
-    def __init__(self, regexp, style, context_lines=0):
+    def __init__(self, regexp, style, context_lines=0, whole_buffer=False):
         self.regexp = regexp
-        On_The_Fly_Highlighter.__init__(
-            self, context_lines=context_lines, style=style)
+        Search_Highlighter.__init__(
+            self, context_lines=context_lines, style=style,
+            whole_buffer=whole_buffer)
 
-    def process(self, start, end):
-        while True:
-            start = start.search(
-                self.regexp, regexp=True, dialog_on_failure=False)
-            if not start or start[0] > end:
-                return
-            self.style.apply(start[0], start[1] - 1)
-            start = start[1] + 1
+    def search(self, start):
+        return start.search(
+            self.regexp, regexp=True, dialog_on_failure=False)
+
+    def python_regexp(self):
+        return re.compile(self.regexp, re.I | re.M)
 
 
-class Text_Highlighter(On_The_Fly_Highlighter):
+class Text_Highlighter(Search_Highlighter):
 
     """
     Similar to Regexp_Highlighter, but highlights constant text instead of
@@ -699,20 +1278,24 @@ class Text_Highlighter(On_The_Fly_Highlighter):
        is done on small sections of the editor at a time, and it might
        not detect cases where the text would match across sections.
     :param OverlayStyle style: the style to apply.
+    :param boolean whole_buffer: see :class:`Search_Highlighter`.
     """
 
-    def __init__(self, text, style, whole_word=False, context_lines=0):
+    def __init__(self, text, style, whole_word=False, context_lines=0,
+                 whole_buffer=False):
         self.text = text
         self.whole_word = whole_word
-        On_The_Fly_Highlighter.__init__(
-            self, context_lines=context_lines, style=style)
-
-    def process(self, start, end):
-        while True:
-            start = start.search(
-                self.text, regexp=False, dialog_on_failure=False,
-                whole_word=self.whole_word)
-            if not start or start[0] > end:
-                return
-            self.style.apply(start[0], start[1] - 1)
-            start = start[1] + 1
+        Search_Highlighter.__init__(
+            self, context_lines=context_lines, style=style,
+            whole_buffer=whole_buffer)
+
+    def search(self, start):
+        return start.search(
+            self.text, regexp=False, dialog_on_failure=False,
+            whole_word=self.whole_word)
+
+    def python_regexp(self):
+        pattern = re.escape(self.text)
+        if self.whole_word:
+            pattern = r"\b%s\b" % pattern
+        return re.compile(pattern, re.I | re.M)
@@ -0,0 +1,140 @@
+"""
+Micro-benchmarks for some of the data structures and helpers used by the
+GPS plug-ins. They are meant to be run from a test driver, and return the
+measured times so that the test can record them, for instance::
+
+    from gps_utils.internal.benchmarks import bench_highlighter_stacks
+
+    @run_test_driver
+    def driver():
+        record_time(bench_highlighter_stacks())
+"""
+
+import time
+
+
+def bench_highlighter_stacks(nb_lines=40000, block_lines=10000, repeat=10):
+    """
+    Measure the time needed to paste and then delete large blocks of lines
+    in the middle of the highlighting stacks of a buffer.
+
+    :param int nb_lines: number of lines of the simulated buffer.
+    :param int block_lines: number of lines pasted and deleted each time.
+    :param int repeat: number of paste/delete cycles.
+    :return: the elapsed time, in seconds.
+    :rtype: float
+    """
+    from highlighter.engine import HighlighterStacks
+
+    stacks = HighlighterStacks()
+    for line in range(1, nb_lines):
+        # One comment region every few lines, as in typical sources
+        stacks.set(line, ("root", "comment") if line % 7 == 0 else ("root", ))
+
+    start = time.time()
+    for _ in range(repeat):
+        stacks.insert_newlines(block_lines, nb_lines // 2)
+        stacks.delete_lines(block_lines, nb_lines // 2)
+    return time.time() - start
+
+
+def bench_highlighter_tags(filename, repeat=5):
+    """
+    Compare the number of tokens highlighted per second on the whole buffer
+    of filename when applying the tags one token at a time, and when using
+    Highlighter.apply_results, on an empty buffer and on a buffer that is
+    already highlighted.
+
+    :param str filename: a large file in a language with a highlighter,
+       C for instance.
+    :param int repeat: number of times each method is run.
+    :return: the tokens per second of each method.
+    :rtype: dict[str, float]
+    """
+    import GPS
+    from pygps import get_gtk_buffer
+    from highlighter.engine import HighlighterModule
+
+    ed = GPS.EditorBuffer.get(GPS.File(filename))
+    highlighter = HighlighterModule.highlighters[ed.file().language()]
+    gtk_ed = get_gtk_buffer(ed)
+    if not gtk_ed.highlighting_initialized:
+        highlighter.init_highlighting(ed)
+
+    results = highlighter.highlight_info_gen(gtk_ed, 0)
+    nb_tokens = len([tag for tag, _, _ in results if tag])
+    start_it = gtk_ed.get_start_iter()
+    end_it = gtk_ed.get_start_iter()
+
+    def clear():
+        gtk_ed.remove_all_tags(gtk_ed.get_start_iter(), gtk_ed.get_end_iter())
+
+    def per_token():
+        clear()
+        for tag, start, end in results:
+            if tag:
+                start_it.set_offset(start)
+                end_it.set_offset(end)
+                gtk_ed.apply_tag(tag, start_it, end_it)
+
+    def batched():
+        highlighter.apply_results(gtk_ed, results, 0, results[-1][2])
+
+    def measure(fn, before=None):
+        elapsed = 0.0
+        for _ in range(repeat):
+            if before:
+                before()
+            start = time.time()
+            fn()
+            elapsed += time.time() - start
+        return nb_tokens * repeat / elapsed
+
+    return {"per_token": measure(per_token),
+            "batched": measure(batched, before=clear),
+            "batched_relex": measure(batched, before=batched)}
+
+
+def bench_process_lines(size_mb=100, line_length=80):
+    """
+    Measure the time needed to read the output of a process through
+    ProcessWrapper.lines and ProcessWrapper.wait_line. This is a workflow,
+    which should be run with::
+
+        times = yield join(bench_process_lines())
+
+    :param int size_mb: the size of the output, in megabytes.
+    :param int line_length: the length of each line of the output.
+    :return: the elapsed time for each method, in seconds.
+    :rtype: dict[str, float]
+    """
+    import os
+    import tempfile
+    from workflows.promises import ProcessWrapper
+
+    fd, filename = tempfile.mkstemp()
+    line = "x" * (line_length - 1) + "\n"
+    with os.fdopen(fd, "w") as f:
+        for _ in range(size_mb * 1024 * 1024 // line_length):
+            f.write(line)
+
+    result = {}
+
+    def on_line(line):
+        pass
+
+    start = time.time()
+    p = ProcessWrapper(["cat", filename], block_exit=False)
+    yield p.lines.subscribe(on_line)
+    result["lines"] = time.time() - start
+
+    start = time.time()
+    p = ProcessWrapper(["cat", filename], block_exit=False)
+    while True:
+        line = yield p.wait_line()
+        if line is None:
+            break
+    result["wait_line"] = time.time() - start
+
+    os.unlink(filename)
+    yield result
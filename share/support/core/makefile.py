@@ -51,8 +51,10 @@ import traceback
 import re
 import os
 import os_utils
-from GPS import Logger, Hook, parse_xml, Project
+import subprocess
+from GPS import Logger, Hook, parse_xml, Preference, Project
 from gps_utils import hook
+from workflows.promises import run_in_worker
 
 # This is an XML model for make/gnumake
 Make_Model = """
@@ -135,6 +137,97 @@ On a multiprocess or machine compilations will occur in parallel" />
 """
 
 
+Make_Database_Pref = Preference("Plugins/makefile/make_database")
+Make_Database_Pref.create(
+    "Use make database", "boolean",
+    "Get the list of targets by running make -pRrq, instead of reading"
+    " the Makefile and the files it includes. This finds the targets"
+    " created by pattern rules and functions, but runs make.",
+    False)
+
+
+def _file_key(filename):
+    """
+    Return the (mtime, size) of filename, or None if it doesn't exist.
+    """
+    try:
+        s = os.stat(filename)
+        return (s.st_mtime, s.st_size)
+    except OSError:
+        return None
+
+
+class Target_Index(object):
+    """
+    Caches the result of parsing each build file, until the file is
+    modified. This doesn't use the GPS module, so that it can be used from
+    a worker thread.
+    """
+
+    def __init__(self, read_file):
+        """
+        :param read_file: a function that parses the file whose name it
+           receives as a parameter.
+        """
+        self.__read_file = read_file
+        self.__files = {}   # filename -> ((mtime, size), result)
+
+    def get(self, filename):
+        """
+        Return the result of parsing filename, reading it only if it has
+        changed since the last call.
+
+        :return: a tuple (key, result), where key is the (mtime, size) of
+           the file, or None if the file doesn't exist.
+        """
+        key = _file_key(filename)
+        if key is None:
+            self.__files.pop(filename, None)
+            return None
+
+        entry = self.__files.get(filename)
+        if entry is None or entry[0] != key:
+            entry = (key, self.__read_file(filename))
+            self.__files[filename] = entry
+        return entry
+
+    def clear(self):
+        self.__files.clear()
+
+
+def _read_make_database(filename):
+    """
+    Return the set of targets known to make for filename, as reported by
+    "make -pRrq", or None if make could not be run. The builtin rules are
+    disabled so that only the targets of the Makefile are reported.
+    """
+    try:
+        with open(os.devnull, "w") as null:
+            output = subprocess.Popen(
+                ["make", "-pRrq", "-f", os.path.basename(filename)],
+                cwd=os.path.dirname(filename),
+                stdout=subprocess.PIPE, stderr=null).communicate()[0]
+    except OSError:
+        return None
+
+    targets = set()
+    in_files = False
+    not_a_target = False
+    for line in output.splitlines():
+        if not in_files:
+            in_files = line.startswith("# Files")
+        elif line.startswith("# Not a target"):
+            not_a_target = True
+        elif not line:
+            not_a_target = False   # end of the entry
+        elif not not_a_target and line[0] not in "#\t.%":
+            name, sep, rest = line.partition(":")
+            if sep and not rest.startswith("=") and "%" not in name \
+                    and "=" not in name:
+                targets.update(name.split())
+    return targets or None
+
+
 class Builder:
 
     def compute_buildfile(self):
@@ -202,28 +295,36 @@ class Makefile (Builder):
 
         self.include_matcher = re.compile("^include (?P<file>.*)$")
 
-        self.current_dir = None
-        # The directory of the toplevel makefile. All include statements
-        # are resolved relative to that directory
+        self.index = Target_Index(self.__read_file)
+        # The targets and includes of each file read so far
+
+        self.database = None
+        # The result of the last call to _read_make_database, as a tuple
+        # (files, targets), where files is the list of (name, key) of the
+        # files that were read when it was computed.
 
         Builder.__init__(self)
+        Hook("project_view_changed").add(self.__on_project_view_changed)
+        self.__on_project_view_changed(None)
 
-    def __read_targets(self, filename):
+    def __read_file(self, filename):
         """
-        Return a set of all targets for a given Makefile
-        """
-        if not self.current_dir:
-            self.current_dir = os.path.join(
-                os.getcwd(), os.path.dirname(filename))
-        else:
-            filename = os.path.join(self.current_dir, filename)
+        Parse a single Makefile, without following its include statements.
 
+        :return: a tuple (targets, ignored, includes), where targets is a
+           set of (name, label, description), ignored is the set of the
+           targets marked IGNORE, and includes the list of included files,
+           as written in the Makefile.
+        """
         targets = set()
+        ignored = set()
+        includes = []
         try:
-            f = file(filename)
+            f = open(filename)
         except IOError:
             # Can't read the file
-            return targets
+            return (targets, ignored, includes)
+
         for line in f:
             matches = self.target_matcher.match(line)
             if matches:
@@ -231,6 +332,8 @@ class Makefile (Builder):
                     if matches.group('comments').strip() != "IGNORE":
                         target_name = matches.group('targets')
                         targets.add((target_name, target_name, ''))
+                    else:
+                        ignored.update(matches.group('targets').split())
                 else:
                     # Handle multiple targets on same line
                     for target in matches.group('targets').split():
@@ -239,23 +342,78 @@ class Makefile (Builder):
             else:
                 matches = self.include_matcher.match(line)
                 if matches:
-                    # filenames are relative to the directory of the
-                    # current Makefile
-                    targets.update(
-                        self.__read_targets(matches.group('file')))
+                    includes.append(matches.group('file'))
 
         f.close()
+        return (targets, ignored, includes)
+
+    def __read_targets(self, buildfile, use_database=False):
+        """
+        Return a set of all targets for a given Makefile. This doesn't use
+        the GPS module, so that it can run in a worker thread. Only the
+        files that have changed since the last call are parsed again.
+
+        :param bool use_database: whether to use the targets reported by
+           make -pRrq rather than those found in the files.
+        """
+        # All include statements are resolved relative to the directory
+        # of the toplevel makefile.
+        current_dir = os.path.dirname(os.path.abspath(buildfile))
+
+        targets = set()
+        ignored = set()
+        files = []      # (name, key) of the files read
+        to_visit = [os.path.abspath(buildfile)]
+        visited = set()
+
+        while to_visit:
+            filename = to_visit.pop()
+            if filename in visited:
+                # Include cycle, or file included several times
+                continue
+            visited.add(filename)
+
+            entry = self.index.get(filename)
+            if entry is None:
+                continue
+
+            key, (file_targets, file_ignored, includes) = entry
+            files.append((filename, key))
+            targets.update(file_targets)
+            ignored.update(file_ignored)
+            to_visit.extend(
+                os.path.join(current_dir, f) for f in reversed(includes))
+
+        if use_database:
+            database = self.database
+            if database is None or database[0] != files:
+                names = _read_make_database(os.path.abspath(buildfile))
+                if names is not None:
+                    database = self.database = (files, names)
+            if database is not None:
+                return set((name, name, '')
+                           for name in database[1] if name not in ignored)
+
         return targets
 
+    def __on_project_view_changed(self, hook):
+        """
+        Read the targets through `run_in_worker`, so that they are ready
+        when GPS computes the build targets.
+        """
+        self.compute_buildfile()
+        if self.buildfile:
+            run_in_worker(self.__read_targets, self.buildfile,
+                          Make_Database_Pref.get())
+
     def compute_build_targets(self, name):
         if name == "make":
             self.compute_buildfile()
             if self.buildfile:
-                return sorted(self.__read_targets(self.buildfile))
+                return sorted(self.__read_targets(
+                    self.buildfile, Make_Database_Pref.get()))
         return None
 
-ant_targets = []
-
 
 class Antfile (Builder):
 
@@ -263,16 +421,24 @@ class Antfile (Builder):
         self.pkg_name = "ant"
         self.build_file_attr = "antfile"
         self.default_build_files = ["build.xml"]
+        self.index = Target_Index(self.__read_file)
         Builder.__init__(self)
 
     def read_targets(self):
-        global ant_targets
+        entry = self.index.get(self.buildfile)
+        if entry is None:
+            return []
+        return entry[1]
+
+    def __read_file(self, filename):
+        """
+        Parse an ant build file and return the list of its targets.
+        """
         ant_targets = []
 
         class MySaxDocumentHandler (handler.ContentHandler):
 
             def startElement(self, name, attrs):
-                global ant_targets
                 if name == "target":
                     target = None
                     description = ''
@@ -281,11 +447,11 @@ class Antfile (Builder):
                             target = attrs.get(attrName)
                         if attrName == "description":
                             description = attrs.get(attrName)
-                    ant_targets += [(str(target), description, '')]
+                    ant_targets.append((str(target), description, ''))
 
         parser = make_parser()
         parser.setContentHandler(MySaxDocumentHandler())
-        inFile = open(self.buildfile, 'r')
+        inFile = open(filename, 'r')
 
         parser.parse(inFile)
 
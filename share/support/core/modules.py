@@ -41,11 +41,18 @@ the module does not get to call :func:`GPS.MDI.add`, and as such the modules
 :func:`save_desktop` function is never called by default. To work around this,
 you need to pass your module's :func:`_save_desktop` (note the leading
 underscore) as a parameter to :func:`GPS.Browsers.View.create`.
+
+By default, the modules are setup as part of the "gps_started" hook, which
+delays the moment GPS becomes usable. Modules that are not needed right
+away should set their :attr:`Module.setup_mode` to "idle" or "lazy". The
+time spent setting up each module is logged in the MODULES.STARTUP trace.
 """
 
 
 import GPS
 import gps_utils
+import time
+import traceback
 
 try:
     # While building the doc, we might not have access to this module
@@ -68,6 +75,16 @@ class Module_Metaclass(type):
     modules = []
     modules_instances = []
 
+    idle_queue = []
+    # The modules whose setup_mode is "idle" and that have not been setup
+    # yet, in the order they were registered.
+
+    setup_times = []
+    # The modules that have been setup, as (name, mode, seconds), in the
+    # order they were setup. See log_startup_report.
+
+    logger = GPS.Logger("MODULES.STARTUP")
+
     def __new__(cls, name, bases, attrs):
         new_class = type.__new__(cls, name, bases, attrs)
 
@@ -79,15 +96,109 @@ class Module_Metaclass(type):
             if Module_Metaclass.gps_started:
                 inst = new_class()
                 Module_Metaclass.modules_instances.append(inst)
-                GLib.idle_add(lambda: inst._setup())
 
-                # Simulate running the gps_started hook
-                pref = getattr(inst, "gps_started", None)
-                if pref:
-                    pref()
+                # Simulate running the gps_started hook, once the module
+                # has been setup
+                inst._simulate_gps_started = True
+
+                if inst.setup_mode == "startup":
+                    GLib.idle_add(
+                        lambda: Module_Metaclass.setup_module(inst))
+                else:
+                    Module_Metaclass.__defer_setup(inst)
 
         return new_class
 
+    @staticmethod
+    def setup_module(inst):
+        """
+        Setup inst, unless this was already done, and record how long it
+        took. If the setup raises an exception, it is tried again the next
+        time the module is needed.
+
+        :param Module inst: the module to setup.
+        """
+        if inst._setup_done or inst._setup_running:
+            return
+
+        inst._setup_running = True
+        try:
+            start = time.time()
+            inst._setup()
+            elapsed = time.time() - start
+        finally:
+            inst._setup_running = False
+        inst._setup_done = True
+
+        if inst._simulate_gps_started:
+            pref = getattr(inst, "gps_started", None)
+            if pref:
+                pref()
+
+        Module_Metaclass.setup_times.append(
+            (inst.name(), inst.setup_mode, elapsed))
+        Module_Metaclass.logger.log(
+            "setup %s (%s): %.1fms" % (
+                inst.name(), inst.setup_mode, elapsed * 1000))
+
+    @staticmethod
+    def __defer_setup(inst):
+        """
+        Prepare the setup of a module whose setup_mode is "idle" or "lazy".
+        """
+        if inst.setup_mode == "idle":
+            Module_Metaclass.idle_queue.append(inst)
+            if len(Module_Metaclass.idle_queue) == 1:
+                GLib.idle_add(Module_Metaclass.__setup_next_idle_module)
+        else:
+            inst._connect_setup_hooks()
+
+    @staticmethod
+    def __setup_next_idle_module():
+        """
+        Setup the first module in the idle queue. Only one module is setup
+        at a time, so that GPS can process events in between.
+
+        :return: whether there are more modules to setup.
+        """
+        queue = Module_Metaclass.idle_queue
+        if queue:
+            inst = queue.pop(0)
+            try:
+                Module_Metaclass.setup_module(inst)
+            except Exception:
+                GPS.Logger('MODULES').log(
+                    'While setting up %s: %s' % (
+                        inst.name(), traceback.format_exc()))
+
+        if queue:
+            return True
+
+        Module_Metaclass.log_startup_report()
+        return False
+
+    @staticmethod
+    def log_startup_report():
+        """
+        Log the time spent in the setup of each module, the slowest first,
+        in the MODULES.STARTUP trace.
+        """
+        logger = Module_Metaclass.logger
+        if not logger.active:
+            return
+
+        total = {}
+        for name, mode, elapsed in Module_Metaclass.setup_times:
+            total[mode] = total.get(mode, 0.0) + elapsed
+        logger.log("modules setup: %s" % ", ".join(
+            "%s %.1fms" % (mode, seconds * 1000)
+            for mode, seconds in sorted(total.items())))
+
+        for name, mode, elapsed in sorted(
+                Module_Metaclass.setup_times,
+                key=lambda t: t[2], reverse=True):
+            logger.log("  %8.1fms %-7s %s" % (elapsed * 1000, mode, name))
+
     @staticmethod
     def setup_all_modules(hook):
         if not Module_Metaclass.gps_started:
@@ -95,7 +206,13 @@ class Module_Metaclass(type):
             for ModuleClass in Module_Metaclass.modules:
                 inst = ModuleClass()
                 Module_Metaclass.modules_instances.append(inst)
-                inst._setup()
+                if inst.setup_mode == "startup":
+                    Module_Metaclass.setup_module(inst)
+                else:
+                    Module_Metaclass.__defer_setup(inst)
+
+            if not Module_Metaclass.idle_queue:
+                Module_Metaclass.log_startup_report()
 
     @staticmethod
     def load_desktop(name, data):
@@ -161,6 +278,35 @@ class Module(object):
     # the name of your class, but you can override this as a class attribute
     # or in __init__
 
+    setup_mode = "startup"
+    # When setup() is called:
+    #   "startup": as part of the gps_started hook, before GPS is usable.
+    #   "idle": after GPS has started, when it is idle. The modules are
+    #      setup one at a time, in the order they were declared.
+    #   "lazy": the first time the module is needed, i.e. when one of the
+    #      hooks in setup_on_hooks is run, or when its view is opened or
+    #      restored from the desktop.
+    # The time spent in setup() is logged in the MODULES.STARTUP trace.
+
+    setup_on_hooks = ()
+    # For a "lazy" module, the hooks that trigger its setup. The methods
+    # of the module connected to these hooks (see auto_connect_hooks) might
+    # not be called for the run of the hook that triggered the setup.
+
+    _setup_done = False
+    # Whether setup() has been called and succeeded
+
+    _setup_running = False
+    # Whether setup() is being called, so that it is not called again if it
+    # needs the module's view
+
+    _simulate_gps_started = False
+    # Whether the module was defined after GPS had started, in which case
+    # its gps_started method is called after setup()
+
+    __hooks_connected = False
+    # Whether the methods have been connected to auto_connect_hooks
+
     def setup(self):
         """
         This function should be overridden in your own class if you need to
@@ -293,6 +439,19 @@ class Module(object):
         if p:
             GPS.Hook(hook_name).remove(p)
 
+    def _connect_setup_hooks(self):
+        """
+        Setup a "lazy" module the first time one of setup_on_hooks runs.
+        The callbacks are not removed afterwards, since this could happen
+        while GPS is running the hook, but they do nothing once the module
+        has been setup.
+        """
+        def on_hook(*args, **kwargs):
+            Module_Metaclass.setup_module(self)
+
+        for h in self.setup_on_hooks:
+            GPS.Hook(h).add(on_hook)
+
     #########################################
     # Views
     #########################################
@@ -302,7 +461,9 @@ class Module(object):
         Internal version of setup
         """
 
-        self.__connect_hooks()
+        if not self.__hooks_connected:
+            self.__connect_hooks()
+            self.__hooks_connected = True
         if not self.view_title:
             self.view_title = self.__class__.__name__.replace("_", " ")
         self.setup()
@@ -318,6 +479,7 @@ class Module(object):
     def _teardown(self):
         for h in self.auto_connect_hooks:
             self.__disconnect_hook(h)
+        self.__hooks_connected = False
         self.teardown()
 
     def name(self):
@@ -331,6 +493,7 @@ class Module(object):
 
     def _load_desktop(self, name, data):
         if name == self.name():
+            Module_Metaclass.setup_module(self)
             try:
                 c = self.load_desktop(data)
                 if not c:
@@ -348,6 +511,7 @@ class Module(object):
         :return: an instance of GPS.MDIWindow
         """
 
+        Module_Metaclass.setup_module(self)
         if self.view_title:
             child = GPS.MDI.get(self.view_title)
             if child:
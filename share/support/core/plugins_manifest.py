@@ -0,0 +1,243 @@
+"""
+This plugin measures the time spent importing each plugin at startup, and
+defers the import of the plugins listed in `Manifest` until they are
+needed.
+
+GPS imports every plugin found in its support and plug-ins directories
+when it starts, even when the tool they support is not installed. The
+plugins listed in `Manifest` are only imported at startup if one of their
+executables is found on the PATH. Otherwise, they are imported the first
+time the project uses one of their languages, a file in one of these
+languages is opened, or one of their hooks is run.
+
+This module is loaded by GPS before any other plugin, so that it can
+install an import hook (see PEP 302). The import times are logged in the
+MODULES.STARTUP trace once GPS has started, the slowest first.
+"""
+
+import GPS
+import imp
+import importlib
+import os_utils
+import sys
+import time
+import traceback
+
+logger = GPS.Logger("MODULES.STARTUP")
+
+Import_Budget_Ms = 100
+# Plugins that take longer than this to import are reported as over budget
+
+
+class Deferred_Plugin(object):
+    """
+    Describes when a plugin needs to be imported.
+    """
+
+    def __init__(self, executables=(), languages=(), hooks=()):
+        """
+        :param list[str] executables: the plugin is imported at startup if
+           one of these is found on the PATH.
+        :param list[str] languages: the plugin is imported when the project
+           uses one of these languages, or a file in one of them is opened.
+        :param list[str] hooks: the plugin is imported the first time one
+           of these hooks is run.
+        """
+        self.executables = executables
+        self.languages = languages
+        self.hooks = hooks
+
+    def has_executables(self):
+        """
+        Whether one of the executables is found on the PATH.
+
+        :rtype: bool
+        """
+        return any(os_utils.locate_exec_on_path(e) for e in self.executables)
+
+    def uses_languages(self):
+        """
+        Whether the project uses one of the languages.
+
+        :rtype: bool
+        """
+        if not self.languages:
+            return False
+        try:
+            used = GPS.Project.root().languages(recursive=True)
+        except GPS.Exception:
+            # No project loaded yet
+            return False
+        return any(lang in used for lang in self.languages)
+
+
+Manifest = {
+    "spark2014": Deferred_Plugin(executables=["gnatprove"]),
+    "codepeer": Deferred_Plugin(executables=["codepeer"]),
+    "gnathub": Deferred_Plugin(executables=["gnathub"]),
+    "gnatstack": Deferred_Plugin(executables=["gnatstack"]),
+    "pep8_integration": Deferred_Plugin(languages=["python"]),
+}
+# The plugins whose import can be deferred. These plugins should not
+# define project attributes nor rely on the "gps_started" hook, since they
+# might be imported after the project has been loaded.
+
+
+class Plugins_Importer(object):
+    """
+    An import hook (see PEP 302) that records how long each top-level module
+    takes to import, and replaces the plugins in `Manifest` with an empty
+    module when they are not needed yet.
+    There is a single instance of this class, `importer`.
+    """
+
+    def __init__(self):
+        self.import_times = []
+        # The modules imported so far, as (name, total, own, depth), where
+        # total includes the nested imports and own does not.
+
+        self.deferred = {}
+        # The plugins whose import was deferred: name -> Deferred_Plugin
+
+        self.__importing = set()   # the modules being imported
+        self.__nested = []         # time spent in nested imports
+
+    def install(self):
+        """
+        Start monitoring imports. This is done before GPS loads the plugins.
+        """
+        sys.meta_path.insert(0, self)
+        GPS.Hook("project_view_changed").add(self.__on_project_view_changed)
+        GPS.Hook("gps_started").add(self.__on_gps_started)
+
+    def find_module(self, fullname, path=None):
+        """
+        Part of the PEP 302 protocol. Only top-level modules are monitored.
+        """
+        if path is None and fullname not in self.__importing:
+            return self
+        return None
+
+    def load_module(self, fullname):
+        """
+        Part of the PEP 302 protocol.
+        """
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+
+        plugin = Manifest.get(fullname)
+        if plugin is not None and not plugin.has_executables():
+            return self.__defer(fullname, plugin)
+
+        return self.__import(fullname)
+
+    def __import(self, fullname):
+        """
+        Import a module and record how long it took.
+        """
+        self.__importing.add(fullname)
+        self.__nested.append(0.0)
+        start = time.time()
+        try:
+            # Calls find_module again, which lets the default import
+            # mechanism find the module this time.
+            module = importlib.import_module(fullname)
+        finally:
+            elapsed = time.time() - start
+            nested = self.__nested.pop()
+            if self.__nested:
+                self.__nested[-1] += elapsed
+            self.__importing.discard(fullname)
+
+        self.import_times.append(
+            (fullname, elapsed, elapsed - nested, len(self.__nested)))
+        return module
+
+    def __defer(self, fullname, plugin):
+        """
+        Put an empty module in place of a plugin that is not needed yet.
+        """
+        logger.log("deferring the import of %s" % (fullname, ))
+        self.deferred[fullname] = plugin
+
+        for h in plugin.hooks:
+            GPS.Hook(h).add(
+                lambda *args, **kwargs: self.__import_deferred(fullname))
+
+        if plugin.languages:
+            def on_file_edited(hook, file):
+                if file.language().lower() in plugin.languages:
+                    self.__import_deferred(fullname)
+
+            GPS.Hook("file_edited").add(on_file_edited)
+
+        module = imp.new_module(fullname)
+        module.__doc__ = "Not imported yet, see plugins_manifest.py"
+        sys.modules[fullname] = module
+        return module
+
+    def __import_deferred(self, fullname):
+        """
+        Import a plugin whose import was deferred, if not done yet.
+        """
+        if self.deferred.pop(fullname, None) is None:
+            return
+
+        logger.log("importing deferred plugin %s" % (fullname, ))
+        if sys.modules.get(fullname) is not None and \
+                not hasattr(sys.modules[fullname], "__file__"):
+            del sys.modules[fullname]
+
+        try:
+            self.__import(fullname)
+        except Exception:
+            GPS.Console("Messages").write(
+                "While importing %s:\n%s" % (
+                    fullname, traceback.format_exc()),
+                mode="error")
+
+    def __on_project_view_changed(self, hook):
+        for name, plugin in self.deferred.items():
+            if plugin.uses_languages() or plugin.has_executables():
+                self.__import_deferred(name)
+
+    def __on_gps_started(self, hook):
+        """
+        All the plugins have been loaded: stop monitoring imports, and
+        remove the empty modules so that the deferred plugins can still be
+        imported from the Python console.
+        """
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+        for name in self.deferred:
+            module = sys.modules.get(name)
+            if module is not None and not hasattr(module, "__file__"):
+                del sys.modules[name]
+
+        self.log_report()
+
+    def log_report(self):
+        """
+        Log the time spent importing each module, the slowest first.
+        The time of a module does not include the modules it imports, which
+        are reported separately.
+        """
+        if not logger.active:
+            return
+
+        total = sum(t for _, t, _, depth in self.import_times if depth == 0)
+        logger.log("imported %d modules in %.1fms, deferred: %s" % (
+            len(self.import_times), total * 1000,
+            ", ".join(sorted(self.deferred)) or "none"))
+
+        for name, elapsed, own, depth in sorted(
+                self.import_times, key=lambda t: t[2], reverse=True):
+            logger.log("  %8.1fms (%8.1fms with imports) %s%s" % (
+                own * 1000, elapsed * 1000, name,
+                " over budget" if depth == 0 and
+                elapsed * 1000 > Import_Budget_Ms else ""))
+
+
+importer = Plugins_Importer()
+importer.install()
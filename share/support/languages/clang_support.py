@@ -95,6 +95,9 @@ class Clang(object):
 
 class Clang_Module(Module):
 
+    setup_mode = "idle"
+    # Loading libclang is not needed to start GPS
+
     clang_instance = None
 
     def is_on(self):
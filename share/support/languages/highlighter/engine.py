@@ -4,11 +4,17 @@ from modules import Module
 try:
     # While building the doc, we might not have gi.repository
     from gi.repository import Gtk, GLib, Gdk, Pango
-    from pygps import get_gtk_buffer, is_editor_visible
+    from pygps import get_gtk_buffer, get_visible_lines, is_editor_visible
 except ImportError:
     pass
 
+import hashlib
+import json
+import os
 import re
+import sre_constants
+import sre_parse
+from bisect import bisect_left, bisect_right
 from time import time
 
 
@@ -168,6 +174,230 @@ def propagate_change(pref):
         pref.tag.set_property("style", Pango.Style.NORMAL)
         pref.tag.set_property("weight", Pango.Weight.NORMAL)
 
+############
+# Tag runs #
+############
+
+def merge_runs(results):
+    """
+    Group highlighting results by tag, as sorted lists of disjoint runs,
+    merging the runs of a tag that overlap or are adjacent.
+
+    :param results: list of (tag, start offset, end offset), as returned by
+      Highlighter.highlight_info_gen.
+    :rtype: dict[Gtk.TextTag, list[(int, int)]]
+    """
+    runs = {}
+    for tag, start, end in results:
+        if tag and start < end:
+            runs.setdefault(tag, []).append((start, end))
+
+    for tag, tag_runs in runs.items():
+        tag_runs.sort()
+        merged = [tag_runs[0]]
+        for start, end in tag_runs:
+            if start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        runs[tag] = merged
+
+    return runs
+
+
+def subtract_runs(runs, other):
+    """
+    Return the parts of runs that are not covered by other. Both are
+    sorted lists of disjoint runs.
+
+    :type runs: list[(int, int)]
+    :type other: list[(int, int)]
+    :rtype: list[(int, int)]
+    """
+    result = []
+    i = 0
+    for start, end in runs:
+        while i < len(other) and other[i][1] <= start:
+            i += 1
+        j = i
+        while start < end and j < len(other) and other[j][0] < end:
+            if other[j][0] > start:
+                result.append((start, other[j][0]))
+            start = max(start, other[j][1])
+            j += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def tag_runs_in_range(gtk_ed, tag, start, end):
+    """
+    Return the runs of text between the start and end offsets where tag is
+    applied, clipped to that range.
+
+    :type gtk_ed: Gtk.TextBuffer
+    :type tag: Gtk.TextTag
+    :type start: int
+    :type end: int
+    :rtype: list[(int, int)]
+    """
+    runs = []
+    gtk_iter = gtk_ed.get_iter_at_offset(start)
+    run_start = start if gtk_iter.has_tag(tag) else None
+
+    while gtk_iter.forward_to_tag_toggle(tag):
+        offset = gtk_iter.get_offset()
+        if run_start is None:
+            if offset >= end:
+                break
+            run_start = offset
+        else:
+            runs.append((run_start, min(offset, end)))
+            run_start = None
+            if offset >= end:
+                break
+
+    if run_start is not None:
+        runs.append((run_start, end))
+    return runs
+
+
+#######################
+# Grammar compilation #
+#######################
+
+# The characters that can start a match for each category of a character
+# class, when matching ASCII text only.
+category_chars = {
+    sre_constants.CATEGORY_DIGIT: "0123456789",
+    sre_constants.CATEGORY_SPACE: " \t\n\r\f\v",
+    sre_constants.CATEGORY_WORD:
+        "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_",
+}
+
+repeat_ops = tuple(getattr(sre_constants, name) for name in
+                   ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+                   if hasattr(sre_constants, name))
+
+zero_width_ops = tuple(getattr(sre_constants, name) for name in
+                       ("AT", "ASSERT", "ASSERT_NOT")
+                       if hasattr(sre_constants, name))
+
+
+def parsed_state(parsed):
+    """
+    Return the state (flags and groups) of a parsed regexp
+    :type parsed: sre_parse.SubPattern
+    """
+    return getattr(parsed, "state", None) or parsed.pattern
+
+
+def charset_first_chars(items, flags):
+    """
+    Return the set of characters matched by the items of a character
+    class, or None if they cannot be enumerated.
+
+    :param items: list of (op, av) as returned by sre_parse
+    :rtype: set[str]|None
+    """
+    result = set()
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            result.add(av)
+        elif op is sre_constants.RANGE and av[1] - av[0] < 128:
+            result.update(range(av[0], av[1] + 1))
+        elif (op is sre_constants.CATEGORY and av in category_chars
+              and not flags & sre_constants.SRE_FLAG_UNICODE):
+            result.update(ord(c) for c in category_chars[av])
+        else:
+            return None
+    return result
+
+
+def first_chars(items, flags):
+    """
+    Return the set of character codes a sequence of parsed regexp items can
+    start with, or None if it is unknown, and whether the sequence can
+    match the empty string.
+
+    :param items: list of (op, av) as returned by sre_parse
+    :rtype: (set[int]|None, bool)
+    """
+    result = set()
+    for op, av in items:
+        nullable = False
+
+        if op is sre_constants.LITERAL:
+            first = set([av])
+        elif op is sre_constants.IN:
+            first = charset_first_chars(av, flags)
+        elif op is sre_constants.SUBPATTERN:
+            first, nullable = first_chars(av[-1], flags)
+        elif op is sre_constants.BRANCH:
+            first = set()
+            for alternative in av[1]:
+                alt_first, alt_nullable = first_chars(alternative, flags)
+                if alt_first is None:
+                    return None, False
+                first |= alt_first
+                nullable = nullable or alt_nullable
+        elif op in repeat_ops:
+            first, nullable = first_chars(av[2], flags)
+            nullable = nullable or av[0] == 0
+        elif op in zero_width_ops:
+            first, nullable = set(), True
+        else:
+            first = None
+
+        if first is None:
+            return None, False
+
+        result |= first
+        if not nullable:
+            return result, False
+
+    return result, True
+
+
+def compile_grammar(patterns, flags):
+    """
+    Compile the alternation of patterns used by a SubHighlighter. Each
+    pattern is put in its own group, and the alternation is preceded by a
+    lookahead on the characters that can start a match when those can be
+    computed, so that the regexp engine skips other positions quickly.
+
+    :param list[str] patterns: The patterns of the matchers.
+    :param int flags: The flags of the regexp.
+    :return: The pattern and flags to pass to re.compile, and the list of
+      the indexes of the matcher for each group of the pattern (None for
+      groups that are nested in a matcher's pattern).
+    :rtype: ((str, int), list[int|None])
+    """
+    dispatch = [None]
+    chars = set()
+
+    for index, pat in enumerate(patterns):
+        parsed = sre_parse.parse(pat, flags)
+        dispatch.append(index)
+        dispatch.extend([None] * (parsed_state(parsed).groups - 1))
+
+        if chars is not None:
+            first, nullable = first_chars(parsed, parsed_state(parsed).flags)
+            chars = None if (first is None or nullable) else chars | first
+
+    pattern = "|".join("({0})".format(pat) for pat in patterns)
+
+    if chars and max(chars) < 128:
+        chars = set(chr(c) for c in chars)
+        if flags & re.I:
+            chars |= set(c.swapcase() for c in chars)
+        pattern = "(?=[{0}])(?:{1})".format(
+            "".join(re.escape(c) for c in sorted(chars)), pattern)
+
+    return [pattern, flags], dispatch
+
+
 # Data classes for highlighters
 
 
@@ -294,11 +524,70 @@ class RegionRef(BaseMatcher):
 
 
 class HighlighterStacks(object):
+    """
+    The stacks of highlighters at the start of every line of a buffer.
+
+    Consecutive lines almost always share the same stack, so the stacks are
+    stored as runs of lines, in a gap buffer: the runs before the gap are
+    indexed by their start line, and the runs after the gap by their
+    distance to the end of the buffer, in reverse order. Inserting or
+    deleting lines at the gap thus never needs to renumber the other runs,
+    and the gap follows the edits and the lexer, which both have a strong
+    locality.
+    """
 
     def __init__(self):
         # The stack of highlighter at (0, 0) is necessarily the empty stack,
         # so the stack list comes prepopulated with one empty stack
-        self.stacks_list = [()]
+        self.nb_lines = 1
+
+        # Runs before the gap: start line and stack, in increasing order
+        self.left_starts = [0]
+        self.left_stacks = [()]
+
+        # Runs after the gap: nb_lines - start line and stack, in
+        # decreasing order of start line
+        self.right_ends = []
+        self.right_stacks = []
+
+    def __len__(self):
+        return self.nb_lines
+
+    def __gap_line(self):
+        """
+        The start line of the first run after the gap
+        :rtype: int
+        """
+        if self.right_ends:
+            return self.nb_lines - self.right_ends[-1]
+        return self.nb_lines
+
+    def __move_gap(self, line):
+        """
+        Move the gap so that the last run before it contains line
+        :type line: int
+        """
+        while self.left_starts[-1] > line:
+            self.right_ends.append(self.nb_lines - self.left_starts.pop())
+            self.right_stacks.append(self.left_stacks.pop())
+
+        while self.right_ends and self.__gap_line() <= line:
+            self.left_starts.append(self.nb_lines - self.right_ends.pop())
+            self.left_stacks.append(self.right_stacks.pop())
+
+    def __split_at(self, line):
+        """
+        Move the gap to line, splitting the run that contains it if needed,
+        so that all runs after the gap start at line or later.
+        :type line: int
+        """
+        self.__move_gap(line)
+        if line < self.nb_lines:
+            self.right_ends.append(self.nb_lines - line)
+            self.right_stacks.append(self.left_stacks[-1])
+            if self.left_starts[-1] == line:
+                self.left_starts.pop()
+                self.left_stacks.pop()
 
     def set(self, index, stack):
         """
@@ -309,46 +598,102 @@ class HighlighterStacks(object):
         :type stack: tuple[Struct]
         @rtype:      bool
         """
-        assert 0 <= index <= len(self.stacks_list)
+        assert 0 <= index <= self.nb_lines
 
         tpstack = tuple(stack)
-        if index == len(self.stacks_list):
-            self.stacks_list.append(tpstack)
+        self.__move_gap(index)
+
+        if index == self.nb_lines:
+            self.nb_lines += 1
+            if self.left_stacks[-1] != tpstack:
+                self.left_starts.append(index)
+                self.left_stacks.append(tpstack)
             return False
+
+        current_stack = self.left_stacks[-1]
+        if tpstack == current_stack:
+            return True
+
+        # Isolate line index in its own run
+        if index + 1 < self.__gap_line():
+            self.right_ends.append(self.nb_lines - index - 1)
+            self.right_stacks.append(current_stack)
+
+        if self.left_starts[-1] == index:
+            self.left_stacks[-1] = tpstack
         else:
-            current_stack = self.stacks_list[index]
-            self.stacks_list[index] = tpstack
-            return tpstack == current_stack
+            self.left_starts.append(index)
+            self.left_stacks.append(tpstack)
+
+        # Merge with the neighbouring runs
+        if self.right_stacks and self.right_stacks[-1] == tpstack:
+            self.right_ends.pop()
+            self.right_stacks.pop()
+
+        if len(self.left_stacks) > 1 and self.left_stacks[-2] == tpstack:
+            self.left_starts.pop()
+            self.left_stacks.pop()
+
+        return False
 
     def get(self, start_line):
         """
         :type start_line: int
         @rtype:           tuple[Struct]|None
         """
-        if start_line < len(self.stacks_list):
-            return self.stacks_list[start_line][:]
-        else:
+        if start_line >= self.nb_lines:
             return None
+        elif start_line < self.__gap_line():
+            return self.left_stacks[
+                bisect_right(self.left_starts, start_line) - 1]
+        else:
+            return self.right_stacks[
+                bisect_left(self.right_ends, self.nb_lines - start_line)]
 
     def insert_newlines(self, nb_lines, after_line):
         """
         :type after_line: int
         :type nb_lines:   int
         """
-        for _ in range(nb_lines):
-            self.stacks_list.insert(after_line + 1, ())
+        if nb_lines <= 0:
+            return
+
+        line = min(after_line + 1, self.nb_lines)
+        self.__split_at(line)
+        self.nb_lines += nb_lines
+
+        if self.left_stacks[-1] != ():
+            self.left_starts.append(line)
+            self.left_stacks.append(())
+
+        if self.right_stacks and self.right_stacks[-1] == ():
+            self.right_ends.pop()
+            self.right_stacks.pop()
 
     def delete_lines(self, nb_deleted_lines, at_line):
         """
         :param nb_deleted_lines: int
         :param at_line: int
         """
-        del self.stacks_list[at_line + 1:at_line + nb_deleted_lines + 1]
+        first = at_line + 1
+        last = min(first + nb_deleted_lines, self.nb_lines)
+        if first >= last:
+            return
+
+        self.__split_at(last)
+        while self.left_starts[-1] >= first:
+            self.left_starts.pop()
+            self.left_stacks.pop()
+        self.nb_lines -= last - first
+
+        if self.right_stacks and self.right_stacks[-1] == self.left_stacks[-1]:
+            self.right_ends.pop()
+            self.right_stacks.pop()
 
     def __str__(self):
         return "{0}".format(
-            "\n".join(["{0}\t{1}".format(num, [c for c in stack])
-                       for num, stack in enumerate(self.stacks_list)])
+            "\n".join(["{0}\t{1}".format(num, [c for c in self.get(num)])
+                       for num in range(self.nb_lines)])
         )
 
 
@@ -361,21 +706,51 @@ class SubHighlighter(object):
         """
 
         self.matchers = [m.resolve() for m in highlighter_spec]
-        patterns = [m.pattern for m in self.matchers]
+        self.patterns = [m.pattern for m in self.matchers]
 
         if stop_pattern:
-            patterns.append(stop_pattern)
+            self.patterns.append(stop_pattern)
             self.matchers.append(None)
 
-        self.pattern = re.compile(
-            "|".join("({0})".format(pat) for pat in patterns),
-            flags=re.M + (re.S if matchall else 0) +
-            (re.I if igncase else 0)
-        )
+        self.flags = (re.M + (re.S if matchall else 0) +
+                      (re.I if igncase else 0))
+
+        # Compiled lazily by compile(), the first time the highlighter is
+        # used.
+        self.pattern = None
+        self.dispatch = None
+
         self.gtk_tag = None
         self.region_start = None
         self.parent_cat = None
 
+    def compile(self, cached=None):
+        """
+        Compile the pattern of the highlighter, reusing the compiled form
+        from a cache if available.
+
+        :param cached: The result of compile_grammar, if cached.
+        :return: The result of compile_grammar.
+        """
+        if not cached:
+            cached = compile_grammar(self.patterns, self.flags)
+        (pattern, flags), self.dispatch = cached
+        self.pattern = re.compile(pattern, flags)
+        return cached
+
+    def get_matchers_by_group(self, gtk_ed):
+        """
+        Return, for each group of the pattern, the matcher and tag to use
+        when this group matches.
+
+        :type gtk_ed: Gtk.TextBuffer
+        :rtype: list[(Matcher, Gtk.TextTag)|None]
+        """
+        tags = self.get_tags_list(gtk_ed)
+        return [None if index is None else
+                (self.matchers[index], tags[index])
+                for index in self.dispatch]
+
     def get_tags_list(self, gtk_ed):
         """
         :type gtk_ed: Gtk.TextBuffer
@@ -392,21 +767,115 @@ class SubHighlighter(object):
 
 class Highlighter(object):
 
-    def __init__(self, spec=(), igncase=False):
+    # Number of lines past the end of the viewport that are highlighted
+    # synchronously after an edit
+    viewport_margin = 50
+
+    # Maximum number of lines highlighted synchronously after an edit, when
+    # the dirty range starts far above the viewport
+    max_sync_lines = 2000
+
+    # Number of lines lexed at a time by the idle highlighting
+    idle_batch_lines = 200
+
+    # Time budget in milliseconds of one idle highlighting callback
+    idle_budget_ms = 10
+
+    # Part of the hash of the cached grammars: change it when the format of
+    # the cache changes. The cache only contains regexp strings, it does not
+    # depend on the internals of the Python version.
+    cache_format = "patterns-1"
+
+    def __init__(self, spec=(), igncase=False, language=None):
         """
         :type spec: Iterable[BaseMatcher]
+        :param str language: The language highlighted, used to cache the
+          compiled grammar across sessions.
         :return:
         """
         self.root_highlighter = SubHighlighter(spec, igncase=igncase)
         self.sync_stop = False
+        self.language = language
+        self.compiled = False
+
+    def sub_highlighters(self):
+        """
+        Return all the sub highlighters reachable from the root one
+        :rtype: list[SubHighlighter]
+        """
+        result = [self.root_highlighter]
+        seen = set(result)
+        for hl in result:
+            for m in hl.matchers:
+                if isinstance(m, RegionMatcher) and \
+                        m.subhighlighter not in seen:
+                    seen.add(m.subhighlighter)
+                    result.append(m.subhighlighter)
+        return result
+
+    def spec_hash(self):
+        """
+        Return a hash identifying the grammar of this highlighter, and the
+        format of the cache.
+        :rtype: str
+        """
+        h = hashlib.sha1(self.cache_format.encode("utf-8"))
+        for hl in self.sub_highlighters():
+            h.update(json.dumps([hl.patterns, hl.flags]).encode("utf-8"))
+        return h.hexdigest()
 
-    def highlight_info_gen(self, gtk_ed, start_line, end_line=0):
+    def compile(self):
+        """
+        Compile the patterns of all the sub highlighters. The combined
+        patterns and their dispatch tables are cached in the GPS home
+        directory, keyed by the hash of the spec, so that they are only
+        computed once for each language.
+        """
+        if self.compiled:
+            return
+
+        cache_file = None
+        spec_hash = None
+        cached = []
+
+        if self.language:
+            cache_file = os.path.join(
+                GPS.get_home_dir(), "highlighter_cache",
+                "{0}.json".format(re.sub(r"\W", "_", self.language)))
+            spec_hash = self.spec_hash()
+            try:
+                with open(cache_file) as f:
+                    data = json.load(f)
+                if data["hash"] == spec_hash:
+                    cached = data["grammars"]
+            except Exception:
+                pass
+
+        hls = self.sub_highlighters()
+        grammars = [hl.compile(cached[i] if i < len(cached) else None)
+                    for i, hl in enumerate(hls)]
+        self.compiled = True
+
+        if cache_file and len(cached) != len(hls):
+            try:
+                if not os.path.isdir(os.path.dirname(cache_file)):
+                    os.makedirs(os.path.dirname(cache_file))
+                with open(cache_file, "w") as f:
+                    json.dump({"hash": spec_hash, "grammars": grammars}, f)
+            except Exception as e:
+                GPS.Logger("HIGHLIGHTER").log(
+                    "Cannot save the grammar cache: %s" % e)
+
+    def highlight_info_gen(self, gtk_ed, start_line, end_line=0,
+                           min_stop_line=-1):
         """
         Returns a generator that will highlight the buffer, one token at a
         time, every time the generator is consumed.
 
         :type gtk_ed: Gtk.TextBuffer
         :type start_line: int
+        :param int min_stop_line: Lexing does not stop when the stacks get
+          back in sync on lines up to and including this one.
         """
         self.sync_stop = False
 
@@ -442,21 +911,19 @@ class Highlighter(object):
             matches = hl.pattern.finditer(strn, match_offset)
 
             # Cache tags
-            tags = hl_tags.get(hl, None)
-            if not tags:
-                tags = hl.get_tags_list(gtk_ed)
-                hl_tags[hl] = tags
+            by_group = hl_tags.get(hl, None)
+            if not by_group:
+                by_group = hl.get_matchers_by_group(gtk_ed)
+                hl_tags[hl] = by_group
 
             pop_stack = True
             met_stop_pattern = False
 
             for m in matches:
 
-                # Get the index of the first matching category
-                i = [j for j in range(1, len(hl.matchers) + 1)
-                     if m.span(j) != null_span][0]
-
-                matcher, tag = hl.matchers[i - 1], tags[i - 1]
+                # The group of the matching category is the last closed one
+                i = m.lastindex
+                matcher, tag = by_group[i]
                 start_line += strn.count("\n",
                                          last_start_offset, m.start(i))
                 last_start_offset = m.start(i)
@@ -470,7 +937,8 @@ class Highlighter(object):
 
                     # We exit because the stack we're setting is == to the
                     # existing one, so the buffer is synced
-                    if gtk_ed.stacks.set(current_line, subhl_stack):
+                    if (gtk_ed.stacks.set(current_line, subhl_stack) and
+                            current_line > min_stop_line):
                         endi = gtk_ed.get_iter_at_line(current_line)
                         endi.backward_char()
                         endo = endi.get_offset()
@@ -534,63 +1002,187 @@ class Highlighter(object):
         results.append((None, end_offset, end_offset))
         return results
 
-    def highlight_gen(self, gtk_ed, start_line=-1):
+    def highlight_gen(self, gtk_ed, start_line=-1, end_line=0,
+                      min_stop_line=-1):
         """
+        Highlight the whole buffer if start_line is -1, else the lines from
+        start_line up to end_line (the end of the buffer if 0), stopping
+        early once the stacks are in sync again past min_stop_line.
+
         :type gtk_ed: Gtk.TextBuffer
         :type start_line: int
+        :type end_line: int
+        :type min_stop_line: int
+        :return: The first line that still needs to be highlighted, or None
+          if the rest of the buffer is up to date.
+        :rtype: int|None
         """
-        # t = time()
-        start_it = gtk_ed.get_start_iter()
-        end_it = gtk_ed.get_start_iter()
-
         if start_line == -1:
-            for tag, start, end in self.highlight_info_gen(gtk_ed, 0):
-                if tag:
-                    start_it.set_offset(start)
-                    end_it.set_offset(end)
-                    gtk_ed.apply_tag(tag, start_it, end_it)
-        else:
-            st_iter = gtk_ed.get_iter_at_line(start_line)
-            actions_list = self.highlight_info_gen(gtk_ed, start_line,
-                                                   start_line + 1000)
+            results = self.highlight_info_gen(gtk_ed, 0)
+            self.apply_results(gtk_ed, results, 0, results[-1][2])
+            return None
 
-            # if not self.sync_stop:
-            #     actions_list = self.highlight_info_gen(gtk_ed, start_line)
+        results = self.highlight_info_gen(gtk_ed, start_line, end_line,
+                                          min_stop_line)
+        self.apply_results(
+            gtk_ed, results,
+            gtk_ed.get_iter_at_line(start_line).get_offset(), results[-1][2])
 
-            end_it.set_offset(actions_list[-1][2])
-            gtk_ed.remove_all_tags(st_iter, end_it)
+        if (self.sync_stop or end_line == 0
+                or end_line >= gtk_ed.get_line_count()):
+            return None
+        return end_line
 
-            for tag, start, end in actions_list:
-                start_it.set_offset(start)
-                end_it.set_offset(end)
-                if tag:
-                    gtk_ed.apply_tag(tag, start_it, end_it)
+    def apply_results(self, gtk_ed, results, start, end):
+        """
+        Replace the highlighting between the start and end offsets with the
+        results of highlight_info_gen. The runs are merged and applied one
+        tag at a time, and only the parts of the runs that differ from the
+        current highlighting are modified, since relexed text is mostly
+        highlighted the same way as before.
+
+        :type gtk_ed: Gtk.TextBuffer
+        :param results: list of (tag, start offset, end offset).
+        :type start: int
+        :type end: int
+        """
+        wanted = merge_runs(results)
+        start_it = gtk_ed.get_start_iter()
+        end_it = gtk_ed.get_start_iter()
+
+        for tag in gtk_ed.highlighter_tags.union(wanted):
+            runs = wanted.get(tag, [])
+            current = tag_runs_in_range(gtk_ed, tag, start, end)
+
+            for run_start, run_end in subtract_runs(current, runs):
+                start_it.set_offset(run_start)
+                end_it.set_offset(run_end)
+                gtk_ed.remove_tag(tag, start_it, end_it)
 
-        # print time() - t
+            for run_start, run_end in subtract_runs(runs, current):
+                start_it.set_offset(run_start)
+                end_it.set_offset(run_end)
+                gtk_ed.apply_tag(tag, start_it, end_it)
 
     def gtk_highlight(self, gtk_ed):
-        self.highlight_gen(gtk_ed, -1)
+        """
+        Highlight the visible part of the buffer right away, and the rest
+        of it in the background.
+
+        :type gtk_ed: Gtk.TextBuffer
+        """
+        gtk_ed.dirty_range = [0, gtk_ed.get_line_count()]
+        self.__highlight_viewport(gtk_ed)
 
     def gtk_highlight_region(self, gtk_ed, start_line):
         self.highlight_gen(gtk_ed, start_line)
 
+    def __highlight_dirty(self, gtk_ed, end_line):
+        """
+        Highlight the pending dirty range of gtk_ed, up to end_line at most,
+        and shrink the dirty range accordingly.
+
+        :type gtk_ed: Gtk.TextBuffer
+        :type end_line: int
+        """
+        start, stop = gtk_ed.dirty_range
+        start = min(start, gtk_ed.get_line_count() - 1)
+        next_line = self.highlight_gen(gtk_ed, start, end_line, stop)
+
+        if next_line is None:
+            gtk_ed.dirty_range = None
+        else:
+            # The stack of next_line has just been recomputed, but not the
+            # highlighting after it: do not stop there on the next pass.
+            gtk_ed.dirty_range = [next_line, max(stop, next_line)]
+
+    def __highlight_viewport(self, gtk_ed):
+        """
+        Synchronously highlight the dirty range of gtk_ed up to the end of
+        the viewport, and schedule the highlighting of the rest in idle.
+
+        :type gtk_ed: Gtk.TextBuffer
+        """
+        if not gtk_ed.dirty_range:
+            return
+
+        start = gtk_ed.dirty_range[0]
+        try:
+            lines = get_visible_lines(gtk_ed.gps_buffer)
+        except Exception:
+            lines = None
+        end_line = min((lines[1] if lines else start) + self.viewport_margin,
+                       start + self.max_sync_lines)
+
+        if end_line > start:
+            self.__highlight_dirty(gtk_ed, end_line)
+
+        if gtk_ed.dirty_range and not gtk_ed.idle_highlight_id:
+            gtk_ed.idle_highlight_id = GLib.idle_add(
+                self.__highlight_idle, gtk_ed, priority=GLib.PRIORITY_LOW)
+
+    def __highlight_idle(self, gtk_ed):
+        """
+        Highlight the dirty range of gtk_ed in batches of lines, until its
+        time budget is exhausted.
+
+        :type gtk_ed: Gtk.TextBuffer
+        """
+        deadline = time() + self.idle_budget_ms / 1000.0
+
+        while gtk_ed.dirty_range and time() < deadline:
+            self.__highlight_dirty(
+                gtk_ed, gtk_ed.dirty_range[0] + self.idle_batch_lines)
+
+        if gtk_ed.dirty_range:
+            return True
+
+        gtk_ed.idle_highlight_id = None
+        return False
+
     def init_highlighting(self, ed):
+        self.compile()
         gtk_ed = get_gtk_buffer(ed)
         gtk_ed.highlighting_initialized = True
         gtk_ed.stacks = HighlighterStacks()
+        gtk_ed.gps_buffer = ed
+
+        # All the tags this highlighter can apply to the buffer
+        gtk_ed.highlighter_tags = set(
+            tag for hl in self.sub_highlighters()
+            for tag in hl.get_tags_list(gtk_ed) if tag)
+
+        # The range of lines [start, stop] that need to be relexed. Lexing
+        # starts at start, and cannot stop before having passed stop.
+        gtk_ed.dirty_range = None
 
         if not hasattr(gtk_ed, "idle_highlight_id"):
             gtk_ed.idle_highlight_id = None
+        gtk_ed.sync_highlight_id = None
 
-        def action_handler(loc):
-            """:type loc: Gtk.TextIter"""
-            if gtk_ed.idle_highlight_id:
-                GLib.source_remove(gtk_ed.idle_highlight_id)
+        def on_sync_highlight():
+            gtk_ed.sync_highlight_id = None
+            self.__highlight_viewport(gtk_ed)
+            return False
 
-            # Highlight all the rest of the buffer
-            # TODO: Highlight N lines synchronously, and if there are any
-            # TODO: remaining, the rest in async
-            self.gtk_highlight_region(gtk_ed, loc.get_line())
+        def action_handler(line, nb_lines):
+            """
+            Add the lines modified at line to the dirty range, after having
+            shifted it by nb_lines (negative for deleted lines).
+            """
+            if gtk_ed.dirty_range:
+                start, stop = [l if l <= line else max(line, l + nb_lines)
+                               for l in gtk_ed.dirty_range]
+                gtk_ed.dirty_range = [min(start, line),
+                                      max(stop, line + max(nb_lines, 0))]
+            else:
+                gtk_ed.dirty_range = [line, line + max(nb_lines, 0)]
+
+            # Bursts of edits done in the same main loop iteration are
+            # coalesced into a single pass, run before the next redraw.
+            if not gtk_ed.sync_highlight_id:
+                gtk_ed.sync_highlight_id = GLib.idle_add(
+                    on_sync_highlight, priority=GLib.PRIORITY_HIGH_IDLE)
 
         # noinspection PyUnusedLocal
         def highlighting_insert_text_before(buf, loc, text, length):
@@ -601,7 +1193,7 @@ class Highlighter(object):
             nb_new_lines = len(text.split("\n")) - 1
             itr = buf.iter_from_tuple(buf.insert_loc)
             buf.stacks.insert_newlines(nb_new_lines, itr.get_line())
-            action_handler(itr)
+            action_handler(itr.get_line(), nb_new_lines)
 
         def highlighting_delete_range_before(buf, loc, end):
             buf.nb_deleted_lines = len(
@@ -611,7 +1203,7 @@ class Highlighter(object):
         # noinspection PyUnusedLocal
         def highlighting_delete_range(buf, loc, end):
             buf.stacks.delete_lines(buf.nb_deleted_lines, loc.get_line())
-            action_handler(loc)
+            action_handler(loc.get_line(), -buf.nb_deleted_lines)
 
         gtk_ed.connect_after("insert-text", highlighting_insert_text)
         gtk_ed.connect_after("delete-range", highlighting_delete_range)
@@ -112,6 +112,9 @@ class PythonResolver(CompletionResolver):
 
 class Jedi_Module(Module):
 
+    setup_mode = "idle"
+    # Python completion is not needed to start GPS
+
     __resolver = PythonResolver()
 
     def __refresh_source_dirs(self):
@@ -8,6 +8,7 @@ import GPS.Browsers as B
 import json
 import traceback
 import extensions
+from workflows.promises import Promise, run_in_worker
 
 
 class Styles(object):
@@ -127,6 +128,16 @@ class Styles(object):
         return s
 
 
+def _read_json_file(filename):
+    """
+    Parse a JSON file. This is run through `run_in_worker`.
+
+    :param str filename: the name of the file
+    """
+    with open(filename) as f:
+        return json.load(f)
+
+
 class JSON_Diagram_File():
     """
     A JSON file that contains the definition of multiple diagrams.
@@ -142,6 +153,8 @@ class JSON_Diagram_File():
         self.diagrams = []
         self.index = []  # (id, children (JSON Array))
         self.factory = factory
+        self.__diagrams_by_id = {}    # id -> first diagram with that id
+        self.__diagrams_by_item = {}  # item id -> diagrams containing it
         self.__load(data)
 
     def get(self, id=None):
@@ -150,10 +163,10 @@ class JSON_Diagram_File():
         :param str id: if None, returns the first diagram
         :return: an instance of JSON_Diagram
         """
-        for d in self.diagrams:
-            if d.id == id:
-                d.ensure()
-                return d
+        d = self.__diagrams_by_id.get(id)
+        if d is not None:
+            d.ensure()
+            return d
 
         if self.diagrams:
             d = self.diagrams[0]
@@ -166,7 +179,7 @@ class JSON_Diagram_File():
         Return the diagram to use for a given item
         :return:  (GPS.Diagram, Item)
         """
-        for d in self.diagrams:
+        for d in self.__diagrams_by_item.get(id, []):
             d.ensure()
             it = d.get_item(id)
             if it:
@@ -237,6 +250,37 @@ class JSON_Diagram_File():
                 diag = self.factory(file=self, json=d)
 
             self.diagrams.append(diag)
+            self.__diagrams_by_id.setdefault(diag.id, diag)
+
+            item_ids = set()
+            for o in d.get('items', []):
+                self.__collect_ids(o, item_ids)
+            for link in d.get('links', []):
+                self.__collect_ids(link, item_ids)
+                for end in (link.get('from'), link.get('to')):
+                    if end and end.get('label'):
+                        self.__collect_ids(end['label'], item_ids)
+
+            for id in item_ids:
+                self.__diagrams_by_item.setdefault(id, []).append(diag)
+
+    def __collect_ids(self, json, ids):
+        """
+        Add to ids the id of an item or link, and those of its children
+        and labels, as they will be set when the diagram is created. This
+        does not create the items.
+        :param json: the JSON data for the item or link
+        :param set ids: the set to add to
+        """
+        template = self.templates.get(json.get('template'))
+        for o in (json, template or {}):
+            id = o.get('id')
+            if id is not None:
+                ids.add(id)
+            if o.get('label'):
+                self.__collect_ids(o['label'], ids)
+            for child in o.get('vbox') or o.get('hbox') or []:
+                self.__collect_ids(child, ids)
 
 
 class JSON_Diagram(B.Diagram):
@@ -544,6 +588,32 @@ class Diagram:
             GPS.Console().write("Unexpected exception %s\n%s\n" % (
                 e, traceback.format_exc()))
 
+    @staticmethod
+    def load_json_in_worker(filename, diagramFactory=None):
+        """
+        Same as `load_json`, but the file is parsed asynchronously through
+        `run_in_worker`. The diagrams themselves are created in the main
+        thread.
+
+        :param str filename: the name of the file
+        :return: a promise resolved with an instance of JSON_Diagram_File,
+           or None if the file could not be loaded.
+        """
+        p = Promise()
+
+        def on_parsed(data):
+            p.resolve(GPS.Browsers.Diagram.load_json_data(
+                data, diagramFactory))
+
+        def on_failed(reason):
+            if reason is not None:   # not cancelled
+                GPS.Console().write("Unexpected exception %s\n" % (
+                    reason, ))
+            p.resolve(None)
+
+        run_in_worker(_read_json_file, filename).then(on_parsed, on_failed)
+        return p
+
     @staticmethod
     def load_json_data(data, diagramFactory=None):
         """
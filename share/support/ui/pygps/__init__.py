@@ -509,6 +509,27 @@ try:
         else:
             return tv.is_visible()
 
+    def get_visible_lines(ed_buffer):
+        """
+        Return the first and last lines of ed_buffer that are visible in its
+        current view, counted from 0 as in Gtk, or None if the buffer is not
+        displayed.
+
+        :type ed_buffer: GPS.EditorBuffer
+        :rtype: (int, int)|None
+        """
+        view = ed_buffer.current_view()
+        if view is None:
+            return None
+
+        tv = get_widgets_by_type(Gtk.TextView, view.pywidget())[0]
+        if not tv.get_mapped():
+            return None
+
+        rect = tv.get_visible_rect()
+        return (tv.get_line_at_y(rect.y)[0].get_line(),
+                tv.get_line_at_y(rect.y + rect.height)[0].get_line())
+
 
 except ImportError:
     pass
@@ -7,6 +7,7 @@ import GPS
 from modules import Module
 from gi.repository import Gtk, Gdk, GLib, Pango
 from gps_utils import make_interactive
+from workflows.promises import process_scheduler
 import pygps
 
 COL_PROGRESS = 0
@@ -18,6 +19,18 @@ COL_TASK_ID = 4
 icon_size_action = 0
 
 
+def queued_processes_text(queued):
+    """
+    The text that shows the number of processes waiting to be started.
+
+    :param int queued: the number of queued processes.
+    :rtype: str
+    """
+    if queued == 1:
+        return "1 process queued"
+    return "{} processes queued".format(queued)
+
+
 class HUD_Widget():
 
     """ A widget representing the GPS HUD """
@@ -117,7 +130,15 @@ class HUD_Widget():
     def refresh(self):
         """ Refresh the contents of the HUD """
         tasks = filter(lambda x: x.visible, GPS.Task.list())
-        if len(tasks) == 0:
+        queued = process_scheduler.queued
+        if len(tasks) == 0 and queued:
+            # Only processes waiting to be started
+            self.label.set_text(queued_processes_text(queued))
+            self.progress_label.set_text("")
+            self.progress_bar.hide()
+            self.button.show_all()
+
+        elif len(tasks) == 0:
             # No visible tasks
             self.label.set_text("")
             self.progress_label.set_text("")
@@ -148,6 +169,10 @@ class HUD_Widget():
                 self.progress_bar.set_fraction(fraction/len(tasks))
                 self.progress_label.set_text("")
 
+            if queued:
+                self.label.set_text("{}, {}".format(
+                    self.label.get_text(), queued_processes_text(queued)))
+
         return True
 
     def start_monitoring(self):
@@ -190,6 +215,12 @@ class Tasks_View_Widget():
         scroll.add(self.view)
         self.box.pack_start(scroll, True, True, 0)
 
+        # The number of processes waiting to be started
+        self.queued_label = Gtk.Label()
+        self.queued_label.set_alignment(0.0, 0.5)
+        self.queued_label.set_no_show_all(True)
+        self.box.pack_start(self.queued_label, False, False, 0)
+
         # Initialize the tree view
 
         self.close_col = Gtk.TreeViewColumn("Close")
@@ -280,8 +311,17 @@ class Tasks_View_Widget():
             else:
                 iter = self.store.iter_next(iter)
 
+        # Processes queued by the scheduler are not tasks yet, and do not
+        # block the exit
+        queued = 0 if self.hide_nonblocking else process_scheduler.queued
+        if queued:
+            self.queued_label.set_text(queued_processes_text(queued))
+            self.queued_label.show()
+        else:
+            self.queued_label.hide()
+
         # Stop monitoring if there are no tasks left
-        if len(task_ids) == 0:
+        if len(task_ids) == 0 and not queued:
             self.timeout = None
             if self.on_empty:
                 self.on_empty()
@@ -415,6 +455,9 @@ class Tasks_View(Module):
         return False   # prevent exit (and hide the "exit" task from dialog")
 
     def setup(self):
+        # Monitor the processes queued by the scheduler
+        process_scheduler.listeners.append(self.task_started)
+
         # Add the Tasks view
         make_interactive(
             self.get_view,
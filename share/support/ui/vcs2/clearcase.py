@@ -4,7 +4,8 @@ from . import core_staging
 import os
 import re
 import types
-from workflows.promises import ProcessWrapper, Promise
+from workflows.promises import ProcessWrapper, Promise, \
+    PRIORITY_BACKGROUND
 
 
 @core.register_vcs(name='ClearCase Native',
@@ -16,7 +17,8 @@ class Clearcase(core_staging.Emulate_Staging,
         p = ProcessWrapper(
             ['cleartool'] + args,
             block_exit=block_exit,
-            directory=self.working_dir.path)
+            directory=self.working_dir.path,
+            priority=None if block_exit else PRIORITY_BACKGROUND)
         return p
 
     @core.run_in_background
@@ -27,28 +29,28 @@ class Clearcase(core_staging.Emulate_Staging,
         with self.set_status_for_all_files() as s:
             p = self._cleartool(['ls', '-short', '.'])
             while True:
-                line = yield p.wait_line()
-                if line is None:
+                batch = yield p.wait_lines()
+                if batch is None:
                     break
-
-                GPS.Logger("CLEARCASE").log(line)
-                m = _re.search(line)
-                if m:
-                    # ??? These are just (bad) guesses for now
-                    status = GPS.VCS2.Status.UNMODIFIED
-                    rev = m.group('rev')
-                    if rev.contains('CHECKEDOUT'):
-                        status = GPS.VCS2.Status.MODIFIED
-                    elif m.group('sep') == '':
-                        status = GPS.VCS2.Status.UNTRACKED
-                    elif rev == '':
-                        status = GPS.VCS2.Status.IGNORED
-
-                    s.set_status(
-                        GPS.File(m.group('file')),
-                        0,
-                        rev,
-                        '')  # repo revision
+                for line in batch:
+                    GPS.Logger("CLEARCASE").log(line)
+                    m = _re.search(line)
+                    if m:
+                        # ??? These are just (bad) guesses for now
+                        status = GPS.VCS2.Status.UNMODIFIED
+                        rev = m.group('rev')
+                        if rev.contains('CHECKEDOUT'):
+                            status = GPS.VCS2.Status.MODIFIED
+                        elif m.group('sep') == '':
+                            status = GPS.VCS2.Status.UNTRACKED
+                        elif rev == '':
+                            status = GPS.VCS2.Status.IGNORED
+
+                        s.set_status(
+                            GPS.File(m.group('file')),
+                            0,
+                            rev,
+                            '')  # repo revision
 
     def has_defined_activity(self, synchronous):
         """
@@ -127,12 +129,13 @@ class Clearcase(core_staging.Emulate_Staging,
     def async_fetch_history(self, visitor, filter):
         p = self._cleartool(['lshistory', '.'])
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 GPS.Logger("CLEARCASE").log("Done parsing lshistory")
                 break
-            GPS.Logger("CLEARCASE").log(line)
-            # ??? Should parse the output
+            for line in batch:
+                GPS.Logger("CLEARCASE").log(line)
+                # ??? Should parse the output
 
     @core.run_in_background
     def async_fetch_commit_details(self, ids, visitor):
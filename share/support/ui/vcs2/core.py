@@ -158,43 +158,6 @@ def run_in_background(func):
     return __func
 
 
-class Profile:
-    """
-    A Context that runs the function inside the profiler, and display
-    the result in the log.
-    """
-
-    def __init__(self, time_only=False):
-        """
-        :param bool time_only: if true, only display the time it topok to
-           execute, not the whole profile
-        """
-        import cProfile
-        self.time_only = time_only
-        if time_only:
-            self.start = time.time()
-        else:
-            self.c = cProfile.Profile()
-
-    def __enter__(self):
-        if not self.time_only:
-            self.c.enable()
-        return self
-
-    def __exit__(self, exc_type=None, exc_val=None, exc_tb=None):
-        if self.time_only:
-            GPS.Logger("GIT").log(
-                "Total time: %ss" % (time.time() - self.start, ))
-        else:
-            import pstats
-            import StringIO
-            self.c.disable()
-            s = StringIO.StringIO()
-            ps = pstats.Stats(self.c, stream=s).sort_stats('cumulative')
-            ps.print_stats()
-            GPS.Logger("GIT").log(s.getvalue())
-
-
 class Extension():
     """
     A class similar to core.VCS, which is used to decorate an existing VCS
@@ -248,6 +211,15 @@ class VCS(GPS.VCS2):
         self.default_status = default_status
         self._extensions = []   # the decorators that apply to self
 
+        self._known_statuses = {}
+        # The last (status, version, repo_version) sent to GPS for each file
+
+        self.status_counters = {'scanned': 0, 'changed': 0, 'emit_time': 0.0}
+        # Statistics on set_status_for_all_files: the number of files whose
+        # status was computed, the number of those that were actually sent
+        # to GPS because their status changed, and the time spent sending
+        # them, in seconds.
+
         # Check which decorators apply
         for d in self._class_extensions:
             inst = d(base_vcs=self)
@@ -524,20 +496,44 @@ class VCS(GPS.VCS2):
                 """
                 Set the status for all files in `files` for which no status
                 has been set yet.
+                Only the files whose status differs from the one last sent
+                to GPS are emitted.
 
                 :param set(GPS.File)|list(GPS.File) files:
                 """
-                GPS.Logger("VCS2").log("Emit file statuses")
-                for s, s_files in self._cache.iteritems():
-                    vcs._set_file_status(s_files, s[0], s[1], s[2])
-                GPS.Logger("VCS2").log("Done emit file statuses")
+                start = time.time()
+                known = vcs._known_statuses
+                scanned = 0
+                changed = 0
 
+                for s, s_files in self._cache.iteritems():
+                    scanned += len(s_files)
+                    to_set = [f for f in s_files if known.get(f) != s]
+                    if to_set:
+                        changed += len(to_set)
+                        for f in to_set:
+                            known[f] = s
+                        vcs._set_file_status(to_set, s[0], s[1], s[2])
+
+                default = (vcs.default_status, "", "")
                 to_set = []
                 for f in files:
                     if f not in self._seen:
-                        to_set.append(f)
-                vcs._set_file_status(to_set, vcs.default_status)
-                GPS.Logger("VCS2").log("Done emit default statuses")
+                        scanned += 1
+                        if known.get(f) != default:
+                            known[f] = default
+                            to_set.append(f)
+                if to_set:
+                    changed += len(to_set)
+                    vcs._set_file_status(to_set, vcs.default_status)
+
+                elapsed = time.time() - start
+                vcs.status_counters['scanned'] += scanned
+                vcs.status_counters['changed'] += changed
+                vcs.status_counters['emit_time'] += elapsed
+                GPS.Logger("VCS2").log(
+                    "Emit file statuses: %d scanned, %d changed, %.3fs" % (
+                        scanned, changed, elapsed))
 
             def __exit__(self, exc_type=None, exc_val=None, exc_tb=None):
                 self.set_status_for_remaining_files(files)
@@ -2,7 +2,7 @@ from . import core, core_staging
 import GPS
 import os
 import re
-from workflows.promises import ProcessWrapper
+from workflows.promises import ProcessWrapper, PRIORITY_BACKGROUND
 
 
 # Match cvs status output to internal status for GPS
@@ -35,18 +35,24 @@ class CVS(core_staging.Emulate_Staging,
         '(?:\s+Repository revision:\s*(?P<rrev>[\d.]+).*)' +
         ')$')
 
-    def _cvs(self, args, block_exit=False, spawn_console=False):
+    def _cvs(self, args, block_exit=False, spawn_console=False,
+             priority=None):
         """
         Execute cvs with the given arguments.
 
         :param List(str) args: list of arguments
+        :param int priority: the priority of the process, see
+            `workflows.promises.ProcessScheduler`. Only read-only queries
+            should be queued, commands that modify the repository are
+            started immediately.
         :returntype: a ProcessWrapper
         """
         return ProcessWrapper(
             ['cvs'] + args,
             block_exit=block_exit,
             spawn_console=spawn_console,
-            directory=self.working_dir.path)
+            directory=self.working_dir.path,
+            priority=None if block_exit else priority)
 
     @core.vcs_action(icon='vcs-cloud-symbolic',
                      name='cvs update',
@@ -64,52 +70,53 @@ class CVS(core_staging.Emulate_Staging,
     def _compute_status(self, all_files, args=[]):
         with self.set_status_for_all_files(all_files) as s:
             list = [self._relpath(arg) for arg in args]
-            p = self._cvs(['-f', 'status'] + list)
+            p = self._cvs(['-f', 'status'] + list,
+                          priority=PRIORITY_BACKGROUND)
             current_file = None
             dir = None
             status = None
             rev = None
             repo_rev = None
             while True:
-                line = yield p.wait_line()
-                if line is None:
+                batch = yield p.wait_lines()
+                if batch is None:
                     break
-
-                m = self.__re_status.search(line)
-                if m is None:
-                    pass
-                elif m.group('dir'):
-                    dir = m.group('dir')
-                elif m.group('file'):
-                    if current_file is not None:
-                        s.set_status(current_file, status, rev, repo_rev)
-                        current_file = None
-
-                    # CVS doesn't show path information when a list of files is
-                    # given. However, it seems to query the status in the same
-                    # order as on the command line, so we take advantage of
-                    # that.
-
-                    f = m.group('file')
-                    if dir is not None:
-                        current_file = GPS.File(os.path.join(dir, f))
-                    elif all_files and all_files[0].path.endswith(f):
-                        current_file = all_files[0]
-                    if all_files:
-                        all_files.pop(0)
-
-                    if m.group('deleted'):
-                        status = GPS.VCS2.Status.DELETED
-                    else:
-                        status = STATUSES.get(
-                            m.group('status').lower(),
-                            GPS.VCS2.Status.UNMODIFIED)
-                    rev = None
-                    repo_rev = None
-                elif m.group('rev'):
-                    rev = m.group('rev')
-                elif m.group('rrev'):
-                    repo_rev = m.group('rrev')
+                for line in batch:
+                    m = self.__re_status.search(line)
+                    if m is None:
+                        pass
+                    elif m.group('dir'):
+                        dir = m.group('dir')
+                    elif m.group('file'):
+                        if current_file is not None:
+                            s.set_status(current_file, status, rev, repo_rev)
+                            current_file = None
+
+                        # CVS doesn't show path information when a list of
+                        # files is given. However, it seems to query the
+                        # status in the same order as on the command line, so
+                        # we take advantage of that.
+
+                        f = m.group('file')
+                        if dir is not None:
+                            current_file = GPS.File(os.path.join(dir, f))
+                        elif all_files and all_files[0].path.endswith(f):
+                            current_file = all_files[0]
+                        if all_files:
+                            all_files.pop(0)
+
+                        if m.group('deleted'):
+                            status = GPS.VCS2.Status.DELETED
+                        else:
+                            status = STATUSES.get(
+                                m.group('status').lower(),
+                                GPS.VCS2.Status.UNMODIFIED)
+                        rev = None
+                        repo_rev = None
+                    elif m.group('rev'):
+                        rev = m.group('rev')
+                    elif m.group('rrev'):
+                        repo_rev = m.group('rrev')
 
             if current_file is not None:
                 s.set_status(current_file, status, rev, repo_rev)
@@ -210,7 +217,7 @@ class CVS(core_staging.Emulate_Staging,
             def oncompleted(self, out_stream, status):
                 self.emit_previous(out_stream)
 
-        p = self._cvs(['log', '-N'] + args)
+        p = self._cvs(['log', '-N'] + args, priority=PRIORITY_BACKGROUND)
         return p.lines.flatMap(line_to_block())
 
     @core.run_in_background
@@ -250,7 +257,8 @@ class CVS(core_staging.Emulate_Staging,
         if ' ' in ref:
             ref, f = self._parse_unique_id(ref)
         p = self._cvs(['diff', '-r%s' % ref, '-u', '--new-file',
-                       self._relpath(file.path) if file else ''])
+                       self._relpath(file.path) if file else ''],
+                      priority=PRIORITY_BACKGROUND)
         status, output = yield p.wait_until_terminate()
         # CVS returns status==0 if no diff was found
         visitor.diff_computed(output)
@@ -260,7 +268,8 @@ class CVS(core_staging.Emulate_Staging,
         if ' ' in ref:
             ref, f = self._parse_unique_id(ref)
         p = self._cvs(['-q', 'update', '-p', '-r%s' % ref,
-                       self._relpath(file.path)])
+                       self._relpath(file.path)],
+                      priority=PRIORITY_BACKGROUND)
         status, output = yield p.wait_until_terminate()
         visitor.file_computed(output)
 
@@ -275,49 +284,50 @@ class CVS(core_staging.Emulate_Staging,
         lines = []
         ids = []
 
-        p = self._cvs(['annotate', self._relpath(file.path)])
+        p = self._cvs(['annotate', self._relpath(file.path)],
+                      priority=PRIORITY_BACKGROUND)
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.annotations(file, 1, ids, lines)
                 break
-
-            m = r.search(line)
-            if m:
-                lines.append('%s %10s %s' % (
-                    m.group('date'),
-                    m.group('author')[:10],
-                    m.group('rev')))
-                ids.append(m.group('rev'))
+            for line in batch:
+                m = r.search(line)
+                if m:
+                    lines.append('%s %10s %s' % (
+                        m.group('date'),
+                        m.group('author')[:10],
+                        m.group('rev')))
+                    ids.append(m.group('rev'))
 
     @core.run_in_background
     def async_branches(self, visitor):
-        p = self._cvs(['status', '-v'])
+        p = self._cvs(['status', '-v'], priority=PRIORITY_BACKGROUND)
         tags = set(['HEAD'])
         sticky = set()
         in_tags = False
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.branches(
                     CAT_TAGS, 'vcs-tag-symbolic', not CAN_RENAME,
                     [GPS.VCS2.Branch(
                         name=t, active=t in sticky, annotation='', id=t)
                      for t in tags])
                 break
-
-            if line.startswith('   Existing Tags:'):
-                in_tags = True
-            elif in_tags and not line:
-                in_tags = False
-            elif in_tags and line != '\tNo Tags Exist':
-                tags.add(line.lstrip().split(' ')[0])
-            elif not in_tags and line.startswith('   Sticky Tag:'):
-                s = line.split()[2]
-                if s == '(none)':
-                    sticky.add('HEAD')
-                else:
-                    sticky.add(s)
+            for line in batch:
+                if line.startswith('   Existing Tags:'):
+                    in_tags = True
+                elif in_tags and not line:
+                    in_tags = False
+                elif in_tags and line != '\tNo Tags Exist':
+                    tags.add(line.lstrip().split(' ')[0])
+                elif not in_tags and line.startswith('   Sticky Tag:'):
+                    s = line.split()[2]
+                    if s == '(none)':
+                        sticky.add('HEAD')
+                    else:
+                        sticky.add(s)
 
     @core.run_in_background
     def async_action_on_branch(self, visitor, action, category, id, text=''):
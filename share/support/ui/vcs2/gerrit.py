@@ -52,35 +52,35 @@ class Gerrit(core.Extension):
              'status:open'], block_exit=False)
         reviews = []
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 if reviews:
                     visitor.branches(
                         CAT_REVIEWS, 'vcs-gerrit-symbolic',
                         not CAN_RENAME, reviews)
                 break
-
-            patch = json.loads(line)
-            if patch and patch.get(u'subject', None) is not None:
-                review = '0'
-                workflow = ''
-                patchset = patch[u'currentPatchSet']
-                if patchset.get(u'approvals', None) is not None:
-                    for a in patchset[u'approvals']:
-                        if a[u'type'] == u'Workflow':
-                            workflow = '|%s' % a['value']
-                        elif a[u'type'] == u'Code-Review':
-                            review = a['value']
-
-                id = {'url': patch.get(u'url', ''),
-                      'number': patch.get(u'number', '')}
-
-                reviews.append(
-                    ('%s: %s' % (patchset[u'author'][u'username'],
-                                 patch[u'subject']),
-                     False,   # not active
-                     '%s%s' % (review, workflow),
-                     json.dumps(id)))
+            for line in batch:
+                patch = json.loads(line)
+                if patch and patch.get(u'subject', None) is not None:
+                    review = '0'
+                    workflow = ''
+                    patchset = patch[u'currentPatchSet']
+                    if patchset.get(u'approvals', None) is not None:
+                        for a in patchset[u'approvals']:
+                            if a[u'type'] == u'Workflow':
+                                workflow = '|%s' % a['value']
+                            elif a[u'type'] == u'Code-Review':
+                                review = a['value']
+
+                    id = {'url': patch.get(u'url', ''),
+                          'number': patch.get(u'number', '')}
+
+                    reviews.append(
+                        ('%s: %s' % (patchset[u'author'][u'username'],
+                                     patch[u'subject']),
+                         False,   # not active
+                         '%s%s' % (review, workflow),
+                         json.dumps(id)))
 
     def async_action_on_branch(self, visitor, action, category, id, text=''):
         if category == CAT_REVIEWS:
@@ -3,8 +3,11 @@ from . import core
 import os
 import re
 import workflows
-from workflows.promises import ProcessWrapper, join, Promise
+from workflows.promises import ProcessWrapper, join, Promise, \
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
 import datetime
+import json
+from collections import OrderedDict
 
 
 CAT_BRANCHES = 'BRANCHES'
@@ -23,6 +26,106 @@ _version = None
 # Git version
 
 
+def _mtime(path):
+    """
+    Return the modification time of path, or None if it does not exist.
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _parse_log_line(line):
+    """
+    Parse one line of the "git log" output in async_fetch_history.
+
+    :return: a tuple (id, parents, author, email, branches, date, subject)
+       where parents is a list of sha1, and branches a list of names or
+       None.
+    """
+    id, parents, author, email, branches, date, subject = line.split('@@', 6)
+    return (id, parents.split(), author, email,
+            None if not branches else branches.split(','), date, subject)
+
+
+class _History(object):
+    """
+    The commits already parsed for one set of history filters, used to
+    resume "git log" when the History view needs more of them.
+    """
+
+    def __init__(self):
+        self.commits = []
+        # The result of _parse_log_line for each commit, in the order output
+        # by git.
+
+        self.complete = False
+        # Whether "git log" has output all the matching commits
+
+
+class _Blame_Parser(object):
+    """
+    Parse the output of "git blame --porcelain". This is meant to be
+    subscribed to the stream of a ProcessWrapper, and parses each chunk of
+    output at once.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.info = {}   # for each commit id, the annotation
+        self.ids = {}    # for each line of the blamed file, the commit id
+        self.__current_id = None
+        self.__current_line = 0
+
+    def __call__(self, output):
+        lines = (self.buffer + output).split('\n')
+        self.buffer = lines.pop()
+        info = self.info
+        current_id = self.__current_id
+
+        for line in lines:
+            if current_id is None:
+                fields = line.split(' ', 3)
+                if len(fields) >= 3:
+                    current_id = fields[0]
+                    self.__current_line = int(fields[2])
+
+            elif line[0:1] == '\t':
+                # The line of code, which we ignore
+                self.ids[self.__current_line] = current_id
+                current_id = None
+
+            elif line.startswith('author '):
+                info[current_id] = line[7:17]  # at most 10 chars
+
+            elif line.startswith('committer-time '):
+                d = datetime.datetime.fromtimestamp(
+                    int(line[15:])).strftime('%Y%m%d')
+                info[current_id] = '%s %10s %s' % (
+                    d, info[current_id], current_id[0:7])
+
+        self.__current_id = current_id
+
+
+class _Records(object):
+    """
+    Split the output of a git command run with -z into NUL-separated
+    records, and call on_record for each of them. This is meant to be
+    subscribed to the stream of a ProcessWrapper.
+    """
+
+    def __init__(self, on_record):
+        self.buffer = ""
+        self.on_record = on_record
+
+    def __call__(self, output):
+        records = (self.buffer + output).split('\0')
+        self.buffer = records.pop()
+        for r in records:
+            self.on_record(r)
+
+
 @core.register_vcs(default_status=GPS.VCS2.Status.UNMODIFIED)
 class Git(core.VCS):
 
@@ -36,20 +139,59 @@ class Git(core.VCS):
 
         self._non_default_files = None
         # Files with a non-default status
+
+        self.__ignored_files = set()
+        # Files reported as ignored. These are only computed again when the
+        # user explicitly asks for a refresh.
+
+        self.__mtimes = {}
+        # Modification time of the files with a non-default status at the
+        # time of the last "git status"
+
+        self.__index_file = None
+        self.__index_mtime = None
+        # The git index, and its modification time after the last "git status"
+
+        self.__head = None
+        # The commit of HEAD at the time of the last "git status"
+
+        self.__history_refs = None
+        # The references when the histories below were computed
+
+        self.__histories = {}
+        # The _History for each set of filters, indexed by (file path,
+        # pattern, current branch only)
+
+        self.__commits = {}
+        # The parsed commits, indexed by sha1, shared by all histories
+
+        self.__unpushed = None
+        # The sha1 of commits that have not been pushed yet
+
+        self.__blames = OrderedDict()
+        # The last blames computed, as (ids, info), indexed by the commit of
+        # HEAD and the sha1 of the blob. They are also saved on the disk.
+
         self.__set_git_version()
 
-    def _git(self, args, block_exit=False, **kwargs):
+    def _git(self, args, block_exit=False, priority=None, **kwargs):
         """
         Return git with the given arguments
         :param List(str) args: git arguments
         :param bool block_exit: if True, GPS won't exit while this process
             is running.
+        :param int priority: the priority of the process, see
+            `workflows.promises.ProcessScheduler`. Only read-only queries
+            should be given a priority: identical queued processes are
+            merged. Commands that modify the repository are started
+            immediately when this is None.
         :returntype: a ProcessWrapper
         """
         return ProcessWrapper(
             ['git', '--no-pager'] + args,
             block_exit=block_exit,
             directory=self.working_dir.path,
+            priority=None if block_exit else priority,
             **kwargs)
 
     def __git_ls_tree(self, all_files):
@@ -57,65 +199,84 @@ class Git(core.VCS):
         Compute all files under version control
         :param list all_files: will be modified to include the list of files
         """
-        def on_line(line):
+        def on_record(record):
             all_files.append(
-                GPS.File(os.path.join(self.working_dir.path, line)))
-        p = self._git(['ls-tree', '-r', 'HEAD', '--name-only'])
-        yield p.lines.subscribe(on_line)   # wait until p terminates
+                GPS.File(os.path.join(self.working_dir.path, record)))
+        p = self._git(['ls-tree', '-r', 'HEAD', '--name-only', '-z'],
+                      priority=PRIORITY_BACKGROUND)
+        yield p.stream.subscribe(_Records(on_record))  # wait until p ends
 
-    def __git_status(self, s):
+    def __git_status(self, s, paths=None, ignored_files=None):
         """
         Run and parse "git status"
         :param s: the result of calling self.set_status_for_all_files
+        :param list(str) paths: if specified, only query the status of these
+           paths, relative to the working directory. They are not patterns,
+           which requires git 1.8.2. Untracked files are then reported
+           individually, rather than as their directory.
+        :param set ignored_files: if specified, ignored files are also
+           reported (which is slow on large trees), and added to this set.
         """
-        def on_line(line):
-            if len(line) > 3:
-                if line[0:2] in ('DD', 'AU', 'UD', 'UA', 'DU', 'AA', 'UU'):
+        rename_source = [False]   # whether the next record is a source
+
+        def on_record(record):
+            if rename_source[0]:
+                # Renamed and copied files are followed by their source
+                rename_source[0] = False
+                return
+
+            if len(record) > 3:
+                if record[0:2] in ('DD', 'AU', 'UD', 'UA', 'DU', 'AA', 'UU'):
                     status = GPS.VCS2.Status.CONFLICT
                 else:
                     status = 0
 
-                    if line[0] == 'M':
+                    if record[0] == 'M':
                         status = GPS.VCS2.Status.STAGED_MODIFIED
-                    elif line[0] == 'A':
+                    elif record[0] == 'A':
                         status = GPS.VCS2.Status.STAGED_ADDED
-                    elif line[0] == 'D':
+                    elif record[0] == 'D':
                         status = GPS.VCS2.Status.STAGED_DELETED
-                    elif line[0] == 'R':
+                    elif record[0] == 'R':
                         status = GPS.VCS2.Status.STAGED_RENAMED
-                    elif line[0] == 'C':
+                        rename_source[0] = True
+                    elif record[0] == 'C':
                         status = GPS.VCS2.Status.STAGED_COPIED
-                    elif line[0] == '?':
+                        rename_source[0] = True
+                    elif record[0] == '?':
                         status = GPS.VCS2.Status.UNTRACKED
-                    elif line[0] == '!':
+                    elif record[0] == '!':
                         status = GPS.VCS2.Status.IGNORED
 
-                    if line[1] == 'M':
+                    if record[1] == 'M':
                         status = status | GPS.VCS2.Status.MODIFIED
-                    elif line[1] == 'D':
+                    elif record[1] == 'D':
                         status = status | GPS.VCS2.Status.DELETED
 
                 # Filter some obvious files to speed things up
-                if line[-3:] != '.o' and line[-5:] != '.ali':
-                    s.set_status(
-                        GPS.File(
-                            os.path.join(self.working_dir.path, line[3:])),
-                        status)
-
-        if _version < [1, 7, 2]:
-            ignored = []
-        else:
-            ignored = ['--ignored']
-
-        p = self._git(['status', '--porcelain'] + ignored)
-        yield p.lines.subscribe(on_line)   # wait until p terminates
+                if record[-3:] != '.o' and record[-5:] != '.ali':
+                    f = GPS.File(
+                        os.path.join(self.working_dir.path, record[3:]))
+                    s.set_status(f, status)
+                    if status == GPS.VCS2.Status.IGNORED:
+                        ignored_files.add(f)
+
+        args = ['status', '--porcelain', '-z']
+        if ignored_files is not None and _version >= [1, 7, 2]:
+            args.append('--ignored')
+        if paths is not None:
+            args = (['--literal-pathspecs'] + args +
+                    ['--untracked-files=all', '--'] + paths)
+
+        p = self._git(args, priority=PRIORITY_BACKGROUND)
+        yield p.stream.subscribe(_Records(on_record))  # wait until p ends
 
     @workflows.run_as_workflow
     def __set_git_version(self):
         """Find GIT version."""
         global _version
         if not _version:
-            p = self._git(['--version'])
+            p = self._git(['--version'], priority=PRIORITY_BACKGROUND)
             status, output = yield p.wait_until_terminate()
             # The version is the first three dot separated digits of the
             # third word.
@@ -130,6 +291,36 @@ class Git(core.VCS):
         self.async_fetch_status_for_all_files(
             from_user=False, extra_files=files)
 
+    # Maximum number of files whose status is queried individually. When
+    # more files might have changed, the status of all files is queried.
+    max_status_paths = 200
+
+    def __changed_files(self, head, index_changed):
+        """
+        Return the files whose status might have changed since the last
+        "git status", or None if the status of all files must be queried.
+        Files modified outside of GPS are only detected by the next refresh
+        requested by the user.
+
+        :param str head: the current commit of HEAD.
+        :param bool index_changed: whether the index was modified since the
+           last "git status".
+        :rtype: set(GPS.File)|None
+        """
+        if head != self.__head or _version < [1, 8, 2]:
+            # After a commit, a checkout or a reset, or when the paths
+            # cannot be passed literally to "git status"
+            return None
+
+        tracked = self._non_default_files.difference(self.__ignored_files)
+        if index_changed:
+            # Files were staged or unstaged
+            return tracked
+        else:
+            # Only files modified on the disk can have a different status
+            return set(f for f in tracked
+                       if _mtime(f.path) != self.__mtimes.get(f))
+
     @core.run_in_background
     def async_fetch_status_for_all_files(self, from_user, extra_files=[]):
         """
@@ -140,32 +331,82 @@ class Git(core.VCS):
         s = self.set_status_for_all_files()
         files = set(extra_files)
 
-        # Do we need to reset the "ls-tree" cache ? After the initial
-        # loading, this list no longer changes without also impacting the
-        # output of "git status", so we do not need to execute it again.
+        if self.__index_file is None:
+            p = self._git(['rev-parse', '--git-dir'],
+                          priority=PRIORITY_BACKGROUND)
+            _, output = yield p.wait_until_terminate()
+            self.__index_file = os.path.join(
+                self.working_dir.path, output.strip(), 'index')
+
+        # HEAD can move without modifying the index, for instance with
+        # "git reset --soft"
+        index_changed = _mtime(self.__index_file) != self.__index_mtime
+        p = self._git(['rev-parse', 'HEAD'], priority=PRIORITY_BACKGROUND)
+        _, output = yield p.wait_until_terminate()
+        head = output.strip()
+
         if from_user or self._non_default_files is None:
+            # Do we need to reset the "ls-tree" cache ? After the initial
+            # loading, this list no longer changes without also
+            # impacting the output of "git status", so we do not need to
+            # execute it again.
             all_files = []   # faster to update than a set
-            yield join(self.__git_ls_tree(all_files), self.__git_status(s))
-            self._non_default_files = s.files_with_explicit_status
+            ignored = set()
+            yield join(self.__git_ls_tree(all_files),
+                       self.__git_status(s, ignored_files=ignored))
+            self.__ignored_files = ignored
+            self._non_default_files = set(s.files_with_explicit_status)
             files.update(all_files)
 
         else:
-            # Reuse caches: we do not need to recompute the full list of files
-            # for git, since this will not change without also changing the
-            # output of "git status". We also do not reset the default status
-            # for all the files not in the git status output: that might be a
-            # slow operation that is blocking GPS. Instead, we only reset the
-            # default status for files that used to be in "git status" (for
-            # instance modified files), and are no longer there (either after
-            # a "reset" or a "commit").
-
-            yield self.__git_status(s)
-            nondefault = s.files_with_explicit_status
-            now_default = self._non_default_files.difference(nondefault)
+            # Reuse caches: we do not need to recompute the full list of
+            # files for git, since this will not change without also
+            # changing the output of "git status". We also do not reset
+            # the default status for all the files not in the git status
+            # output: that might be a slow operation that is blocking
+            # GPS. Instead, we only reset the default status for files
+            # that used to be in "git status" (for instance modified
+            # files), and are no longer there (either after a "reset" or
+            # a "commit").
+
+            changed = self.__changed_files(head, index_changed)
+            if changed is not None:
+                changed.update(files)
+                if len(changed) > self.max_status_paths:
+                    changed = None
+
+            if changed is None:
+                # Query all files, but keep the ignored files
+                yield self.__git_status(s)
+                for f in self.__ignored_files:
+                    s.set_status(f, GPS.VCS2.Status.IGNORED)
+                nondefault = set(s.files_with_explicit_status)
+                now_default = self._non_default_files.difference(
+                    nondefault)
+
+            else:
+                ignored = set()
+                if changed:
+                    yield self.__git_status(
+                        s, paths=[self._relpath(f.path) for f in changed],
+                        ignored_files=ignored)
+                self.__ignored_files.difference_update(changed)
+                self.__ignored_files.update(ignored)
+                nondefault = set(s.files_with_explicit_status)
+                now_default = changed.difference(nondefault)
+                nondefault.update(
+                    self._non_default_files.difference(changed))
+
             self._non_default_files = nondefault
             for f in now_default:
                 s.set_status(f, self.default_status)
 
+        self.__index_mtime = _mtime(self.__index_file)
+        self.__head = head
+        self.__mtimes = dict(
+            (f, _mtime(f.path)) for f in self._non_default_files
+            if f not in self.__ignored_files)
+
         s.set_status_for_remaining_files(files)
 
     @core.run_in_background
@@ -173,7 +414,8 @@ class Git(core.VCS):
         p = self._git(['add' if stage else 'reset'] + [f.path for f in files],
                       block_exit=True)
         yield p.wait_until_terminate(show_if_error=True)
-        yield self.async_fetch_status_for_all_files(from_user=False)
+        yield self.async_fetch_status_for_all_files(
+            from_user=False, extra_files=files)
 
     @core.run_in_background
     def async_commit_staged_files(self, visitor, message):
@@ -240,75 +482,92 @@ class Git(core.VCS):
         :returntype set: will contain the sha1 of the commits
         """
         unpushed = set()
-        p = self._git(['cherry'])
+        p = self._git(['cherry'], priority=PRIORITY_BACKGROUND)
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 break
-            unpushed.add(line[2:])
+            for line in batch:
+                unpushed.add(line[2:])
         yield unpushed
 
     def _has_local_changes(self):
         """
         Check whether there is any uncomitted change.
         """
-        p = self._git(['diff-index', '--quiet', 'HEAD', '--'])
+        p = self._git(['diff-index', '--quiet', 'HEAD', '--'],
+                      priority=PRIORITY_BACKGROUND)
         status, _ = yield p.wait_until_terminate()
         yield status != 0
 
-    @core.run_in_background
-    def async_fetch_history(self, visitor, filter):
-        # Compute, in parallel, needed pieces of information
-        (unpushed, has_local) = yield join(
-            self._unpushed_local_changes(),
-            self._has_local_changes())
+    def _refs_state(self):
+        """
+        Return the output of "git show-ref" and of the branch pointed to by
+        HEAD, which change whenever the history might have changed.
+        """
+        head, refs = yield join(
+            self._git(['symbolic-ref', '-q', 'HEAD'],
+                      priority=PRIORITY_BACKGROUND).wait_until_terminate(),
+            self._git(['show-ref', '--head'],
+                      priority=PRIORITY_BACKGROUND).wait_until_terminate())
+        yield head[1] + refs[1]
+
+    # Number of commits sent to the History view at once
+    history_page_size = 500
 
-        # Then fetch the history
+    def __history_from_author(self, history, key, author):
+        """
+        Fill history with the commits of author already known from the
+        history of key without a filter. This is only done when author is
+        not a regular expression, so that git and python would match the
+        same commits.
+        """
+        base = self.__histories.get((key[0], '', key[2]))
+        is_regexp = any(c in author for c in '.^$*+?{}[]\\|()')
+        if base is not None and not is_regexp:
+            history.commits = [c for c in base.commits
+                               if author in '%s <%s>' % (c[2], c[3])]
+            history.complete = base.complete
 
+    @core.run_in_background
+    def async_fetch_history(self, visitor, filter):
         max_lines = filter[0]
         for_file = filter[1]
         pattern = filter[2]
         current_branch_only = filter[3]
         branch_commits_only = filter[4]
 
-        filter_switch = ''
-        if pattern:
+        # Compute, in parallel, needed pieces of information. The parsed
+        # commits are kept as long as the references do not change.
+        (refs, has_local) = yield join(
+            self._refs_state(),
+            self._has_local_changes())
+
+        if refs != self.__history_refs or self.__unpushed is None:
+            (self.__unpushed, ) = yield join(self._unpushed_local_changes())
+            self.__history_refs = refs
+            self.__histories = {}
+            self.__commits = {}
+
+        unpushed = self.__unpushed
+        key = (for_file.path if for_file else None, pattern,
+               current_branch_only)
+        history = self.__histories.get(key)
+        if history is None:
+            history = self.__histories[key] = _History()
             if pattern.startswith('author:'):
-                filter_switch = '--author=%s' % pattern[7:]
-            elif pattern.startswith('code:'):
-                filter_switch = '-S=%s' % pattern[5:]
-            else:
-                filter_switch = '--grep=%s' % pattern
-
-        git_cmd = [
-            'log',
-            # use tformat to get final newline
-            '--pretty=tformat:%H@@%P@@%an@@%D@@%cD@@%s',
-            '--branches' if not current_branch_only else '',
-            '--tags' if not current_branch_only else '',
-            '--remotes' if not current_branch_only else '']
-        if for_file:
-            git_cmd.append('--follow')
-        git_cmd += [
-            '--topo-order',  # children before parents
-            filter_switch,
-            '--max-count=%d' % max_lines if not branch_commits_only else '',
-            '%s' % for_file.path if for_file else '']
-        p = self._git(git_cmd)
+                self.__history_from_author(history, key, pattern[7:])
 
         children = {}   # number of children for each sha1
-        result = []
-        count = 0
-
-        while True:
-            line = yield p.wait_line()
-            if line is None or '@@' not in line:
-                GPS.Logger("GIT").log("finished git-status")
-                break
+        page = []
+        count = [0]
 
-            id, parents, author, branches, date, subject = line.split('@@')
-            parents = parents.split()
-            branches = None if not branches else branches.split(',')
+        def add(commit):
+            """
+            Add one commit to the page sent to the History view, and
+            return True if enough commits were sent.
+            """
+            id, parents, author, _, branches, date, subject = commit
 
             has_head = None
 
@@ -339,15 +598,15 @@ class Git(core.VCS):
             # Append a dummy entry if we have local changes, and
             # we have the HEAD
             if has_head is not None and has_local:
-                result.insert(0, GPS.VCS2.Commit(
+                page.insert(0, GPS.VCS2.Commit(
                     LOCAL_CHANGES_ID, '', '', '<uncommitted changes>',
                     parents=[has_head],
                     flags=GPS.VCS2.Commit.Flags.UNCOMMITTED |
                     GPS.VCS2.Commit.Flags.UNPUSHED))
 
-            current = GPS.VCS2.Commit(
+            page.append(GPS.VCS2.Commit(
                 id, author, date, subject, parents, branch_descr,
-                flags=flags)
+                flags=flags))
 
             if branch_commits_only:
                 for pa in parents:
@@ -358,15 +617,81 @@ class Git(core.VCS):
                         branches is not None or
                         id not in children or
                         children[id] > 1):
-                    count += 1
+                    count[0] += 1
+            else:
+                count[0] += 1
 
-            result.append(current)
-            if count >= max_lines:
+            if len(page) >= self.history_page_size:
+                visitor.history_lines(page)
+                del page[:]
+
+            return count[0] >= max_lines
+
+        # First send the commits we already know about
+
+        done = False
+        for commit in history.commits:
+            done = add(commit)
+            if done:
                 break
 
+        # Then resume "git log" after them
+
+        if not done and not history.complete:
+            filter_switch = ''
+            if pattern:
+                if pattern.startswith('author:'):
+                    filter_switch = '--author=%s' % pattern[7:]
+                elif pattern.startswith('code:'):
+                    filter_switch = '-S=%s' % pattern[5:]
+                else:
+                    filter_switch = '--grep=%s' % pattern
+
+            git_cmd = [
+                'log',
+                # use tformat to get final newline
+                '--pretty=tformat:%H@@%P@@%an@@%ae@@%D@@%cD@@%s',
+                '--branches' if not current_branch_only else '',
+                '--tags' if not current_branch_only else '',
+                '--remotes' if not current_branch_only else '']
+            if for_file:
+                git_cmd.append('--follow')
+            git_cmd += [
+                '--topo-order',  # children before parents
+                filter_switch,
+                '--skip=%d' % len(history.commits) if history.commits else '',
+                '--max-count=%d' % (max_lines - count[0])
+                if not branch_commits_only else '',
+                '%s' % for_file.path if for_file else '']
+            p = self._git(git_cmd, priority=PRIORITY_INTERACTIVE)
+
+            while not done:
+                batch = yield p.wait_lines()
+                if batch is None:
+                    batch = ['']   # end of output, same as unexpected line
+
+                for line in batch:
+                    if '@@' not in line:
+                        GPS.Logger("GIT").log("finished git-log")
+                        history.complete = done = True
+                        break
+
+                    id = line[:line.find('@@')]
+                    commit = self.__commits.get(id)
+                    if commit is None:
+                        commit = self.__commits[id] = _parse_log_line(line)
+                    history.commits.append(commit)
+
+                    if add(commit):
+                        # Do not wait for the rest of the history
+                        p.terminate()
+                        done = True
+                        break
+
         GPS.Logger("GIT").log(
-            "done parsing git-log (%s lines)" % (len(result), ))
-        visitor.history_lines(result)
+            "done parsing git-log (%s lines, %s known)" % (
+                len(history.commits), len(self.__commits)))
+        visitor.history_lines(page)
 
     @core.run_in_background
     def async_fetch_commit_details(self, ids, visitor):
@@ -374,7 +699,8 @@ class Git(core.VCS):
             # If there are unstaged changes, show those, otherwise
             # show the staged changes
 
-            p = self._git(['diff', '--exit-code'])
+            p = self._git(['diff', '--exit-code'],
+                          priority=PRIORITY_INTERACTIVE)
             status, output = yield p.wait_until_terminate()
             if status != 0:
                 visitor.set_details(
@@ -382,7 +708,8 @@ class Git(core.VCS):
                     'Unstaged local changes',
                     output)
 
-            p = self._git(['diff', '--cached', '--exit-code'])
+            p = self._git(['diff', '--cached', '--exit-code'],
+                          priority=PRIORITY_INTERACTIVE)
             status, output = yield p.wait_until_terminate()
             if status != 0:
                 visitor.set_details(
@@ -411,7 +738,8 @@ class Git(core.VCS):
              '-p' if len(ids) == 1 else '--name-only',
              '--stat' if len(ids) == 1 else '',
              '--notes',   # show notes
-             '--pretty=format:%s' % format] + ids)
+             '--pretty=format:%s' % format] + ids,
+            priority=PRIORITY_INTERACTIVE)
         id = ""
         message = []
         header = []
@@ -423,32 +751,33 @@ class Git(core.VCS):
                     id, '\n'.join(header), '\n'.join(message))
 
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 _emit()
                 break
+            for line in batch:
+                if line.startswith('commit '):
+                    _emit()
+                    id = line[7:]
+                    message = []
+                    header = [line]
+                    in_header = True
+
+                elif in_header:
+                    if not line:
+                        in_header = False
+                        message = ['']
+                    else:
+                        header.append(line)
 
-            if line.startswith('commit '):
-                _emit()
-                id = line[7:]
-                message = []
-                header = [line]
-                in_header = True
-
-            elif in_header:
-                if not line:
-                    in_header = False
-                    message = ['']
                 else:
-                    header.append(line)
-
-            else:
-                message.append(line)
+                    message.append(line)
 
     @core.run_in_background
     def async_view_file(self, visitor, ref, file):
         f = os.path.relpath(file.path, self.working_dir.path)
-        p = self._git(['show', '%s:%s' % (ref, f)])
+        p = self._git(['show', '%s:%s' % (ref, f)],
+                      priority=PRIORITY_INTERACTIVE)
         status, output = yield p.wait_until_terminate()
         visitor.file_computed(output)
 
@@ -456,46 +785,151 @@ class Git(core.VCS):
     def async_diff(self, visitor, ref, file):
         p = self._git(
             ['diff', '--no-prefix',
-             ref, '--', file.path if file else ''])
+             ref, '--', file.path if file else ''],
+            priority=PRIORITY_INTERACTIVE)
         status, output = yield p.wait_until_terminate()
         if status == 0:
             visitor.diff_computed(output)
         else:
             GPS.Logger("GIT").log("Error computing diff: %s" % output)
 
-    @core.run_in_background
-    def async_annotations(self, visitor, file):
-        info = {}   # for each commit id, the annotation
-        current_id = None
-        first_line = 1
-        lines = []
-        ids = []
+    # Number of blames kept in memory, and on the disk
+    max_blames_in_memory = 10
+    max_blames_on_disk = 200
 
-        p = self._git(['blame', '--porcelain', file.path])
-        while True:
-            line = yield p.wait_line()
-            if line is None:
-                break
+    # Maximum number of locally modified ranges that are blamed separately.
+    # Files with more changes are blamed again entirely.
+    max_blame_ranges = 50
 
-            if current_id is None:
-                current_id = line.split(' ', 1)[0]
+    def __blame_cache_file(self, key):
+        return os.path.join(GPS.get_home_dir(), 'git_blame', key + '.json')
 
-            elif line[0] == '\t':
-                # The line of code, which we ignore
-                lines.append(info[current_id])
-                ids.append(current_id)
-                current_id = None
+    def __load_blame(self, key):
+        """
+        Return the cached blame for key, as (ids, info), or None.
+        """
+        blame = self.__blames.pop(key, None)
+        if blame is None:
+            try:
+                with open(self.__blame_cache_file(key)) as f:
+                    data = json.load(f)
+                blame = (data['ids'], data['info'])
+            except Exception:
+                return None
+
+        self.__blames[key] = blame
+        while len(self.__blames) > self.max_blames_in_memory:
+            self.__blames.popitem(last=False)
+        return blame
+
+    def __save_blame(self, key, blame):
+        self.__blames[key] = blame
+        while len(self.__blames) > self.max_blames_in_memory:
+            self.__blames.popitem(last=False)
+
+        filename = self.__blame_cache_file(key)
+        try:
+            dirname = os.path.dirname(filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            with open(filename, 'w') as f:
+                json.dump({'ids': blame[0], 'info': blame[1]}, f)
+
+            # Remove the oldest blames
+            files = [os.path.join(dirname, n) for n in os.listdir(dirname)]
+            if len(files) > self.max_blames_on_disk:
+                files.sort(key=os.path.getmtime)
+                for n in files[:len(files) - self.max_blames_on_disk]:
+                    os.remove(n)
+        except Exception:
+            GPS.Logger("GIT").log("Could not save blame in %s" % filename)
+
+    def __blame(self, args, parser):
+        """
+        Run "git blame" and parse its output
+        :param list(str) args: the arguments for "git blame"
+        :param _Blame_Parser parser: the parser
+        """
+        p = self._git(['blame', '--porcelain'] + args,
+                      priority=PRIORITY_INTERACTIVE)
+        yield p.stream.subscribe(parser)  # wait until p ends
 
-            elif line.startswith('author '):
-                info[current_id] = line[7:17]  # at most 10 chars
+    @core.run_in_background
+    def async_annotations(self, visitor, file):
+        path = self._relpath(file.path).replace(os.sep, '/')
+
+        rev, diff = yield join(
+            self._git(['rev-parse', 'HEAD', 'HEAD:%s' % path],
+                      priority=PRIORITY_INTERACTIVE).wait_until_terminate(),
+            self._git(['diff', '-U0', '--no-color', '--no-ext-diff',
+                       'HEAD', '--', path],
+                      priority=PRIORITY_INTERACTIVE).wait_until_terminate())
+
+        if rev[0] != 0:
+            # No commit yet, or file not under version control
+            parser = _Blame_Parser()
+            yield self.__blame([file.path], parser)
+            ids = [parser.ids[line] for line in sorted(parser.ids)]
+            info = parser.info
 
-            elif line.startswith('committer-time '):
-                d = datetime.datetime.fromtimestamp(
-                    int(line[15:])).strftime('%Y%m%d')
-                info[current_id] = '%s %10s %s' % (
-                    d, info[current_id], current_id[0:7])
+        else:
+            # The blame of the committed file only changes with HEAD, and
+            # is cached
+            key = '-'.join(rev[1].split())
+            blame = self.__load_blame(key)
+            if blame is None:
+                parser = _Blame_Parser()
+                yield self.__blame(['HEAD', '--', path], parser)
+                blame = ([parser.ids[line] for line in sorted(parser.ids)],
+                         parser.info)
+                self.__save_blame(key, blame)
+            ids, info = blame
+
+            # Only blame the lines that were modified locally
+
+            hunks = re.findall(
+                r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@', diff[1],
+                re.MULTILINE)
+            if len(hunks) > self.max_blame_ranges:
+                parser = _Blame_Parser()
+                yield self.__blame(['--', path], parser)
+                ids = [parser.ids[line] for line in sorted(parser.ids)]
+                info = parser.info
+
+            elif hunks:
+                new_ids = []
+                ranges = []
+                old_line = 1   # next line of the committed file to copy
+
+                for old_start, old_count, new_start, new_count in hunks:
+                    old_count = int(old_count or 1)
+                    new_count = int(new_count or 1)
+                    old_start = int(old_start)
+                    if old_count == 0:
+                        old_start += 1   # lines inserted after old_start
+
+                    new_ids.extend(ids[old_line - 1:old_start - 1])
+                    old_line = old_start + old_count
+                    if new_count:
+                        ranges += ['-L', '%s,+%d' % (new_start, new_count)]
+                        new_ids.extend(
+                            int(new_start) + n for n in range(new_count))
+
+                new_ids.extend(ids[old_line - 1:])
+
+                if ranges:
+                    parser = _Blame_Parser()
+                    yield self.__blame(ranges + ['--', path], parser)
+                    ids = [parser.ids.get(id, '') if isinstance(id, int)
+                           else id for id in new_ids]
+                    info = dict(info)
+                    info.update(parser.info)
+                else:
+                    # Lines were only deleted, the cached blame is enough
+                    ids = new_ids
 
-        visitor.annotations(file, first_line, ids, lines)
+        lines = [info.get(id, '') for id in ids]
+        visitor.annotations(file, 1, ids, lines)
 
     def _branches(self, visitor):
         """
@@ -516,81 +950,85 @@ class Git(core.VCS):
             "(ahead (?P<ahead>\d+),?)?\s*"
             "(behind (?P<behind>\d+))?")
 
-        p = self._git(['branch', '-a', '--list', '--no-color', '-vv'])
+        p = self._git(['branch', '-a', '--list', '--no-color', '-vv'],
+                      priority=PRIORITY_BACKGROUND)
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.branches(
                     CAT_BRANCHES, 'vcs-branch-symbolic', CAN_RENAME, branches)
                 visitor.branches(
                     CAT_REMOTES, 'vcs-cloud-symbolic', not CAN_RENAME, remotes)
                 break
-            m = r.search(line)
-            if m:
-                n = m.group('name')
-                emblem = []
-                m2 = emblem_r.search(m.group('tracking') or '')
-                if m2:
-                    n = '%s (%s)' % (n, m2.group('tracking'))
-                    if m2.group('ahead'):
-                        emblem.append("%s%s%s%s" % (
-                            chr(226), chr(134), chr(145),
-                            m2.group('ahead')))
-                    if m2.group('behind'):
-                        emblem.append("%s%s%s%s" % (
-                            chr(226), chr(134), chr(147),
-                            m2.group('behind')))
-
-                emblem = ' '.join(emblem)
-
-                if n.startswith('remotes/'):
-                    remotes.append(
-                        GPS.VCS2.Branch(
-                            name=n[8:],
-                            active=m.group('current') is not None,
-                            annotation=emblem,
-                            id=m.group('name')))
-                else:
-                    branches.append(
-                        GPS.VCS2.Branch(
-                            name=n,
-                            active=m.group('current') is not None,
-                            annotation=emblem,
-                            id=m.group('name')))
+            for line in batch:
+                m = r.search(line)
+                if m:
+                    n = m.group('name')
+                    emblem = []
+                    m2 = emblem_r.search(m.group('tracking') or '')
+                    if m2:
+                        n = '%s (%s)' % (n, m2.group('tracking'))
+                        if m2.group('ahead'):
+                            emblem.append("%s%s%s%s" % (
+                                chr(226), chr(134), chr(145),
+                                m2.group('ahead')))
+                        if m2.group('behind'):
+                            emblem.append("%s%s%s%s" % (
+                                chr(226), chr(134), chr(147),
+                                m2.group('behind')))
+
+                    emblem = ' '.join(emblem)
+
+                    if n.startswith('remotes/'):
+                        remotes.append(
+                            GPS.VCS2.Branch(
+                                name=n[8:],
+                                active=m.group('current') is not None,
+                                annotation=emblem,
+                                id=m.group('name')))
+                    else:
+                        branches.append(
+                            GPS.VCS2.Branch(
+                                name=n,
+                                active=m.group('current') is not None,
+                                annotation=emblem,
+                                id=m.group('name')))
 
     def _tags(self, visitor):
         """
         A generator that returns the list of all known tags
         via `visitor.branches`
         """
-        p = self._git(['tag'])
+        p = self._git(['tag'], priority=PRIORITY_BACKGROUND)
         tags = []
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.branches(
                     CAT_TAGS, 'vcs-tag-symbolic', CAN_RENAME, tags)
                 break
-            tags.append(GPS.VCS2.Branch(
-                name=line, active=False, annotation='', id=line))
+            for line in batch:
+                tags.append(GPS.VCS2.Branch(
+                    name=line, active=False, annotation='', id=line))
 
     def _stashes(self, visitor):
         """
         A generator that returns the list of all known stashes via
         `visitor.branches`.
         """
-        p = self._git(['stash', 'list'])
+        p = self._git(['stash', 'list'], priority=PRIORITY_BACKGROUND)
         stashes = []
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.branches(
                     'stashes', 'vcs-stash-symbolic', not CAN_RENAME, stashes)
                 break
-            name, branch, descr = line.split(':', 3)
-            stashes.append(GPS.VCS2.Branch(
-                name='%s: %s' % (name, descr), active=False,
-                annotation=branch, id=name))
+            for line in batch:
+                name, branch, descr = line.split(':', 3)
+                stashes.append(GPS.VCS2.Branch(
+                    name='%s: %s' % (name, descr), active=False,
+                    annotation=branch, id=name))
 
     def _worktrees(self, visitor):
         """
@@ -603,46 +1041,49 @@ class Git(core.VCS):
         trees = []
         current = []
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 # Do not report if we only have the current directory
                 if len(trees) > 1:
                     visitor.branches(
                         CAT_WORKTREES, 'vcs-git-worktrees-symbolic',
                         not CAN_RENAME, trees)
                 break
-            elif not line:
-                trees.append(current)
-            elif line.startswith('worktree '):
-                current = GPS.VCS2.Branch(
-                    name='"%s"' % line[9:],   # quoted not to expand '/'
-                    active=self.working_dir == GPS.File(line[9:]),
-                    annotation='',
-                    id='')   # unique id
-            elif line.startswith('HEAD '):
-                current[3] = line[5:]   # unique id
-            elif line.startswith('branch '):
-                current[2] = line[7:]   # details
-            elif line.startswith('detached'):
-                current[2] = 'detached'  # details
+            for line in batch:
+                if not line:
+                    trees.append(current)
+                elif line.startswith('worktree '):
+                    current = GPS.VCS2.Branch(
+                        name='"%s"' % line[9:],   # quoted not to expand '/'
+                        active=self.working_dir == GPS.File(line[9:]),
+                        annotation='',
+                        id='')   # unique id
+                elif line.startswith('HEAD '):
+                    current[3] = line[5:]   # unique id
+                elif line.startswith('branch '):
+                    current[2] = line[7:]   # details
+                elif line.startswith('detached'):
+                    current[2] = 'detached'  # details
 
     def _submodules(self, visitor):
         """
         A generator that returns the list of submodules via `visitor.branches`
         """
-        p = self._git(['submodule', 'status', '--recursive'])
+        p = self._git(['submodule', 'status', '--recursive'],
+                      priority=PRIORITY_BACKGROUND)
         modules = []
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 if len(modules) != 0:
                     visitor.branches(
                         CAT_SUBMODULES, 'vcs-submodules-symbolic',
                         not CAN_RENAME, modules)
                 break
-            _, sha1, name, _ = line.split(' ', 3)
-            modules.append(GPS.VCS2.Branch(
-                name=name, active=False, annotation='', id=sha1))
+            for line in batch:
+                _, sha1, name, _ = line.split(' ', 3)
+                modules.append(GPS.VCS2.Branch(
+                    name=name, active=False, annotation='', id=sha1))
 
     @core.run_in_background
     def async_branches(self, visitor):
@@ -662,7 +1103,8 @@ class Git(core.VCS):
         def online(line):
             result.resolve(line)
 
-        p = self._git(['rev-parse', '--abbrev-ref', 'HEAD'])
+        p = self._git(['rev-parse', '--abbrev-ref', 'HEAD'],
+                      priority=PRIORITY_BACKGROUND)
         p.lines.subscribe(online)
         return result
 
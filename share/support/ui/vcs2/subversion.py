@@ -2,7 +2,7 @@ from . import core, core_staging
 import GPS
 import re
 import os
-from workflows.promises import ProcessWrapper, join
+from workflows.promises import ProcessWrapper, join, PRIORITY_BACKGROUND
 
 
 CAT_BRANCHES = 'BRANCHES'
@@ -24,15 +24,19 @@ class SVN(core_staging.Emulate_Staging,
     def discover_working_dir(file):
         return core.find_admin_directory(file, '.svn')
 
-    def _svn(self, args, block_exit=False, spawn_console=False):
+    def _svn(self, args, block_exit=False, spawn_console=False,
+             priority=None):
         """
-        Execute svn with the given arguments
+        Execute svn with the given arguments. Only read-only queries should
+        be given a priority and queued, commands that modify the repository
+        are started immediately.
         """
         return ProcessWrapper(
             ['svn', '--non-interactive'] + args,
             block_exit=block_exit,
             spawn_console=spawn_console,
-            directory=self.working_dir.path)
+            directory=self.working_dir.path,
+            priority=None if block_exit else priority)
 
     @core.vcs_action(icon='vcs-cloud-symbolic',
                      name='svn update',
@@ -48,63 +52,65 @@ class SVN(core_staging.Emulate_Staging,
             list = [self._relpath(arg) for arg in args]
             p = self._svn(
                 # -u: Compare with server (slower but more helpful)
-                ['status', '-v', '-u'] + list)
+                ['status', '-v', '-u'] + list,
+                priority=PRIORITY_BACKGROUND)
 
             while True:
-                line = yield p.wait_line()
-                if line is None:
+                batch = yield p.wait_lines()
+                if batch is None:
                     break
+                for line in batch:
+                    m = self.__re_status.search(line)
+                    if m:
+                        f = os.path.join(
+                            self.working_dir.path, m.group('file'))
+                        rev = m.group('rev')   # current checkout
+                        rrev = m.group('lastcommit')  # only if we use '-u'
+
+                        if line[0] == ' ':
+                            status = GPS.VCS2.Status.UNMODIFIED
+                        elif line[0] == 'A':
+                            status = GPS.VCS2.Status.STAGED_ADDED
+                        elif line[0] == 'D':
+                            status = GPS.VCS2.Status.STAGED_DELETED
+                        elif line[0] == 'M':
+                            status = GPS.VCS2.Status.MODIFIED
+                        elif line[0] == 'C':
+                            status = GPS.VCS2.Status.CONFLICT
+                        elif line[0] == 'X':
+                            status = GPS.VCS2.Status.UNTRACKED
+                        elif line[0] == 'I':
+                            status = GPS.VCS2.Status.IGNORED
+                        elif line[0] == '?':
+                            status = GPS.VCS2.Status.UNTRACKED
+                        elif line[0] == '!':
+                            status = GPS.VCS2.Status.DELETED
+                        elif line[0] == '-':
+                            status = GPS.VCS2.Status.CONFLICT
+                        else:
+                            status = 0
 
-                m = self.__re_status.search(line)
-                if m:
-                    f = os.path.join(self.working_dir.path, m.group('file'))
-                    rev = m.group('rev')   # current checkout
-                    rrev = m.group('lastcommit')  # only if we use '-u'
-
-                    if line[0] == ' ':
-                        status = GPS.VCS2.Status.UNMODIFIED
-                    elif line[0] == 'A':
-                        status = GPS.VCS2.Status.STAGED_ADDED
-                    elif line[0] == 'D':
-                        status = GPS.VCS2.Status.STAGED_DELETED
-                    elif line[0] == 'M':
-                        status = GPS.VCS2.Status.MODIFIED
-                    elif line[0] == 'C':
-                        status = GPS.VCS2.Status.CONFLICT
-                    elif line[0] == 'X':
-                        status = GPS.VCS2.Status.UNTRACKED
-                    elif line[0] == 'I':
-                        status = GPS.VCS2.Status.IGNORED
-                    elif line[0] == '?':
-                        status = GPS.VCS2.Status.UNTRACKED
-                    elif line[0] == '!':
-                        status = GPS.VCS2.Status.DELETED
-                    elif line[0] == '-':
-                        status = GPS.VCS2.Status.CONFLICT
-                    else:
-                        status = 0
-
-                    # Properties
-                    if line[1] == 'M':
-                        status = status | GPS.VCS2.Status.MODIFIED
-                    elif line[1] == 'C':
-                        status = status | GPS.VCS2.Status.CONFLICT
-
-                    if line[2] == 'L':
-                        status = status | GPS.VCS2.Status.LOCAL_LOCKED
-
-                    if line[5] == 'K':
-                        status = status | GPS.VCS2.Status.LOCAL_LOCKED
-                    elif line[5] in ('O', 'T'):
-                        status = status | GPS.VCS2.Status.LOCKED_BY_OTHER
-
-                    if line[6] == 'C':
-                        status = status | GPS.VCS2.Status.CONFLICT
-
-                    if line[7] == '*':   # Only if we use -u
-                        status = status | GPS.VCS2.Status.NEEDS_UPDATE
-
-                    s.set_status(GPS.File(f), status, rev, rrev)
+                        # Properties
+                        if line[1] == 'M':
+                            status = status | GPS.VCS2.Status.MODIFIED
+                        elif line[1] == 'C':
+                            status = status | GPS.VCS2.Status.CONFLICT
+
+                        if line[2] == 'L':
+                            status = status | GPS.VCS2.Status.LOCAL_LOCKED
+
+                        if line[5] == 'K':
+                            status = status | GPS.VCS2.Status.LOCAL_LOCKED
+                        elif line[5] in ('O', 'T'):
+                            status = status | GPS.VCS2.Status.LOCKED_BY_OTHER
+
+                        if line[6] == 'C':
+                            status = status | GPS.VCS2.Status.CONFLICT
+
+                        if line[7] == '*':   # Only if we use -u
+                            status = status | GPS.VCS2.Status.NEEDS_UPDATE
+
+                        s.set_status(GPS.File(f), status, rev, rrev)
 
     @core.run_in_background
     def async_commit_staged_files(self, visitor, message):
@@ -161,7 +167,8 @@ class SVN(core_staging.Emulate_Staging,
                             self.current[3] += '\n'
                         self.current[3] += line   # subject
 
-        p = self._svn(['log', '--non-interactive'] + args)
+        p = self._svn(['log', '--non-interactive'] + args,
+                      priority=PRIORITY_BACKGROUND)
         return p.lines.flatMap(line_to_block())
 
     @core.run_in_background
@@ -201,13 +208,15 @@ class SVN(core_staging.Emulate_Staging,
     @core.run_in_background
     def async_diff(self, visitor, ref, file):
         p = self._svn(['diff', '-r%s' % ref,
-                       self._relpath(file.path) if file else ''])
+                       self._relpath(file.path) if file else ''],
+                      priority=PRIORITY_BACKGROUND)
         status, output = yield p.wait_until_terminate()
         visitor.diff_computed(output)
 
     @core.run_in_background
     def async_view_file(self, visitor, ref, file):
-        p = self._svn(['cat', '-r%s' % ref, self._relpath(file.path)])
+        p = self._svn(['cat', '-r%s' % ref, self._relpath(file.path)],
+                      priority=PRIORITY_BACKGROUND)
         status, output = yield p.wait_until_terminate()
         visitor.file_computed(output)
 
@@ -221,20 +230,21 @@ class SVN(core_staging.Emulate_Staging,
             "(?P<date>....-..-..)")
         lines = []
         ids = []
-        p = self._svn(['annotate', '-v', self._relpath(file.path)])
+        p = self._svn(['annotate', '-v', self._relpath(file.path)],
+                      priority=PRIORITY_BACKGROUND)
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.annotations(file, 1, ids, lines)
                 break
-
-            m = r.search(line)
-            if m:
-                lines.append('%s %10s r%s' % (
-                    m.group('date'),
-                    m.group('author')[:10],
-                    m.group('rev')))
-                ids.append(m.group('rev'))
+            for line in batch:
+                m = r.search(line)
+                if m:
+                    lines.append('%s %10s r%s' % (
+                        m.group('date'),
+                        m.group('author')[:10],
+                        m.group('rev')))
+                    ids.append(m.group('rev'))
 
     def _branches(self, visitor, parent_url):
         """
@@ -243,18 +253,19 @@ class SVN(core_staging.Emulate_Staging,
         branches = [('trunk', parent_url.endswith('/trunk'), '',
                      os.path.join(parent_url, 'trunk'))]
         base = os.path.join(parent_url, 'branches')
-        p = self._svn(['list', base])
+        p = self._svn(['list', base], priority=PRIORITY_BACKGROUND)
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.branches(
                     CAT_BRANCHES, 'vcs-branch-symbolic',
                     not CAN_RENAME, branches)
                 break
-            line = line.rstrip('/')
-            b = os.path.join(base, line)
-            branches.append(GPS.VCS2.Branch(
-                name=line, active=b == parent_url, annotation='', id=b))
+            for line in batch:
+                line = line.rstrip('/')
+                b = os.path.join(base, line)
+                branches.append(GPS.VCS2.Branch(
+                    name=line, active=b == parent_url, annotation='', id=b))
 
     def _tags(self, visitor, parent_url):
         """
@@ -262,30 +273,32 @@ class SVN(core_staging.Emulate_Staging,
         """
         tags = []
         base = os.path.join(parent_url, 'tags')
-        p = self._svn(['list', base])
+        p = self._svn(['list', base], priority=PRIORITY_BACKGROUND)
         while True:
-            line = yield p.wait_line()
-            if line is None:
+            batch = yield p.wait_lines()
+            if batch is None:
                 visitor.branches(
                     CAT_TAGS, 'vcs-tag-symbolic', not CAN_RENAME, tags)
                 break
-            line = line.rstrip('/')
-            b = os.path.join(base, line)
-            tags.append(GPS.VCS2.Branch(
-                name=line, active=b == parent_url, annotation='', id=b))
+            for line in batch:
+                line = line.rstrip('/')
+                b = os.path.join(base, line)
+                tags.append(GPS.VCS2.Branch(
+                    name=line, active=b == parent_url, annotation='', id=b))
 
     @core.run_in_background
     def async_branches(self, visitor):
         url = ''
 
-        p = self._svn(['info'])
-        while True:
-            line = yield p.wait_line()
-            if line is None:
-                break
-            if line.startswith('URL: '):
-                url = line[5:]
+        p = self._svn(['info'], priority=PRIORITY_BACKGROUND)
+        while not url:
+            batch = yield p.wait_lines()
+            if batch is None:
                 break
+            for line in batch:
+                if line.startswith('URL: '):
+                    url = line[5:]
+                    break
 
         if url:
             # Assume the standard 'trunk', 'branches' and 'tags' naming
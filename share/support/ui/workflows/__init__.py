@@ -117,8 +117,10 @@ is executed.
 
 import inspect
 import sys
+import time
 import GPS
 import workflows.promises as promises
+from workflows.profiler import profiler
 import traceback
 import types
 
@@ -226,10 +228,14 @@ def driver(gen_inst):
     # original generator and the last one is the most recently spawned one.
     gen_stack = [gen_inst]
 
+    # The promise the workflow is waiting on, for the profiler
+    waiting_on = [None]
+
     def resume(return_val=None):
         """Resume execution for this workflow."""
         el = None
         exc_info = None
+        start = time.time() if profiler.enabled else None
 
         while gen_stack:
             gen = gen_stack[-1]
@@ -286,6 +292,10 @@ def driver(gen_inst):
                 # If the last generator yielded a promise, schedule to resume
                 # its execution when the promise is ready.
                 # ??? Should we connect to reject to cancel the whole workflow?
+                if start is not None:
+                    profiler.record(profiler.workflow_name(gen_inst), gen,
+                                    waiting_on[0], start)
+                    waiting_on[0] = profiler.describe(el, gen)
                 el.then(resume)
                 return
 
@@ -293,6 +303,10 @@ def driver(gen_inst):
             return_val = el
             exc_info = None
 
+        if start is not None:
+            profiler.record(profiler.workflow_name(gen_inst), None,
+                            waiting_on[0], start)
+
         # If we reach this point, there's nothing to execute anymore: just log
         # any uncaught exception.
         if exc_info is not None:
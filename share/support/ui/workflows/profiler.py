@@ -0,0 +1,175 @@
+"""
+Optional instrumentation of the workflows driver.
+
+When enabled, each time `workflows.driver` resumes a workflow, the profiler
+records how long it ran before it yielded a promise again, the line of the
+generator that yielded, and the promise it had been waiting on. The steps
+are aggregated per workflow, the slow ones are logged, and all of them can
+be exported as a timeline that can be loaded in chrome://tracing.
+
+The profiler is enabled when the WORKFLOWS.PROFILE trace is active (see
+$HOME/.gps/traces.cfg), or from the Python console::
+
+    from workflows.profiler import profiler
+    profiler.enable()
+    ...
+    profiler.log_summary()
+    profiler.export_chrome_trace('/tmp/workflows.json')
+"""
+
+import GPS
+import collections
+import json
+import os
+import time
+
+logger = GPS.Logger("WORKFLOWS.PROFILE")
+
+
+class _WorkflowStats(object):
+    """
+    The steps of all the workflows with the same name.
+    """
+
+    def __init__(self):
+        self.steps = 0           # number of resumes
+        self.total = 0.0         # total time spent in the steps, in seconds
+        self.max = 0.0           # longest step, in seconds
+        self.max_location = ""   # where the longest step yielded
+        self.slow_steps = 0      # number of steps above the threshold
+
+
+class Profiler(object):
+    """
+    Records the steps run by `workflows.driver`. There is a single instance
+    of this class, `profiler`.
+    """
+
+    slow_step_ms = 50
+    # Steps that take longer than this many milliseconds are logged
+
+    max_events = 100000
+    # The number of steps kept for the timeline. Older ones are discarded.
+
+    def __init__(self):
+        self.enabled = logger.active
+        self.stats = {}   # workflow name -> _WorkflowStats
+        self.events = collections.deque(maxlen=self.max_events)
+        # The steps, as (workflow name, location, waiting on, start, end)
+
+    def enable(self, enabled=True):
+        """
+        Start or stop recording the steps of workflows.
+        """
+        self.enabled = enabled
+
+    def reset(self):
+        """
+        Discard all the steps recorded so far.
+        """
+        self.stats.clear()
+        self.events.clear()
+
+    @staticmethod
+    def workflow_name(gen):
+        """
+        The name used to aggregate the steps of a workflow.
+
+        :param gen: the generator passed to `workflows.driver`.
+        :rtype: str
+        """
+        code = gen.gi_code
+        return "%s.%s" % (
+            os.path.splitext(os.path.basename(code.co_filename))[0],
+            code.co_name)
+
+    @staticmethod
+    def location(gen):
+        """
+        The location where gen is suspended, as "file:line".
+
+        :param gen: a generator, or None.
+        :rtype: str
+        """
+        if gen is None or gen.gi_frame is None:
+            return "<terminated>"
+        return "%s:%s" % (os.path.basename(gen.gi_code.co_filename),
+                          gen.gi_frame.f_lineno)
+
+    def describe(self, promise, gen):
+        """
+        Describe the promise that gen is waiting on.
+
+        :param promise: the promise yielded by gen.
+        :param gen: the generator that yielded the promise.
+        :rtype: str
+        """
+        return "%s at %s" % (type(promise).__name__, self.location(gen))
+
+    def record(self, name, gen, waiting_on, start):
+        """
+        Record one step of a workflow, which started at `start`.
+
+        :param str name: the name of the workflow, see `workflow_name`.
+        :param gen: the generator that yielded at the end of the step, or
+           None if the workflow has terminated.
+        :param str waiting_on: the promise that was resolved to resume the
+           workflow, as returned by `describe`, or None for its first step.
+        :param float start: as returned by time.time()
+        """
+        end = time.time()
+        duration = end - start
+        location = self.location(gen)
+        waiting_on = waiting_on or ""
+
+        s = self.stats.get(name)
+        if s is None:
+            s = self.stats[name] = _WorkflowStats()
+        s.steps += 1
+        s.total += duration
+        if duration > s.max:
+            s.max = duration
+            s.max_location = location
+
+        if duration * 1000 >= self.slow_step_ms:
+            s.slow_steps += 1
+            logger.log("slow step in %s: %.1fms, until %s, waited for %s" % (
+                name, duration * 1000, location, waiting_on or "nothing"))
+
+        self.events.append((name, location, waiting_on, start, end))
+
+    def log_summary(self):
+        """
+        Log the time spent in each workflow, the slowest first.
+        """
+        for name, s in sorted(self.stats.iteritems(),
+                              key=lambda item: item[1].total, reverse=True):
+            logger.log(
+                "%s: %d steps, total %.1fms, max %.1fms at %s, %d slow" % (
+                    name, s.steps, s.total * 1000, s.max * 1000,
+                    s.max_location, s.slow_steps))
+
+    def export_chrome_trace(self, filename):
+        """
+        Save the recorded steps in the trace event format, which can be
+        loaded in chrome://tracing.
+
+        :param str filename: the file to create.
+        """
+        events = []
+        for name, location, waiting_on, start, end in self.events:
+            events.append({
+                "name": name,
+                "cat": "workflow",
+                "ph": "X",
+                "ts": int(start * 1000000),
+                "dur": int((end - start) * 1000000),
+                "pid": 1,
+                "tid": 1,
+                "args": {"location": location, "waiting_on": waiting_on}})
+
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events}, f)
+
+
+profiler = Profiler()
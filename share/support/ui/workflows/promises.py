@@ -7,7 +7,12 @@ import time
 from time_utils import TimeDisplay
 
 import GPS
+import collections
 import re
+import sre_constants
+import sre_parse
+import threading
+import traceback
 import types
 from pygps import process_all_events
 from gi.repository import GLib
@@ -434,6 +439,378 @@ def hook(hook_name):
     return p
 
 
+Max_Workers_Pref = GPS.Preference("Plugins/workflows/max_workers")
+Max_Workers_Pref.create(
+    "Max worker threads",
+    "integer",
+    "How many threads can be used to run the CPU-intensive parts of " +
+    "plug-ins, like parsing large files. If 0, these are run in the main " +
+    "thread when GPS is idle. Threads only make progress while GPS lets " +
+    "them take the Python lock, and do not run Python code in parallel.",
+    0, 0, 16)
+# Threads are disabled by default: the Python lock is not known to be
+# released while GPS waits for events in its main loop, in which case the
+# jobs would only progress while the main thread runs Python code.
+
+
+class WorkerPromise(Promise):
+    """
+    The promise returned by `run_in_worker`, which can be cancelled.
+    """
+
+    def __init__(self, fn, args, kwargs):
+        super(WorkerPromise, self).__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancel the computation. It is not run if it was still queued, and
+        its result is ignored otherwise. The promise is rejected with None.
+        """
+        if self._state == Promise.PENDING and not self.cancelled:
+            self.cancelled = True
+            _worker_pool.cancel(self)
+            self.reject(None)
+
+
+class _WorkerPool(object):
+    """
+    A bounded pool of threads that run the functions passed to
+    `run_in_worker`. Threads are created on demand, up to the number set in
+    the preferences, and terminate when they have been idle for a while.
+    """
+
+    idle_seconds = 30
+    # How long a thread waits for a new job before terminating
+
+    def __init__(self):
+        self.__cond = threading.Condition()
+        self.__queue = collections.deque()   # the WorkerPromise to run
+        self.__threads = 0   # number of running threads
+        self.__idle = 0      # number of threads waiting for a job
+
+    def submit(self, job):
+        """
+        Run the job in a thread, as soon as one is available.
+
+        :param WorkerPromise job: the job to run.
+        """
+        max_workers = Max_Workers_Pref.get()
+        if max_workers <= 0:
+            GLib.idle_add(self.__run_in_idle, job)
+            return
+
+        with self.__cond:
+            self.__queue.append(job)
+            if self.__idle == 0 and self.__threads < max_workers:
+                self.__threads += 1
+                t = threading.Thread(target=self.__worker, name="GPS worker")
+                t.daemon = True
+                t.start()
+            else:
+                self.__cond.notify()
+
+    def cancel(self, job):
+        """
+        Remove the job from the queue, if it was not started yet.
+        """
+        with self.__cond:
+            try:
+                self.__queue.remove(job)
+            except ValueError:
+                pass
+
+    def __worker(self):
+        """
+        The main loop of the threads.
+        """
+        while True:
+            with self.__cond:
+                if not self.__queue:
+                    self.__idle += 1
+                    self.__cond.wait(self.idle_seconds)
+                    self.__idle -= 1
+                    if not self.__queue:
+                        self.__threads -= 1
+                        return
+                job = self.__queue.popleft()
+
+            result, error = self.__run(job)
+            GLib.idle_add(self.__deliver, job, result, error)
+
+    def __run(self, job):
+        """
+        Run the job, and return its result and the exception it raised, as
+        a tuple (exception, traceback), if any.
+        """
+        if job.cancelled:
+            return None, None
+        try:
+            return job.fn(*job.args, **job.kwargs), None
+        except Exception as e:
+            # The traceback is formatted here since it is not available
+            # anymore in the main thread
+            return None, (e, traceback.format_exc())
+
+    def __deliver(self, job, result, error):
+        """
+        Resolve the job's promise, in the main thread.
+        """
+        if not job.cancelled:
+            if error is None:
+                job.resolve(result)
+            else:
+                GPS.Logger("PROMISES").log(
+                    "Exception in worker: %s" % (error[1], ))
+                job.reject(error[0])
+        return False
+
+    def __run_in_idle(self, job):
+        """
+        Run the job in the main thread, when no worker thread can be used.
+        """
+        result, error = self.__run(job)
+        return self.__deliver(job, result, error)
+
+
+_worker_pool = _WorkerPool()
+
+
+def run_in_worker(fn, *args, **kwargs):
+    """
+    This primitive runs fn(*args, **kwargs) asynchronously. By default, it
+    is run in an idle callback on the main thread. When the "Max worker
+    threads" preference is set, it is run in a worker thread instead::
+
+        def parse(filename):
+            with open(filename) as f:
+                return json.load(f)
+
+        def my_func():
+            data = yield run_in_worker(parse, filename)
+
+    Since it might run in a separate thread, fn must not call any function
+    from the GPS module, nor modify data that is also used by the main
+    thread. Only a limited number of threads are used, as set in the
+    preferences, and the other calls are queued.
+
+    :return: a WorkerPromise, resolved in the main thread with the value
+       returned by fn, or rejected with the exception it raised. It is
+       rejected with None when it is cancelled.
+    """
+    p = WorkerPromise(fn, args, kwargs)
+    _worker_pool.submit(p)
+    return p
+
+
+_NEXT_LINE = object()
+_NEXT_LINES = object()
+# Special patterns for ProcessWrapper, to wait for the next line or lines
+
+
+def _has_assertions(parsed):
+    """
+    Whether a parsed regular expression contains assertions like "^", "$",
+    "\\b" or lookarounds, which inspect the text around the match.
+
+    :param parsed: as returned by sre_parse.parse, or part of it.
+    :rtype: bool
+    """
+    if isinstance(parsed, sre_parse.SubPattern):
+        parsed = parsed.data
+    if isinstance(parsed, (list, tuple)):
+        if parsed and parsed[0] in (sre_constants.AT,
+                                    sre_constants.ASSERT,
+                                    sre_constants.ASSERT_NOT):
+            return True
+        return any(_has_assertions(p) for p in parsed)
+    return False
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+# The priorities of the processes started through the ProcessScheduler.
+# Interactive processes are those the user is waiting for.
+
+
+Max_Processes_Pref = GPS.Preference("Plugins/workflows/max_processes")
+Max_Processes_Pref.create(
+    "Max parallel processes",
+    "integer",
+    "How many processes started in the background (for instance to " +
+    "refresh the VCS status) can run at the same time. The others are " +
+    "queued until one of them terminates.", 4, 1, 64)
+
+
+class _ScheduledCommand(object):
+    """
+    A command queued or started by the ProcessScheduler. It is shared by
+    all the ProcessWrapper that requested the same command while it was
+    queued, and forwards the output of the process to each of them.
+    """
+
+    def __init__(self, scheduler, key, priority, seq):
+        self.scheduler = scheduler
+        self.key = key    # (command, directory, regexp, single_line_regexp)
+        self.priority = priority
+        self.seq = seq    # to start commands of the same priority in order
+        self.block_exit = False
+        self.process = None   # set when the command is started
+
+        # List of (wrapper, on_start, on_match, on_exit)
+        self.waiters = []
+
+    def on_match(self, process, match, unmatch):
+        for _, _, on_match, _ in list(self.waiters):
+            on_match(process, match, unmatch)
+
+    def on_exit(self, process, status, remaining_output):
+        waiters, self.waiters = self.waiters, []
+        for _, _, _, on_exit in waiters:
+            on_exit(process, status, remaining_output)
+        self.scheduler._terminated(self)
+
+
+class ProcessScheduler(object):
+    """
+    Limits the number of processes that run in parallel, as set in the
+    preferences. Other processes are queued, interactive ones first, and
+    one slot is always kept for interactive processes.
+
+    Identical commands (same arguments, directory and regexp) queued at the
+    same time are merged, and run only once: all their ProcessWrapper
+    receive the same output. Commands that have already started are never
+    merged, since their output might already be obsolete.
+
+    There is a single instance of this class, `process_scheduler`, which is
+    used by ProcessWrapper when it is given a priority.
+    """
+
+    def __init__(self):
+        self.__queue = []     # the _ScheduledCommand waiting for a slot
+        self.__queued = {}    # key -> the queued _ScheduledCommand
+        self.__seq = 0
+        self.running = 0      # number of processes currently running
+        self.merged = 0       # number of commands that were merged
+
+        # Functions called with no argument when the queue changes
+        self.listeners = []
+
+    @property
+    def queued(self):
+        """
+        The number of commands waiting for a slot.
+
+        :rtype: int
+        """
+        return len(self.__queue)
+
+    def schedule(self, waiter, command, directory, regexp,
+                 single_line_regexp, block_exit, priority,
+                 on_start, on_match, on_exit):
+        """
+        Queue a command, or merge it with an identical queued command.
+
+        :param waiter: the object that requests the command, used to
+           cancel it.
+        :param list(str) command: the command line.
+        :param on_start: called with the GPS.Process when it is started.
+        :param on_match: called as GPS.Process's on_match.
+        :param on_exit: called as GPS.Process's on_exit.
+        :return: the _ScheduledCommand, to pass to `cancel`.
+        """
+        key = (tuple(command), directory, regexp, single_line_regexp)
+        cmd = self.__queued.get(key)
+        if cmd is None:
+            self.__seq += 1
+            cmd = _ScheduledCommand(self, key, priority, self.__seq)
+            self.__queued[key] = cmd
+            self.__queue.append(cmd)
+        else:
+            self.merged += 1
+            cmd.priority = min(cmd.priority, priority)
+            GPS.Logger("PROMISES").log(
+                "Merged with queued command: %s" % (command, ))
+
+        cmd.block_exit = cmd.block_exit or block_exit
+        cmd.waiters.append((waiter, on_start, on_match, on_exit))
+        self.__start_queued()
+        self.__changed()
+        return cmd
+
+    def cancel(self, cmd, waiter):
+        """
+        Stop forwarding the output of cmd to waiter. The command is removed
+        from the queue, or interrupted, when no one is waiting for it.
+
+        :param _ScheduledCommand cmd: as returned by `schedule`.
+        """
+        cmd.waiters = [w for w in cmd.waiters if w[0] is not waiter]
+        if not cmd.waiters:
+            if cmd.process is not None:
+                cmd.process.interrupt()
+            elif cmd in self.__queue:
+                self.__queue.remove(cmd)
+                del self.__queued[cmd.key]
+                self.__changed()
+
+    def _terminated(self, cmd):
+        """
+        Called when the process for cmd has terminated.
+        """
+        self.running -= 1
+        self.__start_queued()
+        self.__changed()
+
+    def __start_queued(self):
+        """
+        Start as many queued commands as allowed.
+        """
+        max_running = max(1, Max_Processes_Pref.get())
+        while self.__queue:
+            cmd = min(self.__queue, key=lambda c: (c.priority, c.seq))
+            if cmd.priority == PRIORITY_INTERACTIVE:
+                limit = max_running
+            else:
+                limit = max(1, max_running - 1)
+            if self.running >= limit:
+                break
+
+            self.__queue.remove(cmd)
+            del self.__queued[cmd.key]
+            command, directory, regexp, single_line_regexp = cmd.key
+
+            try:
+                cmd.process = GPS.Process(
+                    command=list(command),
+                    directory=directory,
+                    regexp=regexp,
+                    single_line_regexp=single_line_regexp,
+                    block_exit=cmd.block_exit,
+                    on_match=cmd.on_match,
+                    on_exit=cmd.on_exit)
+            except:
+                GPS.Logger("PROMISES").log(
+                    "Failed to spawn %s" % (command, ))
+                for _, _, _, on_exit in cmd.waiters:
+                    on_exit(None, -1, "")
+                continue
+
+            self.running += 1
+            for _, on_start, _, _ in cmd.waiters:
+                on_start(cmd.process)
+
+    def __changed(self):
+        for cb in self.listeners:
+            cb()
+
+
+process_scheduler = ProcessScheduler()
+
+
 class ProcessWrapper(object):
     """
     ProcessWrapper is an advanced process manager
@@ -456,7 +833,7 @@ class ProcessWrapper(object):
     def __init__(self, cmdargs=[], spawn_console=False,
                  directory=None, regexp='.+',
                  single_line_regexp=True, block_exit=True,
-                 give_focus_on_create=False):
+                 give_focus_on_create=False, priority=None):
         """
         Initialize and run a process with no promises,
         no user-defined pattern to match,
@@ -481,6 +858,12 @@ class ProcessWrapper(object):
            exits and this process is still running.
         :param bool give_focus_on_create: set it to True to give the focus
            to the spawned console, if any.
+        :param int priority: if set to PRIORITY_INTERACTIVE or
+           PRIORITY_BACKGROUND, the process is started by the
+           `process_scheduler`, which limits the number of parallel
+           processes. It might then be queued, and share its execution with
+           identical queued commands. This is ignored when spawn_console is
+           set. By default, the process is started immediately.
         """
 
         # __current_promise = about on waiting wish for match something
@@ -489,11 +872,30 @@ class ProcessWrapper(object):
         # the stream that includes all output from the process
         self.__stream = None
 
-        # __current_pattern = regexp that user waiting for in the output
+        # __current_pattern = regexp that user waiting for in the output,
+        # or _NEXT_LINE when waiting for the next line
         self.__current_pattern = None
 
-        # __output = a buffer for current output of self.__process
+        # The maximal width of a match of __current_pattern, or None if
+        # it is unbounded
+        self.__pattern_width = None
+
+        # __output = a buffer for current output of self.__process.
+        # Everything before __pos has already been matched, and the current
+        # pattern was not found before __scanned.
         self.__output = ""
+        self.__pos = 0
+        self.__scanned = 0
+
+        # The maximal number of lines to return when waiting for
+        # _NEXT_LINES, and whether their delay has expired
+        self.__max_lines = 0
+        self.__lines_delay_expired = True
+
+        # Output received since __output was last updated, and the number of
+        # those chunks that do not contain a newline
+        self.__chunks = []
+        self.__chunks_without_newline = 0
 
         # __whether process has finished
         self.finished = False
@@ -510,6 +912,18 @@ class ProcessWrapper(object):
         # Created only if spawn_console is set to True.
         self.__console = None
 
+        # The _ScheduledCommand, when started by the process_scheduler
+        self.__scheduled = None
+
+        if priority is not None and spawn_console is False:
+            self.__process = None   # set when the command is started
+            self.__start_time = time.time()
+            self.__scheduled = process_scheduler.schedule(
+                self, self.__command, directory, regexp,
+                single_line_regexp, block_exit, priority,
+                self.__on_start, self.__on_match, self.__on_exit)
+            return
+
         # Launch the command
         try:
             self.__process = GPS.Process(
@@ -578,18 +992,33 @@ class ProcessWrapper(object):
                 __display_output,
                 oncompleted=__show_console_on_exit)
 
+    def __on_start(self, process):
+        """
+        Called by the process_scheduler when the process is started.
+        """
+        self.__process = process
+        self.__start_time = time.time()
+
     def __on_match(self, process, match, unmatch):
         """
         Called by GPS everytime there's output coming
         """
         if self.__current_promise is not None:
-            self.__output += unmatch
-            self.__output += match
+            self.__add_output(unmatch)
+            self.__add_output(match)
             self.__check_pattern_and_resolve()
         if self.__stream is not None:
             self.__stream.emit(unmatch)
             self.__stream.emit(match)
 
+    def __add_output(self, output):
+        """
+        Add output to the text searched by wait_until_match. It is only
+        concatenated to the existing output when needed.
+        """
+        if output:
+            self.__chunks.append(output)
+
     def __resolve_promise(self, value):
         """
         Resolve the current promise with the given value.
@@ -603,15 +1032,102 @@ class ProcessWrapper(object):
         """
         Check whether the current pattern matches the already known output
         of the tool, and resolve the promise if possible.
+        Only the output that might contain a new match is searched.
         """
-        if self.__current_promise is not None:
-            p = self.__current_pattern.search(self.__output)
+        if self.__current_promise is None:
+            return
+
+        if self.__current_pattern is _NEXT_LINES:
+            self.__check_lines_and_resolve()
+            return
+
+        if (self.__current_pattern is _NEXT_LINE and
+                self.__scanned >= len(self.__output)):
+            # No need to update the output while no newline was received
+            while self.__chunks_without_newline < len(self.__chunks):
+                if '\n' in self.__chunks[self.__chunks_without_newline]:
+                    break
+                self.__chunks_without_newline += 1
+            else:
+                if self.finished:
+                    self.__resolve_promise(None)
+                return
+
+        if self.__chunks:
+            # Drop the part of the output that was already matched
+            self.__output = (
+                self.__output[self.__pos:] + "".join(self.__chunks))
+            self.__scanned = max(0, self.__scanned - self.__pos)
+            self.__pos = 0
+            self.__chunks = []
+            self.__chunks_without_newline = 0
+
+        if self.__current_pattern is _NEXT_LINE:
+            end = self.__output.find('\n', max(self.__pos, self.__scanned))
+            if end >= 0:
+                start = self.__pos
+                self.__pos = self.__scanned = end + 1
+                self.__resolve_promise(self.__output[start:end + 1])
+                return
+            self.__scanned = len(self.__output)
+
+        else:
+            if self.__pos:
+                # Patterns see the output as starting after the last match,
+                # for instance for "^" or "\b"
+                self.__output = self.__output[self.__pos:]
+                self.__scanned = max(0, self.__scanned - self.__pos)
+                self.__pos = 0
+
+            if self.__pattern_width is None:
+                start = self.__pos
+            else:
+                start = max(self.__pos,
+                            self.__scanned - self.__pattern_width + 1)
+            p = self.__current_pattern.search(self.__output, start)
             if p:
-                self.__output = self.__output[p.end(0):]
+                self.__pos = self.__scanned = p.end(0)
                 self.__resolve_promise(p.group(0))
-            elif self.finished:
-                # We will never be able to match anyway
-                self.__resolve_promise(None)
+                return
+            self.__scanned = len(self.__output)
+
+        if self.finished:
+            # We will never be able to match anyway
+            self.__resolve_promise(None)
+
+    def __check_lines_and_resolve(self):
+        """
+        Resolve the current promise with the complete lines already
+        received, as requested by wait_lines.
+        """
+        if self.__chunks:
+            self.__output = (
+                self.__output[self.__pos:] + "".join(self.__chunks))
+            self.__pos = 0
+            self.__chunks = []
+            self.__chunks_without_newline = 0
+
+        if self.finished:
+            end = len(self.__output)   # including an incomplete last line
+        else:
+            end = self.__output.rfind('\n', self.__pos) + 1
+
+        if end > self.__pos:
+            text = self.__output[self.__pos:end]
+            if text.endswith('\n'):
+                text = text[:-1]
+            lines = text.split('\n')
+            if len(lines) >= self.__max_lines:
+                lines = lines[:self.__max_lines]
+            elif not (self.__lines_delay_expired or self.finished):
+                return   # wait for more lines
+
+            self.__pos += sum(len(line) + 1 for line in lines)
+            self.__scanned = self.__pos
+            self.__resolve_promise(lines)
+
+        elif self.finished:
+            self.__resolve_promise(None)
 
     def __on_exit(self, process, status, remaining_output):
         """
@@ -621,7 +1137,7 @@ class ProcessWrapper(object):
         """
         self.finished = True
         if self.__current_promise is not None:
-            self.__output += remaining_output
+            self.__add_output(remaining_output)
             self.__check_pattern_and_resolve()
 
         if self.__stream is not None:
@@ -662,6 +1178,28 @@ class ProcessWrapper(object):
         else:
             self.__current_pattern = pattern
 
+        # A match that ends in new output starts at most this many
+        # characters before it, so that older output need not be searched
+        # again. This does not hold for assertions, which can make a match
+        # fail until the text after it has been received.
+        try:
+            parsed = sre_parse.parse(
+                self.__current_pattern.pattern,
+                self.__current_pattern.flags)
+            width = parsed.getwidth()[1]
+            if width >= sre_constants.MAXREPEAT or _has_assertions(parsed):
+                width = None
+        except Exception:
+            width = None
+
+        self.__pattern_width = width
+        self.__scanned = self.__pos
+        return self.__wait(timeout)
+
+    def __wait(self, timeout=0):
+        """
+        Create the promise resolved when the current pattern matches.
+        """
         p = self.__current_promise = Promise()
 
         # Can we resolve immediately ?
@@ -684,11 +1222,58 @@ class ProcessWrapper(object):
         """
         p = Promise()
 
-        s = self.wait_until_match("^.*\n")
-        if s is None:
+        if self.finished:
             p.resolve(None)   # already finished
         else:
-            s.then(lambda line: p.resolve(line[:-1] if line else None))
+            self.__current_pattern = _NEXT_LINE
+            self.__scanned = self.__pos
+            self.__wait().then(
+                lambda line: p.resolve(line[:-1] if line else None))
+
+        return p
+
+    def wait_lines(self, max_lines=1000, max_ms=0):
+        """
+        Wait until some lines are available, and return all of them at
+        once. This is much faster than calling `wait_line` for each line
+        when the output is large::
+
+            while True:
+                lines = yield p.wait_lines()
+                if lines is None:
+                    break
+                for line in lines:
+                    pass   # do something with the line
+
+        :param int max_lines: the maximal number of lines returned.
+        :param int max_ms: if not null, wait up to this many milliseconds
+           for max_lines lines to be available, rather than returning as
+           soon as there is one line.
+        :return: a promise resolved with a list of lines, which do not
+           include the trailing newline, or None when the process has
+           terminated and all its output was returned.
+        """
+        p = Promise()
+
+        if self.finished and self.__pos >= len(self.__output) \
+                and not self.__chunks:
+            p.resolve(None)   # already finished
+            return p
+
+        self.__current_pattern = _NEXT_LINES
+        self.__max_lines = max_lines
+        self.__lines_delay_expired = max_ms <= 0
+        p = self.__current_promise = Promise()
+
+        self.__check_pattern_and_resolve()
+        if self.__current_promise and not self.__lines_delay_expired:
+            def on_delay():
+                if self.__current_promise is p:
+                    self.__lines_delay_expired = True
+                    self.__check_pattern_and_resolve()
+                return False
+
+            GLib.timeout_add(max_ms, on_delay)
 
         return p
 
@@ -753,21 +1338,26 @@ class ProcessWrapper(object):
 
         class map_to_line:
             def __init__(self):
-                self.buffer = ""
-                self.__re = re.compile('^.*\n')
+                self.buffer = []   # the chunks of the current line
 
             def __call__(self, out_stream, output):
-                self.buffer += output
-                while True:
-                    p = self.__re.search(self.buffer)
-                    if not p:
-                        break
-                    out_stream.emit(p.group(0)[:-1])
-                    self.buffer = self.buffer[p.end(0):]
+                # Only the new output is searched for newlines, and all the
+                # complete lines it contains are split at once.
+                last = output.rfind('\n')
+                if last < 0:
+                    self.buffer.append(output)
+                    return
+
+                self.buffer.append(output[:last])
+                lines = "".join(self.buffer).split('\n')
+                self.buffer = [output[last + 1:]]
+                for line in lines:
+                    out_stream.emit(line)
 
             def oncompleted(self, out_stream, status):
-                if self.buffer:
-                    out_stream.emit(self.buffer)
+                rest = "".join(self.buffer)
+                if rest:
+                    out_stream.emit(rest)
 
         return self.stream.flatMap(map_to_line())
 
@@ -814,6 +1404,15 @@ class ProcessWrapper(object):
 
         # get end timestamp
         end_time = time.time()
+
+        if self.__scheduled is not None:
+            # The process might be shared with other wrappers, or not
+            # started yet, so we stop waiting for it ourselves.
+            if not self.finished:
+                process_scheduler.cancel(self.__scheduled, self)
+                self.__on_exit(self.__process, -1, "")
+            return
+
         # Interrupt the process, if any
         if not self.finished:
             self.__process.interrupt()